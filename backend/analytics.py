@@ -0,0 +1,189 @@
+"""
+Weekly and monthly nutrition history analytics.
+
+Per-day series come from daily_rollups (one indexed range read per period).
+Days that can no longer change are cached per period in `analytics_cache`,
+so a finished week or month is a single point lookup and the current period
+only reads the days not cached yet. A day only counts as finished once it is
+over at every offset (see closed_before), since the same user may log from
+devices in different time zones. Summaries are derived from the cached
+series on every request, so goal changes apply immediately. Saving or
+deleting a meal on a past day drops the cached periods containing that day.
+"""
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from rollups import MACRO_FIELDS, ROLLUPS_COLLECTION, empty_totals
+from timebuckets import MIN_TZ_OFFSET, today_key
+
+ANALYTICS_CACHE_COLLECTION = "analytics_cache"
+PERIODS = ("week", "month")
+
+# A day within +/- this many calories of the target counts as "in balance"
+BALANCE_TOLERANCE = 100
+
+DEFAULT_GOALS = {"calories": 2000, "protein": 100, "carbs": 250, "fats": 65}
+
+# How far back `offset` may reach, in periods (a century)
+MAX_PERIODS_BACK = {"week": 100 * 52, "month": 100 * 12}
+
+
+def valid_offset(period: str, offset: int) -> bool:
+    return -MAX_PERIODS_BACK[period] <= offset <= 0
+
+
+def closed_before() -> date:
+    """Days before this are over in every time zone: today at the westernmost offset"""
+    return date.fromisoformat(today_key(MIN_TZ_OFFSET))
+
+
+def period_bounds(period: str, today: date, offset: int = 0) -> Tuple[date, date]:
+    """First and last day of a week (Monday-based) or calendar month, `offset` periods from today's"""
+    if period == "week":
+        start = today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+        return start, start + timedelta(days=6)
+
+    month_index = today.year * 12 + today.month - 1 + offset
+    start = date(month_index // 12, month_index % 12 + 1, 1)
+    next_month = date((month_index + 1) // 12, (month_index + 1) % 12 + 1, 1)
+    return start, next_month - timedelta(days=1)
+
+
+def _day_entry(day: str, doc: Optional[dict]) -> dict:
+    entry = {"day": day, **empty_totals()}
+    if doc:
+        for field in MACRO_FIELDS:
+            entry[field] = max(0, round(doc.get(field, 0), 2))
+        entry["mealCount"] = max(0, doc.get("mealCount", 0))
+    return entry
+
+
+async def _read_rollups(db, user_id: str, first: date, last: date) -> dict:
+    docs = await db[ROLLUPS_COLLECTION].find(
+        {"userId": user_id, "day": {"$gte": first.isoformat(), "$lte": last.isoformat()}},
+        {"_id": 0, "day": 1, "mealCount": 1, **{field: 1 for field in MACRO_FIELDS}}
+    ).to_list(None)
+    return {doc["day"]: doc for doc in docs}
+
+
+async def period_days(db, user_id: str, period: str, start: date, end: date, today: date) -> List[dict]:
+    """
+    Per-day totals from `start` through min(end, today). Days before
+    closed_before() are served from (and added to) the period cache; later
+    ones are always read fresh.
+    """
+    cache = db[ANALYTICS_CACHE_COLLECTION]
+    key = {"userId": user_id, "period": period, "start": start.isoformat()}
+    last = min(end, today)
+    if last < start:
+        return []
+
+    cached = await cache.find_one(key, {"_id": 0, "days": 1, "throughDay": 1})
+    days = cached["days"] if cached else []
+    through = date.fromisoformat(cached["throughDay"]) if cached else start - timedelta(days=1)
+
+    if through < last:
+        fresh = await _read_rollups(db, user_id, through + timedelta(days=1), last)
+        day = through + timedelta(days=1)
+        while day <= last:
+            days.append(_day_entry(day.isoformat(), fresh.get(day.isoformat())))
+            day += timedelta(days=1)
+
+        # Only finished days are cached; a day still open anywhere can change
+        closed = min(today, closed_before()).isoformat()
+        finished = [d for d in days if d["day"] < closed]
+        if finished and finished[-1]["day"] > through.isoformat():
+            await cache.update_one(
+                key,
+                {"$set": {
+                    "end": end.isoformat(),
+                    "days": finished,
+                    "throughDay": finished[-1]["day"],
+                    "updatedAt": datetime.utcnow()
+                }},
+                upsert=True
+            )
+
+    return days
+
+
+def _summarize(days: List[dict], goals: dict) -> dict:
+    tracked = [d for d in days if d["mealCount"] > 0]
+    totals = {field: round(sum(d[field] for d in tracked), 2) for field in MACRO_FIELDS}
+    averages = {
+        field: round(totals[field] / len(tracked), 1) if tracked else 0
+        for field in MACRO_FIELDS
+    }
+
+    deficit = balance = surplus = 0
+    for d in tracked:
+        diff = d["calories"] - goals["calories"]
+        if diff < -BALANCE_TOLERANCE:
+            deficit += 1
+        elif diff > BALANCE_TOLERANCE:
+            surplus += 1
+        else:
+            balance += 1
+
+    return {
+        "totals": totals,
+        "averages": averages,
+        "adherence": {
+            "daysTracked": len(tracked),
+            "daysInDeficit": deficit,
+            "daysInBalance": balance,
+            "daysInSurplus": surplus,
+            "balancePercentage": round(balance / len(tracked) * 100) if tracked else 0,
+        },
+    }
+
+
+def _weekly_series(days: List[dict]) -> List[dict]:
+    weeks = OrderedDict()
+    for d in days:
+        day = date.fromisoformat(d["day"])
+        week_start = (day - timedelta(days=day.weekday())).isoformat()
+        week = weeks.setdefault(week_start, {"weekStart": week_start, "daysTracked": 0, **{f: 0 for f in MACRO_FIELDS}})
+        if d["mealCount"] > 0:
+            week["daysTracked"] += 1
+            for field in MACRO_FIELDS:
+                week[field] = round(week[field] + d[field], 2)
+    for week in weeks.values():
+        tracked = week["daysTracked"]
+        week["averageCalories"] = round(week["calories"] / tracked) if tracked else 0
+    return list(weeks.values())
+
+
+async def history_analytics(db, user_id: str, period: str, offset: int, today: date, goals: Optional[dict] = None) -> dict:
+    """Per-day and per-week series, averages and goal adherence for one week or month"""
+    start, end = period_bounds(period, today, offset)
+    days = await period_days(db, user_id, period, start, end, today)
+
+    goals = goals or {}
+    daily_goals = {
+        "calories": goals.get("dailyCalories") or DEFAULT_GOALS["calories"],
+        "protein": goals.get("dailyProtein") or DEFAULT_GOALS["protein"],
+        "carbs": goals.get("dailyCarbs") or DEFAULT_GOALS["carbs"],
+        "fats": goals.get("dailyFats") or DEFAULT_GOALS["fats"],
+    }
+
+    return {
+        "period": period,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "isFinal": end < today,
+        "goals": daily_goals,
+        "days": days,
+        "weeks": _weekly_series(days),
+        **_summarize(days, daily_goals),
+    }
+
+
+async def invalidate_day(db, user_id: str, day: str):
+    """Drop cached periods containing a day whose meals changed"""
+    await db[ANALYTICS_CACHE_COLLECTION].delete_many({
+        "userId": user_id,
+        "start": {"$lte": day},
+        "end": {"$gte": day}
+    })
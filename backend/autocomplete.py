@@ -0,0 +1,228 @@
+"""
+Typeahead suggestions for the food search box (/api/autocomplete).
+
+Suggests food (data/foods.json) and ingredient (data/ingredients.json) names
+in the languages the app's lists have (Spanish and English), cheaply enough
+to run on every keystroke; picking a suggestion then runs one full
+/api/search-food.
+
+Names are indexed on folded text (see textnorm.py) in one sorted array that
+holds every name and also the name from each later word on ("pechuga de
+pollo" is found by "pech" and by "poll"), so a prefix query is two bisects
+and a scan of the matching slice. Candidates rank by:
+
+  - popularity: log(1 + how often the name was searched) over the last
+    POPULARITY_WINDOW of `search_queries`, the search_food query log
+  - LANGUAGE_BONUS when the matched name is in the requested language
+  - WHOLE_NAME_BONUS when the query starts the name rather than a later word
+
+then by shorter name. One- and two-character prefixes match large slices, so
+their rankings are computed when the index is built; longer ones are
+memoized. PopularityRefresher rebuilds the index from fresh counts every
+POPULARITY_REFRESH seconds and swaps it in.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from textnorm import STOPWORDS, fold
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / "data"
+LANGUAGES = ("es", "en", "fr", "de", "it", "pt")
+MAX_SUGGESTIONS = 8
+MAX_LIMIT = 20
+QUERY_CACHE_SIZE = 4096
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+SEARCH_QUERIES_COLLECTION = "search_queries"
+SEARCH_QUERY_TTL = timedelta(days=90)
+POPULARITY_WINDOW = timedelta(days=30)
+POPULARITY_REFRESH = 600.0
+POPULAR_QUERIES = 5000
+
+# In the same units as log-popularity: a name in the user's language beats
+# one searched e^1 times more often in another language
+LANGUAGE_BONUS = 1.0
+WHOLE_NAME_BONUS = 0.5
+
+
+class AutocompleteIndex:
+    def __init__(self, entries: Iterable[dict], popularity: Optional[Dict[str, int]] = None):
+        """`entries` are {id, kind, names: {language: name}, icon}; `popularity` maps folded queries to counts"""
+        self.entries = list(entries)
+        self.popularity = dict(popularity or {})
+
+        self._by_name: Dict[str, List[int]] = {}
+        keys = []
+        for entry_index, entry in enumerate(self.entries):
+            for language in LANGUAGES:
+                name = entry["names"].get(language)
+                if not name:
+                    continue
+                words = fold(name).split()
+                self._by_name.setdefault(" ".join(words), []).append(entry_index)
+                for position, word in enumerate(words):
+                    if position and word in STOPWORDS:
+                        continue
+                    keys.append((" ".join(words[position:]), entry_index, language, position == 0))
+        keys.sort()
+        self._keys = [key for key, _, _, _ in keys]
+        self._targets = [(entry_index, language, whole) for _, entry_index, language, whole in keys]
+
+        counts = [0] * len(self.entries)
+        for query, count in self.popularity.items():
+            for entry_index in set(self._by_name.get(query, ())):
+                counts[entry_index] += count
+        self._weights = [math.log1p(count) for count in counts]
+
+        short_prefixes = {key[:n] for key in self._keys for n in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+        self._short = {
+            (prefix, language): self._scan(prefix, language, MAX_LIMIT)
+            for prefix in short_prefixes
+            for language in LANGUAGES
+        }
+        self._ranked = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._rank)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def with_popularity(self, popularity: Dict[str, int]) -> "AutocompleteIndex":
+        return AutocompleteIndex(self.entries, popularity)
+
+    def _rank(self, prefix: str, language: str, limit: int) -> Tuple[Tuple[int, str], ...]:
+        short = self._short.get((prefix, language))
+        if short is not None:
+            return short[:limit]
+        return self._scan(prefix, language, limit)
+
+    def _scan(self, prefix: str, language: str, limit: int) -> Tuple[Tuple[int, str], ...]:
+        best: Dict[int, Tuple[float, str]] = {}
+        position = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + "\uffff", position)
+        for entry_index, name_language, whole in self._targets[position:end]:
+            score = self._weights[entry_index]
+            if name_language == language:
+                score += LANGUAGE_BONUS
+            if whole:
+                score += WHOLE_NAME_BONUS
+            if score > best.get(entry_index, (-1.0, ""))[0]:
+                best[entry_index] = (score, name_language)
+
+        def order(entry_index):
+            score, name_language = best[entry_index]
+            return -score, len(self.entries[entry_index]["names"][name_language]), entry_index
+
+        ranked = heapq.nsmallest(limit, best, key=order)
+        return tuple((entry_index, best[entry_index][1]) for entry_index in ranked)
+
+    def suggest(self, query: str, language: str = "es", limit: int = MAX_SUGGESTIONS) -> List[dict]:
+        prefix = fold(query)
+        if not prefix:
+            return []
+        ranked = self._ranked(prefix, language, max(1, min(limit, MAX_LIMIT)))
+        return [self.present(self.entries[entry_index], language, matched) for entry_index, matched in ranked]
+
+    def present(self, entry: dict, language: str, matched: str) -> dict:
+        names = entry["names"]
+        name = names.get(language) or names["en"]
+        suggestion = {"id": entry["id"], "kind": entry["kind"], "name": name, "icon": entry.get("icon")}
+        if names[matched] != name:
+            # Typed in another language: show what it matched
+            suggestion["matched"] = names[matched]
+        return suggestion
+
+
+def load_entries(data_dir: Path = DATA_DIR) -> List[dict]:
+    """Foods, then ingredients that aren't also foods, one entry per distinct id"""
+    entries: Dict[str, dict] = {}
+    food_paths = [data_dir / "foods.json", *sorted(data_dir.glob("foods_*.json"))]
+    for path in food_paths:
+        with open(path, encoding="utf-8") as f:
+            for item in json.load(f).get("foods", []):
+                entries[f"food:{item['id']}"] = {
+                    "id": item["id"], "kind": "food", "names": item["name"], "icon": item.get("icon")
+                }
+
+    food_names = {fold(entry["names"]["en"]) for entry in entries.values()}
+    with open(data_dir / "ingredients.json", encoding="utf-8") as f:
+        categories = json.load(f)["categories"]
+    for category in categories:
+        icon = category["nameEn"].split(" ", 1)[0]
+        for ingredient in category["ingredients"]:
+            if fold(ingredient["en"]) in food_names:
+                continue
+            names = {language: ingredient[language] for language in LANGUAGES if ingredient.get(language)}
+            entries.setdefault(
+                f"ingredient:{ingredient['id']}",
+                {"id": ingredient["id"], "kind": "ingredient", "names": names, "icon": icon}
+            )
+    return list(entries.values())
+
+
+def load_autocomplete_index(data_dir: Path = DATA_DIR) -> AutocompleteIndex:
+    return AutocompleteIndex(load_entries(data_dir))
+
+
+def query_log_entry(query: str, language: str, source: str) -> dict:
+    """A `search_queries` document for one search_food call"""
+    return {"query": fold(query), "language": language, "source": source, "createdAt": datetime.utcnow()}
+
+
+async def popular_queries(db, window: timedelta = POPULARITY_WINDOW, limit: int = POPULAR_QUERIES) -> Dict[str, int]:
+    pipeline = [
+        {"$match": {"createdAt": {"$gte": datetime.utcnow() - window}}},
+        {"$group": {"_id": "$query", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    counts = {}
+    async for doc in db[SEARCH_QUERIES_COLLECTION].aggregate(pipeline, allowDiskUse=True):
+        counts[doc["_id"]] = doc["count"]
+    return counts
+
+
+class PopularityRefresher:
+    """Keeps `index` re-ranked by the latest query log counts"""
+
+    def __init__(self, db, index: AutocompleteIndex, interval: float = POPULARITY_REFRESH):
+        self.db = db
+        self.index = index
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self):
+        counts = await popular_queries(self.db)
+        # Rebuilding sorts every name; keep it off the event loop
+        self.index = await asyncio.to_thread(self.index.with_popularity, counts)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Couldn't refresh autocomplete popularity: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: autocomplete latency per keystroke.
+
+Types a few food and ingredient names one character at a time in each app
+language and times AutocompleteIndex.suggest() for every prefix, cold (memo
+cleared) and memoized, against the bundled names and against synthetic
+indexes of increasing size built by recombining them. Also reports how long
+a popularity refresh takes to rebuild the index.
+
+    python benchmarks/bench_autocomplete.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from autocomplete import LANGUAGES, AutocompleteIndex, load_entries  # noqa: E402
+from textnorm import fold  # noqa: E402
+
+SIZES = [int(n) for n in os.environ.get("BENCH_AUTOCOMPLETE_SIZES", "10000,50000").split(",")]
+REPEATS = 50
+
+TYPED = [
+    ("pechuga de pollo", "es"), ("chicken", "en"), ("fromage", "fr"), ("kartoffel", "de"),
+    ("pomodoro", "it"), ("feijão", "pt"), ("avocado", "en"), ("xq", "es"),
+]
+
+
+def keystrokes():
+    return [(text[:n], language) for text, language in TYPED for n in range(1, len(text) + 1)]
+
+
+def synthetic_entries(base, count):
+    rng = random.Random(7)
+    entries = []
+    for n in range(count):
+        a, b = rng.sample(base, 2)
+        names = {
+            language: f"{a['names'][language]} {b['names'][language].lower()}"
+            for language in LANGUAGES if language in a["names"] and language in b["names"]
+        }
+        entries.append({**a, "id": f"{a['id']}_{b['id']}_{n}", "names": names})
+    return entries
+
+
+def synthetic_popularity(entries, count):
+    rng = random.Random(11)
+    return {fold(entry["names"]["en"]): rng.randint(1, 500) for entry in rng.sample(entries, count)}
+
+
+def timings(index, cold):
+    latencies = []
+    for prefix, language in keystrokes():
+        for _ in range(REPEATS):
+            if cold:
+                index._ranked.cache_clear()
+            started = time.perf_counter()
+            index.suggest(prefix, language)
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def run(label, entries):
+    started = time.perf_counter()
+    index = AutocompleteIndex(entries, synthetic_popularity(entries, min(len(entries), 500)))
+    print(f"{label:<20} built in {time.perf_counter() - started:.2f}s ({len(index._keys)} keys)")
+    for mode, cold in (("cold", True), ("memoized", False)):
+        p50, p99 = timings(index, cold)
+        print(f"{label:<20} {mode:<9} p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+
+def main():
+    bundled = load_entries()
+    print(f"{len(keystrokes())} keystrokes x {REPEATS}")
+    run(f"bundled ({len(bundled)})", bundled)
+    for size in SIZES:
+        run(f"synthetic ({size + len(bundled)})", bundled + synthetic_entries(bundled, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cache backends under a skewed read-through workload.
+
+Runs the same Zipf-distributed get_or_load() traffic against:
+  - memory: cache.MemoryBackend (per-worker LRU)
+  - redis:  cache.RedisBackend against REDIS_URL, or, when unset, against
+            the in-process Redis-protocol stand-in below
+
+and reports throughput, latency percentiles and the hit rate from Cache.stats().
+The stand-in implements just GET/SET (with PX/EX)/DEL/PING/SELECT/AUTH, enough
+to exercise RedisBackend without a Redis server:
+
+    python benchmarks/bench_cache.py
+    REDIS_URL=redis://localhost:6379/0 python benchmarks/bench_cache.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cache import Cache, MemoryBackend, RedisBackend  # noqa: E402
+
+KEYS = int(os.environ.get("BENCH_KEYS", "5000"))
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "50000"))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "32"))
+VALUE_BYTES = int(os.environ.get("BENCH_VALUE_BYTES", "2048"))
+LOAD_LATENCY = float(os.environ.get("BENCH_LOAD_LATENCY", "0.005"))
+ZIPF_S = 1.1
+
+
+class RespStandIn:
+    """Single-process Redis-protocol server with expiring keys, for local runs"""
+
+    def __init__(self):
+        self.data = {}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _execute(self, args):
+        command = args[0].upper()
+        now = time.monotonic()
+        if command in (b"PING", b"SELECT", b"AUTH"):
+            return b"+OK\r\n" if command != b"PING" else b"+PONG\r\n"
+        if command == b"GET":
+            entry = self.data.get(args[1])
+            if entry is None or entry[1] <= now:
+                self.data.pop(args[1], None)
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+        if command == b"SET":
+            expires = float("inf")
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires = now + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires = now + int(args[3 + options.index(b"EX") + 1])
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command\r\n"
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                writer.write(self._execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def zipf_keys(count):
+    weights = [1 / (rank ** ZIPF_S) for rank in range(1, KEYS + 1)]
+    return random.Random(42).choices(range(KEYS), weights=weights, k=count)
+
+
+async def run(name, backend):
+    cache = Cache(backend, "bench", ttl=300)
+    payload = {"items": ["x" * 32] * (VALUE_BYTES // 40)}
+    keys = zipf_keys(REQUESTS)
+    latencies = []
+
+    async def load():
+        await asyncio.sleep(LOAD_LATENCY)
+        return payload
+
+    async def worker(offset):
+        for i in range(offset, REQUESTS, CONCURRENCY):
+            started = time.perf_counter()
+            await cache.get_or_load(str(keys[i]), load)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    stats = cache.stats()
+    print(
+        f"{name:<8} {REQUESTS / elapsed:>10.0f} req/s   "
+        f"p50 {statistics.median(latencies) * 1000:6.3f} ms   "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.3f} ms   "
+        f"hit rate {stats['hitRate']:.1%}   errors {stats['errors']}"
+    )
+
+
+async def main():
+    print(f"{REQUESTS} lookups over {KEYS} keys (zipf s={ZIPF_S}), {CONCURRENCY} concurrent, {VALUE_BYTES}B values")
+    await run("memory", MemoryBackend())
+
+    redis_url = os.environ.get("REDIS_URL")
+    stand_in = None
+    if not redis_url:
+        stand_in = RespStandIn()
+        redis_url = f"redis://127.0.0.1:{await stand_in.start()}/0"
+    backend = RedisBackend(redis_url)
+    try:
+        await run("redis", backend)
+    finally:
+        await backend.close()
+        if stand_in:
+            await stand_in.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingredient canonicalization throughput.
+
+Builds a workload of free-text ingredient lines the way they arrive from
+pantries and generated recipes: names in the six app languages, plural and
+accent variants, quantities and units ("200g de tomates picados"), typos and
+unknown items, drawn Zipf-style from a pool of distinct lines since the same
+lines keep coming back. Reports lookup_many() throughput cold (memo cleared)
+and memoized (the steady state), how the lines resolved, and the cost of
+resolving each distinct line once.
+
+    python benchmarks/bench_canonical.py
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from canonical import LANGUAGES, load_canonicalizer  # noqa: E402
+
+LINES = int(os.environ.get("BENCH_CANONICAL_LINES", "200000"))
+DISTINCT = int(os.environ.get("BENCH_CANONICAL_DISTINCT", "20000"))
+QUANTITIES = ["", "1 ", "2 ", "200g ", "1 cup ", "2 tbsp ", "1/2 taza de ", "3 cucharadas de ", "1 kg "]
+SUFFIXES = ["", "", "", ", chopped", " picados", " (fresh)", " al gusto"]
+
+
+def typo(text, rng):
+    if len(text) < 5:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1:]
+
+
+def workload(canonicalizer, count, distinct):
+    rng = random.Random(5)
+    names = [name for names in canonicalizer.names.values() for name in names.values()]
+    pool = []
+    for _ in range(distinct):
+        roll = rng.random()
+        name = rng.choice(names)
+        if roll < 0.1:
+            name = typo(name, rng)
+        elif roll < 0.15:
+            name = f"ingrediente raro {rng.randrange(10000)}"
+        elif roll < 0.4:
+            name = name.lower() + "s"
+        pool.append(rng.choice(QUANTITIES) + name + rng.choice(SUFFIXES))
+    return rng.choices(pool, weights=[1 / (rank + 1) for rank in range(len(pool))], k=count)
+
+
+def run(canonicalizer, lines, cold):
+    if cold:
+        canonicalizer._lookup.cache_clear()
+    started = time.perf_counter()
+    matches = canonicalizer.lookup_many(lines)
+    elapsed = time.perf_counter() - started
+    return elapsed, matches
+
+
+def main():
+    started = time.perf_counter()
+    canonicalizer = load_canonicalizer()
+    print(f"loaded {len(canonicalizer)} ingredients ({len(LANGUAGES)} languages) in {time.perf_counter() - started:.2f}s")
+
+    lines = workload(canonicalizer, LINES, DISTINCT)
+    distinct = len(set(lines))
+    print(f"{len(lines)} lines, {distinct} distinct")
+    for mode, cold in (("cold", True), ("memoized", False)):
+        elapsed, matches = run(canonicalizer, lines, cold)
+        print(f"{mode:<9} {len(lines) / elapsed:12,.0f} lines/s   {elapsed / len(lines) * 1e6:6.2f} us/line")
+
+    methods = Counter(match.method for match in matches)
+    print("resolved: " + ", ".join(f"{method} {count / len(lines):.1%}" for method, count in methods.most_common()))
+
+    # Cold cost per distinct line, without repeats
+    unique = list(dict.fromkeys(lines))
+    elapsed, _ = run(canonicalizer, unique, cold=True)
+    print(f"distinct  {len(unique) / elapsed:12,.0f} lines/s   {elapsed / len(unique) * 1e6:6.2f} us/line")
+
+
+if __name__ == "__main__":
+    main()
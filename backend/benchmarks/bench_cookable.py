@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: "what can I cook now" lookups against corpora of increasing size.
+
+Builds synthetic recipe corpora from the bundled canonical ingredient ids
+(ingredient popularity is Zipf-like, as in real recipes: onion and garlic
+everywhere, saffron rarely) and times CookableIndex.top() for random
+pantries of 8-25 ingredients, plus the time to build each index.
+
+    python benchmarks/bench_cookable.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from canonical import load_canonicalizer  # noqa: E402
+from cookable import STAPLES, CookableIndex  # noqa: E402
+
+SIZES = [int(n) for n in os.environ.get("BENCH_COOKABLE_SIZES", "1000,10000,100000").split(",")]
+PANTRIES = 500
+
+
+def synthetic_entries(ids, count, rng):
+    weights = [1 / (rank + 1) for rank in range(len(ids))]
+    staples = sorted(STAPLES)
+    entries = []
+    for n in range(count):
+        picked = set(rng.choices(ids, weights, k=rng.randint(3, 10)))
+        picked.update(rng.sample(staples, rng.randint(0, 2)))
+        entries.append({
+            "recipeId": f"rcp_{n}",
+            "language": "en",
+            "name": f"Recipe {n}",
+            "ingredientIds": sorted(picked),
+            "ingredientCount": len(picked) + rng.choice((0, 0, 0, 1)),
+            "calories": rng.randint(150, 900),
+        })
+    return entries
+
+
+def pantries(ids, rng):
+    weights = [1 / (rank + 1) ** 0.5 for rank in range(len(ids))]
+    return [set(rng.choices(ids, weights, k=rng.randint(8, 25))) for _ in range(PANTRIES)]
+
+
+def main():
+    rng = random.Random(5)
+    ids = sorted(load_canonicalizer().names)
+    rng.shuffle(ids)
+    print(f"{len(ids)} canonical ingredients, {PANTRIES} pantries per size")
+    print(f"{'recipes':>8} {'build':>8} {'top3 p50':>9} {'p99':>8} {'cookable p50':>13} {'avg cookable':>13}")
+
+    for size in SIZES:
+        entries = synthetic_entries(ids, size, rng)
+        started = time.perf_counter()
+        index = CookableIndex(entries)
+        build = time.perf_counter() - started
+
+        top3, cookable, found = [], [], []
+        for pantry in pantries(ids, rng):
+            started = time.perf_counter()
+            index.top(pantry, k=3, language="en", max_calories=700)
+            top3.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            found.append(len(index.top(pantry, k=8, min_coverage=1.0)))
+            cookable.append(time.perf_counter() - started)
+
+        top3.sort()
+        print(
+            f"{size:>8} {build:>7.2f}s {statistics.median(top3) * 1e6:>7.0f}us "
+            f"{top3[int(len(top3) * 0.99)] * 1e6:>6.0f}us {statistics.median(cookable) * 1e6:>11.0f}us "
+            f"{statistics.mean(found):>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recomputing daily targets for a million users.
+
+Compares, over BENCH_USERS synthetic users (1M by default):
+  - scalar:  calculate_daily_needs() once per user, as set_user_goals does
+  - batch:   daily_needs_batch() over all of them at once
+  - chunked: daily_needs_batch() a RECOMPUTE_BATCH_SIZE chunk at a time
+  - updates: target_updates() per chunk, i.e. the job's CPU cost without
+             the database, when every user's targets change
+  - same:    the same when no targets change (only the version is recorded)
+
+and checks that scalar and batch agree for every user. With MONGO_URL set it
+also seeds BENCH_DB_NAME with the users and times recompute_daily_targets()
+end to end (cursor, chunks, bulk_write).
+
+    python benchmarks/bench_daily_needs.py
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_daily_needs.py
+"""
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from daily_needs import (  # noqa: E402
+    ACTIVITY_MULTIPLIERS, GOAL_TARGETS, RECOMPUTE_BATCH_SIZE,
+    calculate_daily_needs, daily_needs_batch, recompute_daily_targets, target_updates
+)
+
+USERS = int(os.environ.get("BENCH_USERS", "1000000"))
+BENCH_DB = os.environ.get("BENCH_DB_NAME", "snapfood_bench")
+KEYS = ("calories", "protein", "carbs", "fats")
+
+
+def synthetic_goals(count):
+    rng = random.Random(13)
+    activities, goals = list(ACTIVITY_MULTIPLIERS), list(GOAL_TARGETS)
+    return [
+        {
+            "age": rng.randint(16, 90),
+            "height": round(rng.uniform(145, 205), 1),
+            "weight": round(rng.uniform(40, 160), 1),
+            "activityLevel": rng.choice(activities),
+            "goal": rng.choice(goals),
+            "gender": rng.choice(("male", "female")),
+        }
+        for _ in range(count)
+    ]
+
+
+def columns(goals):
+    return (
+        [g["age"] for g in goals], [g["height"] for g in goals], [g["weight"] for g in goals],
+        [g["activityLevel"] for g in goals], [g["goal"] for g in goals], [g["gender"] for g in goals],
+    )
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def report(name, elapsed, count):
+    print(f"{name:<8} {elapsed:8.2f}s  {count / elapsed:14,.0f} users/s")
+
+
+async def end_to_end(goals):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[BENCH_DB]
+    try:
+        await client.drop_database(BENCH_DB)
+        for start in range(0, len(goals), RECOMPUTE_BATCH_SIZE):
+            await db.users.insert_many([
+                {"id": f"user-{start + n}", "goals": g}
+                for n, g in enumerate(goals[start:start + RECOMPUTE_BATCH_SIZE])
+            ])
+        started = time.perf_counter()
+        updated = await recompute_daily_targets(db)
+        report("job", time.perf_counter() - started, updated)
+        # A second run finds nothing left to do
+        started = time.perf_counter()
+        again = await recompute_daily_targets(db)
+        print(f"rerun    {time.perf_counter() - started:8.2f}s  {again} users updated")
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+
+def main():
+    goals = synthetic_goals(USERS)
+    arrays = columns(goals)
+    print(f"{USERS:,} users, chunks of {RECOMPUTE_BATCH_SIZE:,}")
+
+    scalar, elapsed = timed(lambda: [
+        calculate_daily_needs(g["age"], g["height"], g["weight"], g["activityLevel"], g["goal"], g["gender"])
+        for g in goals
+    ])
+    report("scalar", elapsed, USERS)
+
+    batch, elapsed = timed(lambda: daily_needs_batch(*arrays))
+    report("batch", elapsed, USERS)
+
+    _, elapsed = timed(lambda: [
+        daily_needs_batch(*columns(goals[start:start + RECOMPUTE_BATCH_SIZE]))
+        for start in range(0, USERS, RECOMPUTE_BATCH_SIZE)
+    ])
+    report("chunked", elapsed, USERS)
+
+    users = [{"_id": n, "goals": g} for n, g in enumerate(goals)]
+    # The job only ever holds one chunk; don't let the million synthetic
+    # users make every garbage collection slower than it would be there
+    gc.freeze()
+    _, elapsed = timed(lambda: [
+        target_updates(users[start:start + RECOMPUTE_BATCH_SIZE])
+        for start in range(0, USERS, RECOMPUTE_BATCH_SIZE)
+    ])
+    report("updates", elapsed, USERS)
+
+    for user, *targets in zip(users, *(batch[key].tolist() for key in KEYS)):
+        user["goals"].update(zip(("dailyCalories", "dailyProtein", "dailyCarbs", "dailyFats"), targets))
+    operations, elapsed = timed(lambda: [
+        target_updates(users[start:start + RECOMPUTE_BATCH_SIZE])
+        for start in range(0, USERS, RECOMPUTE_BATCH_SIZE)
+    ])
+    report("same", elapsed, USERS)
+    assert all(len(chunk) == 1 for chunk in operations)
+
+    mismatches = sum(
+        any(needs[key] != batch[key][n] for key in KEYS) for n, needs in enumerate(scalar)
+    )
+    print(f"scalar vs batch mismatches: {mismatches}")
+
+    if os.environ.get("MONGO_URL"):
+        asyncio.run(end_to_end(goals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: local food search latency.
+
+Times FoodIndex.search() for typical queries (whole names, half-typed
+prefixes, plurals, multi-word, typos, misses) against the bundled dataset and
+against synthetic indexes of increasing size built by recombining its names.
+Reports cold rankings and memoized repeats, and how many queries would be
+answered locally.
+
+    python benchmarks/bench_food_search.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from food_index import LOCAL_CONFIDENCE, FoodIndex, load_food_index  # noqa: E402
+
+SIZES = [int(n) for n in os.environ.get("BENCH_FOOD_SIZES", "1000,10000,50000").split(",")]
+REPEATS = 200
+
+QUERIES = [
+    ("manzana", "es"), ("manz", "es"), ("tomatoes", "en"), ("pollo", "es"),
+    ("pechuga de pollo", "es"), ("cafe con leche", "es"), ("brocoli", "es"),
+    ("hamburgesa", "es"), ("orange juice", "en"), ("pizza", "en"), ("sushi roll", "en"), ("xq", "es"),
+]
+
+
+def synthetic_items(base, count):
+    rng = random.Random(7)
+    items = []
+    for n in range(count):
+        a, b = rng.sample(base, 2)
+        items.append({
+            **a,
+            "id": f"{a['id']}_{b['id']}_{n}",
+            "name": {lang: f"{a['name'][lang]} {b['name'][lang].lower()}" for lang in ("es", "en")},
+        })
+    return items
+
+
+def timings(index, cold):
+    latencies, local = [], 0
+    for query, language in QUERIES:
+        for _ in range(REPEATS):
+            if cold:
+                index._ranked.cache_clear()
+            started = time.perf_counter()
+            _, confidence = index.search(query, language)
+            latencies.append(time.perf_counter() - started)
+        local += confidence >= LOCAL_CONFIDENCE
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)], local
+
+
+def run(label, index):
+    for mode, cold in (("cold", True), ("memoized", False)):
+        p50, p99, local = timings(index, cold)
+        print(
+            f"{label:<18} {mode:<9} p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us   "
+            f"answered locally {local}/{len(QUERIES)}"
+        )
+
+
+def main():
+    bundled = load_food_index()
+    run(f"bundled ({len(bundled)})", bundled)
+    for size in SIZES:
+        started = time.perf_counter()
+        index = FoodIndex(bundled.items + synthetic_items(bundled.items, size), bundled.categories)
+        print(f"  built {len(index)} items in {time.perf_counter() - started:.2f}s")
+        run(f"synthetic ({len(index)})", index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: hot-path query latency versus collection size, before and after
+the core indexes from migrations.py.
+
+Seeds a scratch database (never the app's DB_NAME) with synthetic users and
+meals at increasing sizes and times the lookups server.py makes on every
+request.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_indexes.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from migrations import _core_indexes  # noqa: E402
+
+BENCH_DB = os.environ.get("BENCH_DB_NAME", "snapfood_bench")
+SIZES = [int(n) for n in os.environ.get("BENCH_SIZES", "1000,10000,100000").split(",")]
+MEALS_PER_USER = 50
+REPEATS = 50
+
+
+async def seed(db, meal_count):
+    await db.client.drop_database(BENCH_DB)
+    user_count = max(1, meal_count // MEALS_PER_USER)
+    user_ids = [str(uuid.uuid4()) for _ in range(user_count)]
+    now_ms = int(time.time() * 1000)
+
+    await db.users.insert_many([{"id": uid, "isPremium": False} for uid in user_ids])
+    await db.user_ingredients.insert_many([{"userId": uid, "ingredients": ["egg", "rice"]} for uid in user_ids])
+
+    batch = []
+    for i in range(meal_count):
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "userId": user_ids[i % user_count],
+            "timestamp": now_ms - random.randint(0, 90 * 86400 * 1000),
+            "dishName": "Bench meal",
+            "calories": 500, "protein": 20.0, "carbs": 60.0, "fats": 15.0,
+        })
+        if len(batch) == 5000:
+            await db.meals.insert_many(batch)
+            batch = []
+    if batch:
+        await db.meals.insert_many(batch)
+
+    attempts = [
+        {"user_id": user_ids[i % user_count], "timestamp": datetime.utcnow() - timedelta(hours=i % 72), "type": "food"}
+        for i in range(meal_count // 2)
+    ]
+    if attempts:
+        await db.analysis_attempts.insert_many(attempts)
+
+    meal_ids = [m["id"] for m in await db.meals.find({}, {"id": 1}).limit(REPEATS).to_list(REPEATS)]
+    return user_ids, meal_ids
+
+
+async def time_queries(db, user_ids, meal_ids):
+    today = datetime.utcnow() - timedelta(days=1)
+    queries = {
+        "users.find_one(id)": lambda i: db.users.find_one({"id": user_ids[i % len(user_ids)]}),
+        "meals history page": lambda i: db.meals.find(
+            {"userId": user_ids[i % len(user_ids)]}
+        ).sort([("timestamp", -1), ("id", -1)]).limit(50).to_list(50),
+        "meals.find_one(id)": lambda i: db.meals.find_one({"id": meal_ids[i % len(meal_ids)]}),
+        "analysis_attempts.count": lambda i: db.analysis_attempts.count_documents(
+            {"user_id": user_ids[i % len(user_ids)], "timestamp": {"$gte": today}}
+        ),
+        "user_ingredients.find_one": lambda i: db.user_ingredients.find_one({"userId": user_ids[i % len(user_ids)]}),
+    }
+
+    results = {}
+    for name, query in queries.items():
+        samples = []
+        for i in range(REPEATS):
+            started = time.perf_counter()
+            await query(i)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[BENCH_DB]
+
+    print(f"{'meals':>8}  {'query':<28} {'before ms':>10} {'after ms':>10}")
+    try:
+        for size in SIZES:
+            user_ids, meal_ids = await seed(db, size)
+            before = await time_queries(db, user_ids, meal_ids)
+            await _core_indexes(db)
+            after = await time_queries(db, user_ids, meal_ids)
+            for name in before:
+                print(f"{size:>8}  {name:<28} {before[name]:>10.2f} {after[name]:>10.2f}")
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recipe similarity index at corpus sizes up to 100k recipes.
+
+Builds synthetic recipes (names from dish words and ingredient names in the
+app languages, ingredient lines from the bundled canonical ingredients) and
+reports, per size: build time, the cost of adding a batch of 8 generated
+recipes (what one suggestions call stores), and latencies of search(),
+similar() and duplicate_of(). Also checks that a lightly reworded copy of an
+indexed recipe is caught as its duplicate, and that new recipes aren't.
+
+    python benchmarks/bench_similarity.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from canonical import load_canonicalizer  # noqa: E402
+from recipe_similarity import RecipeSimilarityIndex  # noqa: E402
+
+SIZES = [int(n) for n in os.environ.get("BENCH_SIMILARITY_SIZES", "1000,10000,100000").split(",")]
+QUERIES = 200
+LANGUAGES = ("es", "en")
+
+DISHES = {
+    "es": ["Ensalada", "Sopa", "Guiso", "Tortilla", "Salteado", "Curry", "Tarta", "Crema", "Arroz", "Pasta"],
+    "en": ["Salad", "Soup", "Stew", "Omelette", "Stir-fry", "Curry", "Pie", "Cream", "Rice", "Pasta"],
+}
+LINKS = {"es": "de", "en": "with"}
+QUANTITIES = ["200 g", "2", "1 cup", "3 tbsp", "1", "500 g", "a pinch of"]
+
+
+def synthetic_recipe(names, language, n, rng):
+    picked = rng.sample(names, rng.randint(4, 10))
+    main = picked[0][language]
+    return {
+        "recipeId": f"rcp_{n}",
+        "language": language,
+        "name": f"{rng.choice(DISHES[language])} {LINKS[language]} {main.lower()}",
+        "ingredients": [f"{rng.choice(QUANTITIES)} {name[language].lower()}" for name in picked],
+    }
+
+
+def reworded(recipe, rng):
+    """The same dish as generated again: quantities changed, one line dropped, order shuffled"""
+    lines = [line.split(" ", 1)[-1] for line in recipe["ingredients"]]
+    lines = [f"{rng.choice(QUANTITIES)} {line}" for line in lines[:-1] or lines]
+    rng.shuffle(lines)
+    return {"name": recipe["name"].upper(), "ingredients": lines}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main():
+    rng = random.Random(3)
+    canonicalizer = load_canonicalizer()
+    names = [names for names in canonicalizer.names.values() if all(lang in names for lang in LANGUAGES)]
+    print(f"{len(names)} ingredients with names in {'/'.join(LANGUAGES)}, {QUERIES} queries per size")
+    print(f"{'recipes':>8} {'build':>8} {'add 8':>8} {'search p50/p99':>16} {'similar p50/p99':>17} "
+          f"{'dedup p50':>10} {'dupes caught':>13} {'false dupes':>12}")
+
+    for size in SIZES:
+        recipes = [synthetic_recipe(names, LANGUAGES[n % 2], n, rng) for n in range(size)]
+        started = time.perf_counter()
+        index = RecipeSimilarityIndex(recipes, canonicalizer)
+        build = time.perf_counter() - started
+
+        batch = [synthetic_recipe(names, "es", size + n, rng) for n in range(8)]
+        started = time.perf_counter()
+        index.add(batch)
+        add = time.perf_counter() - started
+
+        sample = rng.sample(recipes, QUERIES)
+        search, similar, dedup, caught, false = [], [], [], 0, 0
+        for recipe in sample:
+            query = " ".join(recipe["name"].split()[::2])
+            started = time.perf_counter()
+            index.search(query, recipe["language"])
+            search.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            index.similar({"id": recipe["recipeId"], **recipe}, recipe["language"])
+            similar.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            duplicate = index.duplicate_of(reworded(recipe, rng), recipe["language"])
+            dedup.append(time.perf_counter() - started)
+            caught += duplicate == recipe["recipeId"]
+
+            fresh = synthetic_recipe(names, recipe["language"], -1, rng)
+            false += index.duplicate_of(fresh, recipe["language"]) is not None
+
+        print(
+            f"{size:>8} {build:>7.1f}s {add * 1e3:>6.1f}ms "
+            f"{'%6.0fus/%6.0fus' % percentiles(search):>16} {'%6.0fus/%6.0fus' % percentiles(similar):>17} "
+            f"{percentiles(dedup)[0]:>8.0f}us {caught / QUERIES:>12.0%} {false / QUERIES:>11.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
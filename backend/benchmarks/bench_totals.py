@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ways of computing a user's daily totals when meals carry photos.
+
+Compares, for one user-day with many photo-heavy meals:
+  - python-sum: fetch whole meal documents and sum in Python (the old code)
+  - pipeline:   rollups.meal_totals() ($match + $group inside MongoDB)
+  - rollup:     rollups.get_day_totals() point lookup
+
+and reports median latency and the BSON bytes returned to the app.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_totals.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import rollups  # noqa: E402
+from migrations import _core_indexes, _daily_rollups, _meal_day_keys  # noqa: E402
+
+BENCH_DB = os.environ.get("BENCH_DB_NAME", "snapfood_bench")
+MEAL_COUNTS = [int(n) for n in os.environ.get("BENCH_MEALS", "10,50,200").split(",")]
+PHOTO_BYTES = int(os.environ.get("BENCH_PHOTO_BYTES", str(1024 * 1024)))
+REPEATS = 20
+DAY = "2026-01-15"
+
+
+async def seed(db, meal_count):
+    await db.client.drop_database(BENCH_DB)
+    user_id = str(uuid.uuid4())
+    photo = "A" * PHOTO_BYTES
+    await db.meals.insert_many([
+        {
+            "id": str(uuid.uuid4()), "userId": user_id, "day": DAY, "tzOffset": 0,
+            "timestamp": 1768478400000 + i * 60000, "photoBase64": photo,
+            "dishName": "Bench meal", "calories": 500, "protein": 20.0, "carbs": 60.0, "fats": 15.0,
+        }
+        for i in range(meal_count)
+    ])
+    await _core_indexes(db)
+    await _meal_day_keys(db)
+    await _daily_rollups(db)
+    return user_id
+
+
+async def python_sum(db, user_id):
+    meals = await db.meals.find({"userId": user_id, "day": DAY}).to_list(None)
+    totals = {f: sum(m.get(f, 0) for m in meals) for f in rollups.MACRO_FIELDS}
+    return totals, meals
+
+
+async def pipeline(db, user_id):
+    rows = await rollups.meal_totals(db, {"userId": user_id, "day": DAY})
+    return rows, rows
+
+
+async def rollup(db, user_id):
+    totals = await rollups.get_day_totals(db, user_id, DAY)
+    return totals, [totals]
+
+
+async def measure(fn, db, user_id):
+    samples, wire_bytes = [], 0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        _, docs = await fn(db, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+        wire_bytes = sum(len(bson.encode(doc)) for doc in docs)
+    return statistics.median(samples), wire_bytes
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[BENCH_DB]
+
+    print(f"{'meals':>6}  {'method':<12} {'median ms':>10} {'bytes':>14}")
+    try:
+        for count in MEAL_COUNTS:
+            user_id = await seed(db, count)
+            for name, fn in (("python-sum", python_sum), ("pipeline", pipeline), ("rollup", rollup)):
+                latency, wire_bytes = await measure(fn, db, user_id)
+                print(f"{count:>6}  {name:<12} {latency:>10.2f} {wire_bytes:>14,}")
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""
+Export the app's bundled food and ingredient lists for the backend.
+
+data/foods.json and data/ingredients.json are generated from the frontend's
+src/data/foods.ts (FOOD_CATEGORIES, COMMON_FOODS) and src/data/ingredients.ts
+(INGREDIENT_CATEGORIES), so the server searches and canonicalizes exactly
+what the app offers. Ingredients gain a stable id, the slug of their English
+name. Edit the .ts sources and regenerate; never edit the JSON by hand:
+
+    python bundled_data.py          # rewrite data/*.json from the frontend
+    python bundled_data.py --check  # exit 1 if they are out of date
+"""
+import json
+import re
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).parent
+DATA_DIR = BACKEND_DIR / "data"
+FRONTEND_DATA_DIR = BACKEND_DIR.parent / "frontend" / "src" / "data"
+
+_TOKEN = re.compile(r"""
+    \s+ | //[^\n]* | /\*.*?\*/                 # skipped
+    | (?P<punct>[{}\[\]:,])
+    | '(?P<single>(?:\\.|[^'\\])*)'
+    | "(?P<double>(?:\\.|[^"\\])*)"
+    | (?P<number>-?\d+(?:\.\d+)?)
+    | (?P<word>[A-Za-z_$][\w$]*)
+""", re.VERBOSE | re.DOTALL)
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+def _tokens(source: str):
+    position = 0
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if not match:
+            raise ValueError(f"Unexpected {source[position:position + 20]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        value = match.group(kind)
+        if kind in ("single", "double"):
+            value = re.sub(r"\\(.)", r"\1", value)
+        yield kind, value
+
+
+def _parse(tokens, token: Tuple[str, str]) -> Any:
+    """One value of a TS object literal (objects, arrays, strings, numbers), from `token` on"""
+    kind, value = token
+    if kind == "punct" and value == "{":
+        result = {}
+        while True:
+            kind, key = next(tokens)
+            if (kind, key) == ("punct", "}"):
+                return result
+            if next(tokens) != ("punct", ":"):
+                raise ValueError(f"Expected ':' after {key!r}")
+            result[key] = _parse(tokens, next(tokens))
+            separator = next(tokens)
+            if separator == ("punct", "}"):
+                return result
+            if separator != ("punct", ","):
+                raise ValueError(f"Expected ',' after {key!r}")
+    if kind == "punct" and value == "[":
+        result = []
+        while True:
+            token = next(tokens)
+            if token == ("punct", "]"):
+                return result
+            result.append(_parse(tokens, token))
+            separator = next(tokens)
+            if separator == ("punct", "]"):
+                return result
+            if separator != ("punct", ","):
+                raise ValueError("Expected ',' in array")
+    if kind in ("single", "double"):
+        return value
+    if kind == "number":
+        return float(value) if "." in value else int(value)
+    if kind == "word" and value in _LITERALS:
+        return _LITERALS[value]
+    raise ValueError(f"Unsupported value {value!r}")
+
+
+def exported_constant(source: str, name: str) -> Any:
+    """The literal value of `export const <name>` in a TypeScript module"""
+    match = re.search(rf"export const {name}\b[^=]*=\s*", source)
+    if not match:
+        raise ValueError(f"export const {name} not found")
+    tokens = _tokens(source[match.end():])
+    return _parse(tokens, next(tokens))
+
+
+def ingredient_id(english_name: str) -> str:
+    ascii_name = unicodedata.normalize("NFKD", english_name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_")
+
+
+def export_foods(source: str) -> Dict[str, Any]:
+    return {
+        "categories": exported_constant(source, "FOOD_CATEGORIES"),
+        "foods": exported_constant(source, "COMMON_FOODS"),
+    }
+
+
+def export_ingredients(source: str) -> Dict[str, Any]:
+    categories: List[dict] = exported_constant(source, "INGREDIENT_CATEGORIES")
+    return {
+        "categories": [
+            {
+                **{key: value for key, value in category.items() if key != "ingredients"},
+                "ingredients": [
+                    {"id": ingredient_id(ingredient["en"]), **ingredient}
+                    for ingredient in category["ingredients"]
+                ],
+            }
+            for category in categories
+        ]
+    }
+
+
+def exported_files(frontend_dir: Path = FRONTEND_DATA_DIR) -> Dict[str, str]:
+    """data/ file name -> its generated content"""
+    exports = {
+        "foods.json": export_foods((frontend_dir / "foods.ts").read_text(encoding="utf-8")),
+        "ingredients.json": export_ingredients((frontend_dir / "ingredients.ts").read_text(encoding="utf-8")),
+    }
+    return {name: json.dumps(data, ensure_ascii=False, indent=2) + "\n" for name, data in exports.items()}
+
+
+def stale_files(data_dir: Path = DATA_DIR, frontend_dir: Path = FRONTEND_DATA_DIR) -> List[str]:
+    """Files in data/ that differ from what the frontend sources generate"""
+    stale = []
+    for name, content in exported_files(frontend_dir).items():
+        path = data_dir / name
+        if not path.exists() or path.read_text(encoding="utf-8") != content:
+            stale.append(name)
+    return stale
+
+
+def main(argv):
+    if "--check" in argv:
+        stale = stale_files()
+        for name in stale:
+            print(f"data/{name} is out of date; run python bundled_data.py")
+        return 1 if stale else 0
+    for name, content in exported_files().items():
+        (DATA_DIR / name).write_text(content, encoding="utf-8")
+        print(f"Wrote data/{name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,446 @@
+"""
+Caching with pluggable backends.
+
+A Cache is a namespaced view over a CacheBackend with its own TTL, value
+serializer and size limit, and hit/miss counters. Two backends exist:
+
+  - MemoryBackend: a per-worker LRU bounded by total bytes. Entries expire
+    individually, so namespaces with different TTLs can share one backend.
+  - RedisBackend: any server speaking the Redis protocol (Redis, Valkey,
+    KeyDB, or a local stand-in such as the one in benchmarks/bench_cache.py),
+    shared by every worker.
+
+The backend is chosen once per process from CACHE_URL ("memory://" when
+unset, or "redis://[:password@]host[:port][/db]"). Backend failures never
+fail a request: they're counted and logged, and the call acts as a miss.
+
+With the memory backend each worker holds its own copy, so Cache.invalidate()
+also publishes the key on the InvalidationBus, a small capped collection every
+worker tails, and other workers evict it too. The TTL bounds staleness if a
+message is ever missed.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import unquote, urlparse
+
+from bson import json_util
+from cachetools import TLRUCache
+from pymongo import CursorType
+
+logger = logging.getLogger(__name__)
+
+INVALIDATIONS_COLLECTION = "cache_invalidations"
+INVALIDATIONS_SIZE_BYTES = 1024 * 1024
+
+KEY_PREFIX = "snapfood"
+MEMORY_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_VALUE_BYTES = 512 * 1024
+REDIS_POOL_SIZE = 8
+REDIS_TIMEOUT = 1.0
+
+
+class CacheBackendError(Exception):
+    pass
+
+
+class CacheBackend:
+    """Byte-string storage with per-key TTLs"""
+
+    # Entries live in this process only, so invalidations must be broadcast
+    local = False
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """Per-worker LRU cache bounded by the total size of stored values"""
+
+    local = True
+
+    def __init__(self, max_bytes: int = MEMORY_MAX_BYTES):
+        self._entries = TLRUCache(
+            maxsize=max_bytes,
+            ttu=lambda _key, entry, now: now + entry[1],
+            timer=time.monotonic,
+            getsizeof=lambda entry: len(entry[0])
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._entries.currsize
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self._entries.maxsize:
+            return
+        self._entries[key] = (value, ttl)
+
+    async def delete(self, key: str):
+        self.discard(key)
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Minimal Redis-protocol (RESP2) client: GET, SET with PX, DEL over a small
+    pool of connections. Only what the caches need, without a client library.
+    """
+
+    def __init__(self, url: str, pool_size: int = REDIS_POOL_SIZE, timeout: float = REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._idle = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                await self._roundtrip(reader, writer, auth)
+            if self.database:
+                await self._roundtrip(reader, writer, ("SELECT", str(self.database)))
+        except Exception:
+            writer.close()
+            raise
+        return reader, writer
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    async def _read_reply(cls, reader):
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheBackendError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise CacheBackendError(payload.decode(errors="replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [await cls._read_reply(reader) for _ in range(count)]
+        raise CacheBackendError(f"Unexpected reply: {line[:40]!r}")
+
+    async def _roundtrip(self, reader, writer, args):
+        writer.write(self._encode(args))
+        await writer.drain()
+        return await self._read_reply(reader)
+
+    async def _command(self, *args):
+        async with self._slots:
+            connection = self._idle.get_nowait() if not self._idle.empty() else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                reply = await asyncio.wait_for(self._roundtrip(*connection, args), self.timeout)
+            except BaseException:
+                # The connection may hold a half-read reply; never reuse it
+                if connection is not None:
+                    connection[1].close()
+                raise
+            self._idle.put_nowait(connection)
+            return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._command("SET", key, value, "PX", str(max(1, int(ttl * 1000))))
+
+    async def delete(self, key: str):
+        await self._command("DEL", key)
+
+    async def close(self):
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+def backend_from_url(url: Optional[str]) -> CacheBackend:
+    if not url or url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("redis://"):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {url}")
+
+
+def backend_from_env() -> CacheBackend:
+    return backend_from_url(os.environ.get("CACHE_URL"))
+
+
+class JsonSerializer:
+    """
+    JSON with MongoDB extended types (datetimes round-trip). Values at least
+    `compress_over` bytes long are zlib-compressed, flagged by a leading byte.
+    """
+
+    def __init__(self, compress_over: Optional[int] = None):
+        self.compress_over = compress_over
+
+    def dumps(self, value: Any) -> bytes:
+        data = json_util.dumps(value, ensure_ascii=False).encode()
+        if self.compress_over is not None and len(data) >= self.compress_over:
+            return b"z" + zlib.compress(data)
+        return b"j" + data
+
+    def loads(self, data: bytes) -> Any:
+        flag, body = data[:1], data[1:]
+        if flag == b"z":
+            body = zlib.decompress(body)
+        elif flag != b"j":
+            raise ValueError("Unknown cache value encoding")
+        return json_util.loads(body)
+
+
+JSON = JsonSerializer()
+COMPRESSED_JSON = JsonSerializer(compress_over=4096)
+
+
+def hash_key(*parts: Any) -> str:
+    """Stable short key for arbitrary JSON-able inputs (queries, ingredient lists, payloads)"""
+    encoded = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+
+class InvalidationBus:
+    """Broadcasts cache evictions between workers through a tailable capped collection"""
+
+    def __init__(self, db):
+        self.collection = db[INVALIDATIONS_COLLECTION]
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+        self._task = None
+
+    def subscribe(self, namespace: str, handler: Callable[[str], None]):
+        self._handlers[namespace] = handler
+
+    async def publish(self, namespace: str, key: str):
+        await self.collection.insert_one({"namespace": namespace, "key": key, "at": datetime.utcnow()})
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # Only messages published after this worker started matter
+        latest = await self.collection.find_one({}, sort=[("$natural", -1)])
+        last_id = latest["_id"] if latest else None
+
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                async for message in cursor:
+                    last_id = message["_id"]
+                    handler = self._handlers.get(message.get("namespace"))
+                    if handler:
+                        handler(message["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}")
+            # A tailable cursor dies when the collection is empty or rolls over; reopen it
+            await asyncio.sleep(1)
+
+
+class Cache:
+    """
+    One namespace of cached values. get_or_load() is read-through: concurrent
+    misses for a key share a single load, and None results aren't cached.
+    Values are stored serialized, so callers always get their own copy.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        ttl: float,
+        serializer: JsonSerializer = JSON,
+        max_value_bytes: int = DEFAULT_MAX_VALUE_BYTES,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.serializer = serializer
+        self.max_value_bytes = max_value_bytes
+        self._bus = bus if backend.local else None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.oversized = 0
+        if self._bus:
+            self._bus.subscribe(namespace, self.evict)
+
+    def _key(self, key: str) -> str:
+        return f"{KEY_PREFIX}:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            data = await self.backend.get(self._key(key))
+            value = self.serializer.loads(data) if data is not None else None
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache read failed for {self.namespace}: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def _store(self, key: str, data: bytes):
+        if len(data) > self.max_value_bytes:
+            self.oversized += 1
+            return
+        try:
+            await self.backend.set(self._key(key), data, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache write failed for {self.namespace}: {e}")
+
+    async def set(self, key: str, value: Any):
+        await self._store(key, self.serializer.dumps(value))
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                data = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request running the load went away; load for this one instead
+                return await self.get_or_load(key, load)
+            return self.serializer.loads(data) if data is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            evictions = self._evictions
+            value = await load()
+            data = self.serializer.dumps(value) if value is not None else None
+            # Don't cache a load that raced with an eviction; it may predate the write
+            if data is not None and evictions == self._evictions:
+                await self._store(key, data)
+            future.set_result(data)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting on it; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def evict(self, key: str):
+        """Drop a key from this worker's memory backend (invalidation bus handler)"""
+        self._evictions += 1
+        if self.backend.local:
+            self.backend.discard(self._key(key))
+
+    async def invalidate(self, key: str):
+        """Remove a key for every worker"""
+        self._evictions += 1
+        try:
+            await self.backend.delete(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache delete failed for {self.namespace}: {e}")
+        if self._bus:
+            await self._bus.publish(self.namespace, key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0,
+            "errors": self.errors,
+            "oversized": self.oversized,
+            "ttl": self.ttl,
+        }
+
+
+class DocumentCache:
+    """Read-through cache of documents keyed by id, e.g. user profiles"""
+
+    def __init__(self, cache: Cache, load: Callable[[str], Awaitable[Optional[dict]]]):
+        self.cache = cache
+        self._load = load
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.cache.get_or_load(key, lambda: self._load(key))
+
+    async def invalidate(self, key: str):
+        await self.cache.invalidate(key)
@@ -0,0 +1,181 @@
+"""
+Canonical ingredient ids for free-text ingredient names.
+
+Pantries, recipe requests and recipe ingredient lists name the same
+ingredient many ways: "tomate", "Tomatoes", "3 tomates picados". This maps
+them to one id from data/ingredients.json (exported from the app's
+frontend/src/data/ingredients.ts), whose Spanish and English names form the
+synonym and translation table. data/ingredient_synonyms.json adds generic
+ingredients the app's list lacks ("chicken", "rice", "salt") in all six app
+languages, and regional aliases ("jitomate", "choclo"). Names with alternatives ("Cilantro /
+Coriander") are indexed under each alternative too.
+
+Text is reduced to ingredient terms (see ingredient_match.py) and resolved,
+in order, by:
+
+  1. exact: the terms are exactly those of some name          confidence 1.0
+  2. contains: the terms include all of some name's terms;     0.7 - 0.9
+     the longest such name wins ("ripe avocados" -> avocado)
+  3. fuzzy: trigram similarity of at least FUZZY_THRESHOLD     0.5 - 0.85
+     with some name, for typos ("zuchini"); skipped when the text is a
+     more general form of existing names, which a typo match would make
+     needlessly specific
+
+Only exact matches name the ingredient itself: "garlic powder" contains
+garlic but isn't garlic. So key(), meant for dedupe and cache keys, is the
+id of an exact match and otherwise the normalized text, whether or not the
+ingredient is known; use lookup() for the best guess at an id. Lookups are
+memoized; lookup_many() is the batch API.
+"""
+import json
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import chain
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from ingredient_match import ingredient_terms
+from textnorm import trigrams
+
+DATA_DIR = Path(__file__).parent / "data"
+LANGUAGES = ("es", "en", "fr", "de", "it", "pt")
+FUZZY_THRESHOLD = 0.6
+LOOKUP_CACHE_SIZE = 65536
+
+
+class CanonicalIngredient(NamedTuple):
+    text: str
+    id: Optional[str]
+    confidence: float
+    method: str  # exact, contains, fuzzy or unknown
+
+    @property
+    def key(self) -> str:
+        """The id when the text names the ingredient exactly, otherwise the normalized text"""
+        if self.method == "exact":
+            return self.id
+        return " ".join(self.text.split()).casefold()
+
+
+class IngredientCanonicalizer:
+    def __init__(self, ingredients: Iterable[dict]):
+        """`ingredients` are {id, <language>: name, ..., aliases: [...]} records"""
+        self.names: Dict[str, Dict[str, str]] = {}
+        self._exact: Dict[FrozenSet[str], str] = {}
+        self._term_sets: List[FrozenSet[str]] = []
+        self._term_ids: List[str] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._spellings: List[str] = []
+        self._spelling_ids: List[str] = []
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+
+        for ingredient in ingredients:
+            ingredient_id = ingredient["id"]
+            names = {language: ingredient[language] for language in LANGUAGES if ingredient.get(language)}
+            if names:
+                self.names.setdefault(ingredient_id, names)
+            for name in [*names.values(), *ingredient.get("aliases", [])]:
+                for variant in dict.fromkeys([name, *name.split("/")]):
+                    self._add_name(ingredient_id, variant)
+
+        self._trigram_counts = [len(trigrams(spelling)) for spelling in self._spellings]
+        self._lookup = lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._resolve)
+
+    def _add_name(self, ingredient_id: str, name: str):
+        terms = ingredient_terms(name)
+        if not terms:
+            return
+        # The first ingredient to claim a name keeps it
+        if terms not in self._exact:
+            self._exact[terms] = ingredient_id
+            for term in terms:
+                self._postings[term].append(len(self._term_sets))
+            self._term_sets.append(terms)
+            self._term_ids.append(ingredient_id)
+
+        spelling = " ".join(sorted(terms))
+        for trigram in trigrams(spelling):
+            self._trigrams[trigram].append(len(self._spellings))
+        self._spellings.append(spelling)
+        self._spelling_ids.append(ingredient_id)
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, text: str) -> CanonicalIngredient:
+        return self._lookup(text)
+
+    def lookup_many(self, texts: Iterable[str]) -> List[CanonicalIngredient]:
+        return [self._lookup(text) for text in texts]
+
+    def key(self, text: str) -> str:
+        return self._lookup(text).key
+
+    def keys(self, texts: Iterable[str]) -> List[str]:
+        """Keys of `texts` without blanks or duplicates, in first-seen order"""
+        return list(dict.fromkeys(key for key in (self.key(text) for text in texts) if key))
+
+    def name(self, ingredient_id: str, language: str = "en") -> Optional[str]:
+        names = self.names.get(ingredient_id)
+        if not names:
+            return None
+        return names.get(language) or names.get("en")
+
+    def _resolve(self, text: str) -> CanonicalIngredient:
+        terms = ingredient_terms(text)
+        if not terms:
+            return CanonicalIngredient(text, None, 0.0, "unknown")
+
+        exact = self._exact.get(terms)
+        if exact:
+            return CanonicalIngredient(text, exact, 1.0, "exact")
+
+        # Names whose terms are all in the text; the most specific one wins
+        shared = Counter(chain.from_iterable(self._postings.get(term, ()) for term in terms))
+        contained = [
+            name_index for name_index, count in shared.items()
+            if count == len(self._term_sets[name_index])
+        ]
+        if contained:
+            best = max(contained, key=lambda name_index: (len(self._term_sets[name_index]), -name_index))
+            coverage = len(self._term_sets[best]) / len(terms)
+            return CanonicalIngredient(text, self._term_ids[best], round(0.7 + 0.2 * coverage, 3), "contains")
+        if any(count == len(terms) for count in shared.values()):
+            # "arroz" when only "arroz integral" and "arroz basmati" are known
+            return CanonicalIngredient(text, None, 0.0, "unknown")
+
+        spelling = " ".join(sorted(terms))
+        query_trigrams = trigrams(spelling)
+        shared = Counter(chain.from_iterable(self._trigrams.get(trigram, ()) for trigram in query_trigrams))
+        # Dice >= FUZZY_THRESHOLD needs at least this many shared trigrams
+        min_shared = FUZZY_THRESHOLD * len(query_trigrams) / 2
+        best_index, best_similarity = None, 0.0
+        for spelling_index, count in shared.items():
+            if count < min_shared:
+                continue
+            similarity = 2 * count / (len(query_trigrams) + self._trigram_counts[spelling_index])
+            if similarity > best_similarity or (similarity == best_similarity and spelling_index < best_index):
+                best_index, best_similarity = spelling_index, similarity
+        if best_index is not None and best_similarity >= FUZZY_THRESHOLD:
+            confidence = round(0.85 * best_similarity, 3)
+            return CanonicalIngredient(text, self._spelling_ids[best_index], confidence, "fuzzy")
+
+        return CanonicalIngredient(text, None, 0.0, "unknown")
+
+
+def load_canonicalizer(data_dir: Path = DATA_DIR) -> IngredientCanonicalizer:
+    """The app's ingredient list, then the supplementary synonyms"""
+    with open(data_dir / "ingredients.json", encoding="utf-8") as f:
+        categories = json.load(f)["categories"]
+    with open(data_dir / "ingredient_synonyms.json", encoding="utf-8") as f:
+        synonyms = json.load(f)["ingredients"]
+    return IngredientCanonicalizer([
+        *(ingredient for category in categories for ingredient in category["ingredients"]),
+        *synonyms
+    ])
+
+
+@lru_cache(maxsize=None)
+def default_canonicalizer() -> IngredientCanonicalizer:
+    """The bundled table, loaded once per process"""
+    return load_canonicalizer()
@@ -0,0 +1,308 @@
+"""
+"What can I cook now": stored recipes ranked by how much of them a pantry covers.
+
+CookableIndex holds the recipes the suggestion flow stored in the corpus
+(see recipe_corpus.py) as sets of canonical ingredient ids (see
+canonical.py), with an inverted index
+from ingredient id to the recipes that use it. A lookup counts, for each
+recipe sharing at least one ingredient with the pantry, how many of its
+ingredients the pantry has by walking only the postings of the pantry's own
+ids. Counting and filtering run over NumPy arrays (one bincount over the
+concatenated postings), and only the recipes that can still make the top k
+get sorted, so a lookup takes well under a millisecond even for a corpus of
+100k recipes.
+
+Coverage is matched ingredients over ingredient lines. Only lines that name
+an ingredient exactly get an id (see coverage_ids()): a pantry with milk
+doesn't cover "almond milk", so lines that merely contain a known name
+count as missing, like lines that didn't resolve at all. STAPLES (salt,
+pepper, water, cooking oil, which the suggestion prompt already assumes
+everyone has) count as present, including lines made only of their words
+("salt and pepper to taste"). A recipe with coverage 1.0 can be cooked with
+what's at hand.
+
+Search results are left out: they answer what someone asked for, often
+with ingredients nobody has, and would crowd out the pantry-based
+suggestions the smart notification is meant to offer.
+
+The index lives in memory: CookableRefresher rebuilds it from the corpus
+periodically and add() takes recipes as they are generated in between,
+including while a rebuild runs.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from canonical import IngredientCanonicalizer, default_canonicalizer
+from ingredient_match import ingredient_terms
+from recipe_corpus import RECIPES_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+STAPLES = frozenset({"salt", "black_pepper", "water", "oil"})
+COOKABLE_REFRESH = 30 * 60  # seconds
+COVERAGE_LEVELS = 1000
+COOKABLE_SOURCE = "suggestions"
+
+
+class CookableRecipe(NamedTuple):
+    recipe_id: str
+    names: Dict[str, str]  # language -> name
+    ingredient_ids: FrozenSet[str]
+    ingredient_count: int
+    staples: int
+    calories: float  # per serving; NaN when unknown
+
+
+class CookableMatch(NamedTuple):
+    recipe: CookableRecipe
+    matched: int
+    coverage: float
+
+    @property
+    def missing(self) -> int:
+        return self.recipe.ingredient_count - self.matched
+
+
+def _calories(value) -> float:
+    # Generated recipes occasionally carry "450 kcal" instead of a number
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class CookableIndex:
+    def __init__(self, entries: Iterable[dict] = ()):
+        """`entries` are {recipeId, language, name, ingredientIds, ingredientCount, calories} dicts"""
+        self._recipes: List[CookableRecipe] = []
+        self._positions: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        # NumPy copies of the postings and per-recipe columns, brought up to date lazily
+        self._posting_arrays: Dict[str, np.ndarray] = {}
+        self._stale_postings = set()
+        self._ingredient_counts = np.zeros(0, dtype=np.int32)
+        self._staples = np.zeros(0, dtype=np.float32)
+        self._inverse_counts = np.zeros(0, dtype=np.float32)
+        self._calories = np.zeros(0, dtype=np.float64)
+        self._languages: Dict[str, np.ndarray] = {}
+        self._stale_languages: List[Tuple[str, int]] = []
+        self.add(entries)
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def add(self, entries: Iterable[dict]):
+        """Index new recipes; entries for a recipe already indexed only add its name in another language"""
+        for entry in entries:
+            position = self._positions.get(entry["recipeId"])
+            if position is not None:
+                self._recipes[position].names.setdefault(entry["language"], entry["name"])
+                self._stale_languages.append((entry["language"], position))
+                continue
+            ids = frozenset(entry.get("ingredientIds") or ())
+            if not ids:
+                continue
+            position = len(self._recipes)
+            self._positions[entry["recipeId"]] = position
+            self._recipes.append(CookableRecipe(
+                entry["recipeId"],
+                {entry["language"]: entry["name"]},
+                ids,
+                max(entry.get("ingredientCount") or 0, len(ids)),
+                len(ids & STAPLES),
+                _calories(entry.get("calories")),
+            ))
+            self._stale_languages.append((entry["language"], position))
+            for ingredient_id in ids - STAPLES:
+                self._postings[ingredient_id].append(position)
+                self._stale_postings.add(ingredient_id)
+
+    def _sync(self):
+        for ingredient_id in self._stale_postings:
+            self._posting_arrays[ingredient_id] = np.array(self._postings[ingredient_id], dtype=np.int32)
+        self._stale_postings.clear()
+        synced = len(self._ingredient_counts)
+        if synced < len(self._recipes):
+            new = self._recipes[synced:]
+            self._ingredient_counts = np.append(
+                self._ingredient_counts, np.array([r.ingredient_count for r in new], dtype=np.int32)
+            )
+            self._staples = np.append(self._staples, np.array([r.staples for r in new], dtype=np.float32))
+            self._inverse_counts = np.append(
+                self._inverse_counts, np.array([1 / r.ingredient_count for r in new], dtype=np.float32)
+            )
+            self._calories = np.append(self._calories, [r.calories for r in new])
+            for language, mask in self._languages.items():
+                self._languages[language] = np.append(mask, np.zeros(len(new), dtype=bool))
+        for language, position in self._stale_languages:
+            if language not in self._languages:
+                self._languages[language] = np.zeros(len(self._recipes), dtype=bool)
+            self._languages[language][position] = True
+        self._stale_languages.clear()
+
+    def _positions_of(self, ingredient_ids: Iterable[str]) -> Optional[np.ndarray]:
+        arrays = [self._posting_arrays[i] for i in ingredient_ids if i in self._posting_arrays]
+        return np.concatenate(arrays) if arrays else None
+
+    def top(
+        self,
+        pantry_ids: Iterable[str],
+        k: int = 3,
+        min_coverage: float = 0.0,
+        language: Optional[str] = None,
+        avoid: Iterable[str] = (),
+        max_calories: Optional[float] = None
+    ) -> List[CookableMatch]:
+        """
+        The k recipes the pantry covers best, most covered first (ties: fewer
+        missing ingredients, then the earlier indexed). With `language`, only
+        recipes with a name in it; recipes using any `avoid` id are left out.
+        """
+        self._sync()
+        shared = self._positions_of(set(pantry_ids) - STAPLES)
+        if shared is None:
+            return []
+
+        # How many of each recipe's ingredients the pantry has, for every recipe at once
+        counts = np.bincount(shared, minlength=len(self._recipes))
+        matched = counts.astype(np.float32)
+        matched += self._staples
+        coverage = matched * self._inverse_counts
+        keep = counts > 0
+        if min_coverage > 0:
+            # float32 rounding must not drop a fully covered recipe below 1.0
+            keep &= coverage >= min_coverage - 1e-6
+        if language is not None:
+            if language not in self._languages:
+                return []
+            keep &= self._languages[language]
+        if max_calories is not None:
+            keep &= ~(self._calories > max_calories)  # unknown (NaN) calories pass
+        avoided = self._positions_of(avoid)
+        if avoided is not None:
+            keep[avoided] = False
+
+        # Only recipes at least as covered as the k-th best can make the top k.
+        # A histogram of coverage rounded to COVERAGE_LEVELS finds that cutoff
+        # in one pass; level 0 is "left out".
+        levels = np.rint(coverage * COVERAGE_LEVELS).astype(np.int16)
+        levels += 1
+        levels *= keep
+        at_least = np.cumsum(np.bincount(levels, minlength=COVERAGE_LEVELS + 2)[:0:-1])
+        reached = np.flatnonzero(at_least >= k)
+        cutoff = COVERAGE_LEVELS + 1 - reached[0] if len(reached) else 1
+        candidates = np.flatnonzero(levels >= cutoff)
+        missing = self._ingredient_counts[candidates] - matched[candidates]
+        order = candidates[np.lexsort((candidates, missing, -coverage[candidates]))][:k]
+        return [
+            CookableMatch(self._recipes[i], int(matched[i]), round(float(coverage[i]), 4)) for i in order
+        ]
+
+
+@lru_cache(maxsize=4)
+def _staple_terms(canonicalizer: IngredientCanonicalizer) -> FrozenSet[str]:
+    names = (name for staple in STAPLES for name in canonicalizer.names.get(staple, {}).values())
+    return frozenset().union(*(ingredient_terms(name) for name in names))
+
+
+def coverage_ids(ingredients: Iterable[str], canonicalizer: Optional[IngredientCanonicalizer] = None) -> List[str]:
+    """Ids of the lines that name an ingredient exactly or consist of staple words only"""
+    canonicalizer = canonicalizer or default_canonicalizer()
+    staple_terms = _staple_terms(canonicalizer)
+    return list(dict.fromkeys(
+        match.id for match in canonicalizer.lookup_many(ingredients)
+        if match.method == "exact" or (match.id in STAPLES and ingredient_terms(match.text) <= staple_terms)
+    ))
+
+
+def _entry(recipe: dict, language: str, canonicalizer: IngredientCanonicalizer) -> dict:
+    ingredients = recipe.get("ingredients") or []
+    return {
+        "recipeId": recipe.get("recipeId") or recipe["id"],
+        "language": language,
+        "name": recipe.get("name", ""),
+        "ingredientIds": coverage_ids(ingredients, canonicalizer),
+        "ingredientCount": len(ingredients),
+        "calories": recipe.get("calories"),
+    }
+
+
+def generated_entries(
+    recipes: List[dict],
+    language: str,
+    canonicalizer: Optional[IngredientCanonicalizer] = None
+) -> List[dict]:
+    """Index entries for recipes that store_recipes() has just given their ids"""
+    canonicalizer = canonicalizer or default_canonicalizer()
+    return [_entry(recipe, language, canonicalizer) for recipe in recipes if recipe.get("id")]
+
+
+async def load_cookable_index(db, canonicalizer: Optional[IngredientCanonicalizer] = None) -> CookableIndex:
+    canonicalizer = canonicalizer or default_canonicalizer()
+    projection = {"_id": 0, "recipeId": 1, "language": 1, "name": 1, "ingredients": 1, "calories": 1}
+    docs = [doc async for doc in db[RECIPES_COLLECTION].find({"source": COOKABLE_SOURCE}, projection)]
+    return await asyncio.to_thread(
+        lambda: CookableIndex(_entry(doc, doc["language"], canonicalizer) for doc in docs)
+    )
+
+
+class CookableRefresher:
+    """Keeps `index` in step with the recipe corpus"""
+
+    def __init__(
+        self,
+        db,
+        index: Optional[CookableIndex] = None,
+        interval: float = COOKABLE_REFRESH,
+        canonicalizer: Optional[IngredientCanonicalizer] = None
+    ):
+        self.db = db
+        self.canonicalizer = canonicalizer
+        self.index = index if index is not None else CookableIndex()
+        self.interval = interval
+        self._task = None
+        # Entries added while a rebuild runs, for the rebuilt index
+        self._added_during_refresh: Optional[List[dict]] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, recipes: List[dict], language: str, source: str):
+        """Index recipes store_recipes() just saved from `source`; only suggestions are kept"""
+        if source == COOKABLE_SOURCE:
+            entries = generated_entries(recipes, language, self.canonicalizer)
+            self.index.add(entries)
+            if self._added_during_refresh is not None:
+                self._added_during_refresh.extend(entries)
+
+    async def refresh(self):
+        # The snapshot may or may not include recipes added meanwhile; adding them again is a no-op
+        self._added_during_refresh = []
+        try:
+            index = await load_cookable_index(self.db, self.canonicalizer)
+            index.add(self._added_during_refresh)
+            self.index = index
+        finally:
+            self._added_during_refresh = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Couldn't rebuild the cookable recipe index: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,216 @@
+"""
+Daily calorie and macro targets, for one user or all of them.
+
+Targets come from the Mifflin-St Jeor BMR, an activity multiplier and a
+per-goal adjustment (GOAL_TARGETS). calculate_daily_needs() is what
+set_user_goals uses; daily_needs_batch() computes the same numbers for
+arrays of users with NumPy, identical to the last integer.
+
+Stored goals carry the FORMULA_VERSION they were computed with. After a
+change to the formula or the tables, bump FORMULA_VERSION, deploy, and run
+the recompute job while the app serves:
+
+    python daily_needs.py
+
+It streams the users whose targets are older by cursor, recomputes them a
+chunk at a time and writes them back with bulk_write, so it can be
+interrupted and run again. Writes only apply to goals still on an older
+version, so targets set_user_goals saves meanwhile aren't overwritten.
+Cached user profiles aren't evicted one by one, which at a million users
+would flood the invalidation bus: they pick up the new targets when their
+TTL runs out, a few minutes later.
+"""
+import asyncio
+import logging
+import os
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+from pymongo import UpdateMany, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+FORMULA_VERSION = 1
+RECOMPUTE_BATCH_SIZE = 10000
+
+# TDEE (Total Daily Energy Expenditure) multipliers
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,       # Little or no exercise
+    "light": 1.375,         # Light exercise 1-3 days/week
+    "moderate": 1.55,       # Moderate exercise 3-5 days/week
+    "active": 1.725,        # Hard exercise 6-7 days/week
+    "very_active": 1.9      # Very hard exercise & physical job
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.2
+
+# goal: (calories over TDEE, protein g per kg, share of calories from carbs, from fats)
+GOAL_TARGETS = {
+    "lose": (-500, 1.2, 0.40, 0.30),     # ~0.5kg/week loss, higher protein to preserve muscle
+    "gain": (300, 1.8, 0.45, 0.25),      # Lean bulk, high protein for muscle building
+    "maintain": (0, 1.0, 0.45, 0.30),
+}
+DEFAULT_GOAL = "maintain"
+
+# Mifflin-St Jeor: 10 * weight + 6.25 * height - 5 * age + this
+BMR_OFFSETS = {"female": -161}
+DEFAULT_BMR_OFFSET = 5  # male or default
+
+GOAL_FIELDS = ("age", "height", "weight", "activityLevel", "goal", "gender")
+# daily_needs_batch() key -> stored goals field
+TARGET_FIELDS = {"calories": "dailyCalories", "protein": "dailyProtein", "carbs": "dailyCarbs", "fats": "dailyFats"}
+
+
+def calculate_daily_needs(age: int, height: float, weight: float, activity_level: str, goal: str, gender: str = "male"):
+    """
+    Calculate daily calorie and protein needs using Mifflin-St Jeor equation.
+    This is one of the most accurate formulas for estimating BMR.
+
+    Note: These are estimates. Users should consult a nutritionist for personalized advice.
+    """
+    bmr = 10 * weight + 6.25 * height - 5 * age + BMR_OFFSETS.get(gender, DEFAULT_BMR_OFFSET)
+    tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, DEFAULT_ACTIVITY_MULTIPLIER)
+
+    calorie_adjustment, protein_per_kg, carbs_share, fats_share = GOAL_TARGETS.get(goal, GOAL_TARGETS[DEFAULT_GOAL])
+    daily_calories = int(tdee + calorie_adjustment)
+    return {
+        "calories": daily_calories,
+        "protein": int(weight * protein_per_kg),
+        "carbs": int((daily_calories * carbs_share) / 4),
+        "fats": int((daily_calories * fats_share) / 9)
+    }
+
+
+def _mapped(values: Sequence, table: dict, default, dtype=np.float64) -> np.ndarray:
+    """table[value] (or default) for each value"""
+    return np.fromiter(map(table.get, values, repeat(default)), dtype=dtype, count=len(values))
+
+
+_SET_FIELDS = (*(f"goals.{field}" for field in TARGET_FIELDS.values()), "goals.formulaVersion")
+_GOAL_ROWS = {goal: row for row, goal in enumerate(GOAL_TARGETS)}
+_GOAL_TABLE = np.array(list(GOAL_TARGETS.values()), dtype=np.float64)
+
+
+def daily_needs_batch(
+    age: Sequence[float],
+    height: Sequence[float],
+    weight: Sequence[float],
+    activity_level: Sequence[str],
+    goal: Sequence[str],
+    gender: Sequence[str]
+) -> Dict[str, np.ndarray]:
+    """calculate_daily_needs() for arrays of users: {"calories": int64 array, "protein", "carbs", "fats"}"""
+    age = np.asarray(age, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + _mapped(gender, BMR_OFFSETS, DEFAULT_BMR_OFFSET)
+    tdee = bmr * _mapped(activity_level, ACTIVITY_MULTIPLIERS, DEFAULT_ACTIVITY_MULTIPLIER)
+
+    targets = _GOAL_TABLE[_mapped(goal, _GOAL_ROWS, _GOAL_ROWS[DEFAULT_GOAL], np.intp)]
+    calorie_adjustment, protein_per_kg, carbs_share, fats_share = targets.T
+    # int() truncates toward zero, and so does np.trunc
+    calories = np.trunc(tdee + calorie_adjustment)
+    return {
+        "calories": calories.astype(np.int64),
+        "protein": np.trunc(weight * protein_per_kg).astype(np.int64),
+        "carbs": np.trunc((calories * carbs_share) / 4).astype(np.int64),
+        "fats": np.trunc((calories * fats_share) / 9).astype(np.int64),
+    }
+
+
+def target_updates(users: List[dict]) -> List[Union[UpdateOne, UpdateMany]]:
+    """
+    bulk_write operations storing recomputed targets for a chunk of user
+    documents: one update per user whose targets change, and one for all
+    the others, which only records the FORMULA_VERSION.
+    """
+    goals = [user["goals"] for user in users]
+    needs = daily_needs_batch(
+        [g["age"] for g in goals],
+        [g["height"] for g in goals],
+        [g["weight"] for g in goals],
+        [g.get("activityLevel") for g in goals],
+        [g.get("goal") for g in goals],
+        [g.get("gender") or "male" for g in goals],
+    )
+    recomputed = np.column_stack([needs[key] for key in TARGET_FIELDS])
+    # Missing targets become NaN, which never compares equal
+    stored = np.array([[g.get(field) for field in TARGET_FIELDS.values()] for g in goals], dtype=np.float64)
+    changed = (recomputed != stored.reshape(recomputed.shape)).any(axis=1)
+
+    # set_user_goals may have stored current targets since the chunk was read
+    outdated = {"goals.formulaVersion": {"$ne": FORMULA_VERSION}}
+    operations = [
+        UpdateOne(
+            {"_id": users[n]["_id"], **outdated},
+            {"$set": dict(zip(_SET_FIELDS, (*targets, FORMULA_VERSION)))}
+        )
+        for n, targets in zip(np.flatnonzero(changed).tolist(), recomputed[changed].tolist())
+    ]
+    unchanged = [users[n]["_id"] for n in np.flatnonzero(~changed).tolist()]
+    if unchanged:
+        operations.append(UpdateMany(
+            {"_id": {"$in": unchanged}, **outdated},
+            {"$set": {"goals.formulaVersion": FORMULA_VERSION}}
+        ))
+    return operations
+
+
+async def recompute_daily_targets(db, batch_size: int = RECOMPUTE_BATCH_SIZE) -> int:
+    """
+    Recompute the stored targets of every user with goals from an older
+    FORMULA_VERSION and return how many users were checked. Each chunk's
+    write overlaps with reading the next one.
+    """
+    query = {
+        "goals.formulaVersion": {"$ne": FORMULA_VERSION},
+        **{f"goals.{field}": {"$type": "number"} for field in ("age", "height", "weight")},
+    }
+    projection = {"_id": 1, **{f"goals.{field}": 1 for field in (*GOAL_FIELDS, *TARGET_FIELDS.values())}}
+    updated = 0
+    pending = None
+    chunk = []
+
+    async def flush(users):
+        nonlocal pending, updated
+        updates = target_updates(users)
+        if pending is not None:
+            await pending
+        pending = asyncio.ensure_future(db.users.bulk_write(updates, ordered=False))
+        updated += len(users)
+
+    async for user in db.users.find(query, projection).batch_size(batch_size):
+        chunk.append(user)
+        if len(chunk) == batch_size:
+            await flush(chunk)
+            chunk = []
+            logger.info(f"Checked daily targets of {updated} users")
+    if chunk:
+        await flush(chunk)
+    if pending is not None:
+        await pending
+    return updated
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        checked = await recompute_daily_targets(db)
+        logger.info(f"Checked daily targets of {checked} users; all are at formula version {FORMULA_VERSION}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main())
@@ -0,0 +1,186 @@
+"""
+Local food nutrition index backing /api/search-food.
+
+The dataset in data/foods.json is exported from the app's bundled
+frontend/src/data/foods.ts (Spanish and English names, per-serving macros).
+More entries can be added as data/foods_*.json files in the same shape, with
+names in any of LANGUAGES; files are merged by item id in name order, so
+later files can also override items.
+
+Every name is indexed three ways, all on folded text (see textnorm.py):
+
+  - whole-name prefix: a sorted array searched with bisect
+  - tokens: stem -> items postings, plus a sorted stem array so the last,
+    possibly half-typed, query word matches by prefix
+  - character trigrams, for typos ("brocoli", "sanwich")
+
+search() returns results with a confidence in [0, 1]. The endpoint answers
+from the index when the confidence reaches LOCAL_CONFIDENCE and only asks
+the LLM otherwise. Rankings of recent queries are memoized, since the same
+few queries make up most searches.
+"""
+import heapq
+import json
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from textnorm import content_stems, fold, trigrams
+
+DATA_DIR = Path(__file__).parent / "data"
+LANGUAGES = ("es", "en", "fr", "de", "it", "pt")
+LOCAL_CONFIDENCE = 0.75
+MAX_RESULTS = 8
+MIN_TRIGRAM_SIMILARITY = 0.4
+QUERY_CACHE_SIZE = 4096
+
+# Names in the other language still match, slightly below the requested one
+OTHER_LANGUAGE_PENALTY = 0.95
+
+SERVINGS = {
+    "es": {"food": "1 porción", "drink": "1 vaso (250ml)"},
+    "en": {"food": "1 portion", "drink": "1 glass (250ml)"},
+}
+DRINK_CATEGORIES = {"drinks"}
+
+
+class FoodIndex:
+    def __init__(self, items: Iterable[dict], categories: Optional[Dict[str, dict]] = None):
+        self.items = list(items)
+        self.categories = dict(categories or {})
+
+        # One entry per (item, language) name
+        self._names: List[Tuple[str, int, str]] = []
+        self._name_stems: List[List[str]] = []
+        postings = defaultdict(set)
+        trigram_postings = defaultdict(list)
+
+        for item_index, item in enumerate(self.items):
+            for language in LANGUAGES:
+                name = item["name"].get(language)
+                if not name:
+                    continue
+                name_index = len(self._names)
+                self._names.append((fold(name), item_index, language))
+                stems = content_stems(name)
+                self._name_stems.append(stems)
+                for s in stems:
+                    postings[s].add(name_index)
+                for trigram in trigrams(name):
+                    trigram_postings[trigram].append(name_index)
+
+        self._prefixes = sorted((folded, name_index) for name_index, (folded, _, _) in enumerate(self._names))
+        self._postings = dict(postings)
+        self._stem_keys = sorted(self._postings)
+        self._trigrams = dict(trigram_postings)
+        self._trigram_counts = [len(trigrams(folded)) for folded, _, _ in self._names]
+        self._ranked = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._rank)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _stem_postings(self, stem: str, prefix: bool) -> set:
+        if not prefix:
+            return self._postings.get(stem, set())
+        matches = set()
+        position = bisect_left(self._stem_keys, stem)
+        while position < len(self._stem_keys) and self._stem_keys[position].startswith(stem):
+            matches |= self._postings[self._stem_keys[position]]
+            position += 1
+        return matches
+
+    def _scores(self, query: str) -> Dict[int, float]:
+        """Best score per name entry"""
+        folded = fold(query)
+        scores: Dict[int, float] = {}
+
+        def offer(name_index, score):
+            if score > scores.get(name_index, 0):
+                scores[name_index] = score
+
+        # Whole name starts with the query
+        position = bisect_left(self._prefixes, (folded,))
+        while position < len(self._prefixes) and self._prefixes[position][0].startswith(folded):
+            name, name_index = self._prefixes[position]
+            offer(name_index, 1.0 if name == folded else 0.9)
+            position += 1
+
+        # Every query word is a word of the name; the last one may be half-typed
+        query_stems = content_stems(query)
+        if query_stems:
+            matched = Counter()
+            for i, s in enumerate(query_stems):
+                for name_index in self._stem_postings(s, prefix=i == len(query_stems) - 1):
+                    matched[name_index] += 1
+            for name_index, count in matched.items():
+                coverage = count / len(query_stems)
+                if coverage == 1:
+                    offer(name_index, 0.8 + 0.1 * len(query_stems) / len(self._name_stems[name_index]))
+                else:
+                    offer(name_index, 0.5 * coverage)
+
+        # Misspellings: trigram (Dice) similarity, only when nothing matched well
+        if max(scores.values(), default=0) < LOCAL_CONFIDENCE:
+            query_trigrams = trigrams(query)
+            shared = Counter()
+            for trigram in query_trigrams:
+                for name_index in self._trigrams.get(trigram, ()):
+                    shared[name_index] += 1
+            for name_index, count in shared.items():
+                similarity = 2 * count / (len(query_trigrams) + self._trigram_counts[name_index])
+                if similarity >= MIN_TRIGRAM_SIMILARITY:
+                    offer(name_index, 0.85 * similarity)
+
+        return scores
+
+    def _rank(self, query: str, language: str, limit: int) -> Tuple[Tuple[int, float], ...]:
+        best: Dict[int, float] = {}
+        for name_index, score in self._scores(query).items():
+            _, item_index, name_language = self._names[name_index]
+            if name_language != language:
+                score *= OTHER_LANGUAGE_PENALTY
+            if score > best.get(item_index, 0):
+                best[item_index] = score
+        return tuple(heapq.nsmallest(limit, best.items(), key=lambda entry: (-entry[1], entry[0])))
+
+    def search(self, query: str, language: str = "es", limit: int = MAX_RESULTS) -> Tuple[List[dict], float]:
+        """Up to `limit` items in the search_food response shape, and the best match's confidence"""
+        ranked = self._ranked(fold(query), language, limit)
+        results = [self.present(self.items[item_index], language) for item_index, _ in ranked]
+        return results, round(ranked[0][1], 3) if ranked else 0.0
+
+    def present(self, item: dict, language: str) -> dict:
+        labels = SERVINGS.get(language, SERVINGS["en"])
+        is_drink = item.get("category") in DRINK_CATEGORIES
+        category = self.categories.get(item.get("category"), {})
+        return {
+            "id": item["id"],
+            "name": item["name"].get(language) or item["name"]["en"],
+            "category": item.get("category"),
+            "description": item.get("description") or category.get(language) or category.get("en", ""),
+            "serving_size": item.get("serving_size") or labels["drink" if is_drink else "food"],
+            "serving_unit": item.get("serving_unit") or ("glass" if is_drink else "unit"),
+            "is_drink": is_drink,
+            "calories": item["calories"],
+            "protein": item["protein"],
+            "carbs": item["carbs"],
+            "fats": item["fats"],
+            "fiber": item.get("fiber", 0),
+            "sugar": item.get("sugar", 0),
+            "icon": item.get("icon", "🍽️"),
+        }
+
+
+def load_food_index(data_dir: Path = DATA_DIR) -> FoodIndex:
+    """data/foods.json plus any data/foods_*.json extensions"""
+    items: Dict[str, dict] = {}
+    categories: Dict[str, dict] = {}
+    for path in [data_dir / "foods.json", *sorted(data_dir.glob("foods_*.json"))]:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        categories.update(data.get("categories", {}))
+        for item in data.get("foods", []):
+            items[item["id"]] = item
+    return FoodIndex(items.values(), categories)
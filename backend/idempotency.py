@@ -0,0 +1,121 @@
+"""
+Idempotency keys for POSTs that mobile clients retry.
+
+A client sends the same `Idempotency-Key` header on every attempt of one
+logical request. The first attempt claims the key in `idempotency_keys` and
+runs the endpoint; its response body is stored for IDEMPOTENCY_TTL and later
+attempts get that body back (marked with an `Idempotent-Replayed` header)
+instead of creating another meal or paying for another LLM call. An attempt
+that arrives while the original is still running waits for it.
+
+Keys are scoped per endpoint and user, and bound to a hash of the request
+body: reusing a key for a different request is a 422. Failed requests are
+not stored, so the client can retry them with the same key. A claim whose
+worker died is taken over once its PENDING_LEASE runs out.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL = timedelta(hours=24)
+PENDING_LEASE = timedelta(minutes=5)
+WAIT_TIMEOUT = 90.0
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(request), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+async def _claim(collection, record_id: str, fingerprint: str):
+    """Returns (claimed, existing record); existing is None if it vanished meanwhile"""
+    now = datetime.utcnow()
+    try:
+        await collection.insert_one({
+            "_id": record_id,
+            "fingerprint": fingerprint,
+            "status": "pending",
+            "createdAt": now,
+            "expireAt": now + PENDING_LEASE
+        })
+        return True, None
+    except DuplicateKeyError:
+        pass
+
+    # The worker running the original died without finishing or releasing it
+    taken = await collection.find_one_and_update(
+        {"_id": record_id, "status": "pending", "fingerprint": fingerprint, "expireAt": {"$lt": now}},
+        {"$set": {"expireAt": now + PENDING_LEASE}}
+    )
+    if taken:
+        return True, None
+    return False, await collection.find_one({"_id": record_id})
+
+
+async def run_idempotent(
+    db,
+    key: Optional[str],
+    scope: str,
+    request: Any,
+    handler: Callable[[], Awaitable[Any]],
+    response: Optional[Response] = None
+):
+    """Run `handler` once per (scope, key); repeats get the stored response body"""
+    if key is None:
+        return await handler()
+    if not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Invalid {IDEMPOTENCY_HEADER} header")
+
+    collection = db[IDEMPOTENCY_COLLECTION]
+    record_id = f"{scope}:{key}"
+    fingerprint = request_fingerprint(request)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    delay = 0.1
+
+    while True:
+        claimed, existing = await _claim(collection, record_id, fingerprint)
+        if claimed:
+            break
+        if existing is None:
+            continue
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        if existing["status"] == "done":
+            if response is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+            return existing["body"]
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+            )
+        await asyncio.sleep(delay)
+        delay = min(1.0, delay * 2)
+
+    try:
+        result = await handler()
+    except BaseException:
+        # Let a retry run the request again; finish releasing even if cancelled
+        await asyncio.shield(collection.delete_one({"_id": record_id, "status": "pending"}))
+        raise
+
+    body = jsonable_encoder(result)
+    await collection.update_one(
+        {"_id": record_id},
+        {"$set": {"status": "done", "body": body, "expireAt": datetime.utcnow() + IDEMPOTENCY_TTL}}
+    )
+    return result
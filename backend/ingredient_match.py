@@ -0,0 +1,134 @@
+"""
+Matching recipe ingredients against a user's pantry.
+
+Recipe ingredients come from the LLM as free text ("2 tbsp extra virgin olive
+oil", "200g de tomates picados"), pantry items as whatever the user typed.
+Both are reduced to a set of terms: folded and stemmed words (see
+textnorm.py) without quantities, units, sizes, preparation words or
+connectives. A recipe ingredient is in the pantry when one term set contains
+the other: "olive oil" covers "2 tbsp olive oil", "tomato" covers "3
+tomatoes, diced", and "oil" no longer matches "boiled egg".
+
+PantryMatcher indexes the pantry once (term -> pantry items) and then checks
+each recipe ingredient with a few dict lookups, instead of comparing every
+recipe ingredient with every pantry item. Given a canonicalizer (see
+canonical.py) it also matches across languages and synonyms: "tomates" in a
+recipe is covered by "tomatoes" in the pantry. Only exact matches count
+there, as for canonical keys: "garlic powder" contains garlic but isn't
+garlic, so garlic in the pantry doesn't cover it and it doesn't cover
+garlic. Ingredients that name a known ingredient are matched by id alone,
+ones that contain a known name need a pantry item with all of their
+terms, and only unknown ones fall back to either set containing the other.
+
+Allergies want the opposite trade-off: anything that may contain the
+allergen should be caught, so a matcher built with exact=False trusts
+every id the canonicalizer finds.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Iterable, List
+
+from textnorm import STOPWORDS, stem, tokenize
+
+MISSING_INGREDIENTS_SHOWN = 5
+
+# Words that describe an amount or a preparation rather than the ingredient
+_NOISE_WORDS = """
+    g gr gram grams gramo gramos kg kilo kilos mg ml cl dl l lt liter litre litro litros
+    oz ounce ounces lb lbs pound pounds libra libras
+    cup cups taza tazas tbsp tbs tablespoon tablespoons cucharada cucharadas
+    tsp teaspoon teaspoons cucharadita cucharaditas pinch pizca dash chorrito
+    can cans lata latas package paquete sobre slice slices rebanada rebanadas loncha lonchas
+    piece pieces pieza piezas trozo trozos unit units unidad unidades handful puñado
+    bunch manojo sprig sprigs ramita ramitas
+    large medium small big grande grandes mediano mediana pequeño pequeña
+    chopped diced minced sliced grated shredded crushed peeled frozen cooked raw
+    boiled roasted toasted melted softened
+    finely roughly thinly optional taste
+    picado picada picados picadas cortado cortada rallado rallada pelado pelada
+    cocido cocida crudo cruda opcional gusto
+"""
+NOISE = frozenset(stem(word) for word in tokenize(_NOISE_WORDS))
+
+
+def ingredient_terms(text: str) -> FrozenSet[str]:
+    """Stemmed content words of an ingredient line, without amounts and preparation"""
+    terms = set()
+    for token in tokenize(text):
+        if token in STOPWORDS or any(ch.isdigit() for ch in token):
+            continue
+        term = stem(token)
+        if term not in NOISE:
+            terms.add(term)
+    return frozenset(terms)
+
+
+class PantryMatcher:
+    def __init__(self, pantry: Iterable[str], canonicalizer=None, exact: bool = True):
+        pantry = list(pantry)
+        self._canonicalizer = canonicalizer
+        self._exact = exact
+        self._ids = set()
+        if canonicalizer is not None:
+            self._ids = {
+                match.id for match in canonicalizer.lookup_many(pantry)
+                if match.id and (match.method == "exact" or not exact)
+            }
+            # "pollo" in the pantry also covers "chicken breast"
+            for ingredient_id in self._ids:
+                pantry.extend(canonicalizer.names.get(ingredient_id, {}).values())
+        self._items: List[FrozenSet[str]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for terms in dict.fromkeys(ingredient_terms(name) for name in pantry):
+            if not terms:
+                continue
+            for term in terms:
+                self._postings[term].append(len(self._items))
+            self._items.append(terms)
+
+    def __len__(self):
+        return len(self._items)
+
+    def has(self, ingredient: str) -> bool:
+        method = "unknown"
+        if self._canonicalizer is not None:
+            match = self._canonicalizer.lookup(ingredient)
+            if match.id in self._ids and (match.method == "exact" or not self._exact):
+                return True
+            if self._exact:
+                method = match.method
+                if method == "exact":
+                    return False
+        terms = ingredient_terms(ingredient)
+        if not terms:
+            return False
+        shared = Counter()
+        for term in terms:
+            for item in self._postings.get(term, ()):
+                shared[item] += 1
+        # The pantry item names all of the ingredient, or the ingredient all of the item.
+        # The latter is how "garlic" would cover "garlic powder", so not for known names.
+        return any(
+            count == len(terms) or (method in ("unknown", "fuzzy") and count == len(self._items[item]))
+            for item, count in shared.items()
+        )
+
+    def match(self, ingredients: List[str]) -> dict:
+        """Pantry coverage of a recipe's ingredient list, in the shape the app shows"""
+        missing = [ingredient for ingredient in ingredients if not self.has(ingredient)]
+        total = len(ingredients)
+        matched = total - len(missing)
+        return {
+            "matchCount": matched,
+            "totalIngredients": total,
+            "matchPercentage": round(matched / total * 100) if total else 0,
+            "missingIngredients": missing[:MISSING_INGREDIENTS_SHOWN],
+        }
+
+
+def rank_recipes(recipes: List[dict], pantry: Iterable[str], canonicalizer=None) -> List[dict]:
+    """Annotate recipes with their pantry match and sort best-covered first"""
+    matcher = PantryMatcher(pantry, canonicalizer)
+    for recipe in recipes:
+        recipe.update(matcher.match(recipe.get("ingredients", [])))
+    recipes.sort(key=lambda recipe: recipe["matchPercentage"], reverse=True)
+    return recipes
@@ -0,0 +1,78 @@
+"""
+Request-scoped data loading.
+
+A RequestLoader fetches the documents an endpoint needs about one user, each
+at most once per request and with only the fields endpoints read. Loads start
+as soon as they're requested, so independent reads issued up front run
+concurrently instead of as sequential round trips:
+
+    async with RequestLoader(db, user_id) as loader:
+        loader.prefetch("user", "ingredients")
+        user = await loader.user()
+        ...
+        ingredients = await loader.ingredients()   # already in flight
+
+Leaving the block (or calling close()) cancels loads nobody awaited.
+"""
+import asyncio
+from typing import Optional
+
+import rollups
+from timebuckets import normalize_tz_offset
+
+USER_FIELDS = {"_id": 0, "id": 1, "goals": 1, "isPremium": 1, "tzOffsetMinutes": 1}
+INGREDIENTS_FIELDS = {"_id": 0, "ingredients": 1}
+
+
+class RequestLoader:
+    def __init__(self, db, user_id: str, user_profiles=None):
+        self.db = db
+        self.user_id = user_id
+        # Optional cache.DocumentCache of user documents, read through instead of the DB
+        self.user_profiles = user_profiles
+        self._loads = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for load in self._loads.values():
+            if not load.done():
+                load.cancel()
+            elif not load.cancelled():
+                # Mark failures of loads nobody awaited as retrieved
+                load.exception()
+
+    def _load(self, key, fetch):
+        if key not in self._loads:
+            self._loads[key] = asyncio.ensure_future(fetch())
+        return self._loads[key]
+
+    def prefetch(self, *names: str):
+        """Start loads by method name without waiting for them"""
+        for name in names:
+            getattr(self, name)()
+
+    def user(self) -> "asyncio.Future[Optional[dict]]":
+        if self.user_profiles is not None:
+            return self._load("user", lambda: self.user_profiles.get(self.user_id))
+        return self._load("user", lambda: self.db.users.find_one({"id": self.user_id}, USER_FIELDS))
+
+    def ingredients(self) -> "asyncio.Future[list]":
+        async def fetch():
+            doc = await self.db.user_ingredients.find_one({"userId": self.user_id}, INGREDIENTS_FIELDS)
+            return doc.get("ingredients", []) if doc else []
+        return self._load("ingredients", fetch)
+
+    def day_totals(self, day: str) -> "asyncio.Future[dict]":
+        return self._load(("day_totals", day), lambda: rollups.get_day_totals(self.db, self.user_id, day))
+
+    async def tz_offset(self, explicit: Optional[int] = None) -> int:
+        """The offset sent with the request, else the one last seen for the user, else UTC"""
+        if explicit is not None:
+            return normalize_tz_offset(explicit)
+        user = await self.user()
+        return normalize_tz_offset((user or {}).get("tzOffsetMinutes"))
@@ -0,0 +1,32 @@
+"""
+Opaque cursors over a position in a user's meals.
+
+Meal history pages are ordered by (timestamp, id) and delta sync by
+(updatedAt, mealId); both hand the client the last position seen as an
+URL-safe base64 JSON pair. Cursors come back from clients, so decoding
+checks the types before anything reaches a query.
+"""
+import base64
+import json
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_meal_cursor(timestamp: int, meal_id: str) -> str:
+    """Opaque, URL-safe cursor pointing just past (timestamp, id) in history order"""
+    raw = json.dumps([timestamp, meal_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_meal_cursor(cursor: str) -> Tuple[int, str]:
+    """(timestamp, id) from encode_meal_cursor(); 400 for anything else"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, meal_id = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # bool is an int subclass; anything else (operators, strings) must never reach a query
+    if not isinstance(timestamp, int) or isinstance(timestamp, bool) or not isinstance(meal_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return timestamp, meal_id
@@ -0,0 +1,105 @@
+"""
+Meal documents and the requests that create them.
+
+build_meal() turns a validated save request into the stored Meal: the
+timestamp in epoch ms with its local day key (see timebuckets.py) and whole
+calories, since the app sends them as floats. batch_meals() does the same
+for the items of a batch save one by one, so an item that can't become a
+meal is reported on its own instead of failing the batch.
+"""
+import uuid
+from typing import List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from timebuckets import local_day, normalize_timestamp_ms, normalize_tz_offset, now_ms
+
+MAX_CLIENT_MEAL_ID_LENGTH = 128
+
+
+class Meal(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str
+    timestamp: Optional[int] = None  # Unix timestamp from frontend (ms)
+    tzOffset: int = 0  # User's UTC offset in minutes east when the meal was logged
+    day: Optional[str] = None  # Local day key (YYYY-MM-DD) for "today" lookups
+    updatedAt: Optional[int] = None  # Last write (ms); the sync change log stamps when it logs the write
+    photoId: Optional[str] = None  # SHA-256 of the photo in the photo store
+    dishName: str
+    ingredients: List[str]
+    calories: int
+    protein: float
+    carbs: float
+    fats: float
+    portionSize: str
+    warnings: List[str]
+
+
+class SaveMealRequest(BaseModel):
+    userId: str
+    photoBase64: str
+    dishName: str
+    ingredients: List[str]
+    calories: float  # Changed to float for flexibility
+    protein: float
+    carbs: float
+    fats: float
+    portionSize: Optional[str] = "medium"  # Made optional with default
+    portions: Optional[float] = 1.0  # Added portions field
+    warnings: Optional[List[str]] = []  # Made optional with default
+    timestamp: Optional[int] = None  # Unix timestamp from frontend (ms)
+    tzOffset: Optional[int] = None  # Minutes east of UTC (-Date.getTimezoneOffset())
+
+
+class SaveMealsBatchItem(SaveMealRequest):
+    # Client-generated meal id, so replaying an offline queue can't save a meal twice
+    id: Optional[str] = Field(None, min_length=1, max_length=MAX_CLIENT_MEAL_ID_LENGTH)
+
+
+class BatchMeal(NamedTuple):
+    index: int  # position in the batch
+    meal: Meal  # photoId still unset
+    photo_base64: str
+
+
+def build_meal(request: SaveMealRequest, meal_timestamp: int, tz_offset: int, photo_id: Optional[str], meal_id: Optional[str] = None) -> Meal:
+    meal = Meal(
+        userId=request.userId,
+        timestamp=meal_timestamp,
+        tzOffset=tz_offset,
+        day=local_day(meal_timestamp, tz_offset),
+        photoId=photo_id,
+        dishName=request.dishName,
+        ingredients=request.ingredients,
+        calories=round(request.calories),
+        protein=request.protein,
+        carbs=request.carbs,
+        fats=request.fats,
+        portionSize=request.portionSize,
+        warnings=request.warnings,
+        updatedAt=now_ms()
+    )
+    if meal_id:
+        meal.id = meal_id
+    return meal
+
+
+def batch_meals(user_id: str, items: List[dict], tz_offset: int) -> Tuple[List[Optional[dict]], List[BatchMeal]]:
+    """
+    Meals for the items of a batch save, and a result list in item order
+    with the "invalid" ones filled in. `tz_offset` is for items without
+    their own.
+    """
+    results: List[Optional[dict]] = [None] * len(items)
+    meals = []
+    for index, item in enumerate(items):
+        try:
+            request = SaveMealsBatchItem(**{**item, "userId": user_id})
+            offset = normalize_tz_offset(request.tzOffset) if request.tzOffset is not None else tz_offset
+            meal = build_meal(request, normalize_timestamp_ms(request.timestamp), offset, None, request.id)
+        except (ValueError, OverflowError) as e:
+            # pydantic's ValidationError is a ValueError too
+            results[index] = {"index": index, "status": "invalid", "error": str(e)}
+            continue
+        meals.append(BatchMeal(index, meal, request.photoBase64))
+    return results, meals
@@ -0,0 +1,425 @@
+"""
+Schema migrations and index bootstrap.
+
+Each migration has an integer version and is recorded in the
+`schema_migrations` collection once it has run, so applying migrations is
+idempotent and cheap when nothing is pending. Several workers may start at
+once, so the one applying migrations holds a lease (a document in the same
+collection, renewed while it works) and the others wait for it to finish.
+Migrations must still be safe to re-run (index creation is): a worker that
+dies halfway loses its lease and the next one starts that migration over.
+Pending migrations are applied when the server starts, or from the CLI:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending versions
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from analytics import ANALYTICS_CACHE_COLLECTION
+from autocomplete import SEARCH_QUERIES_COLLECTION, SEARCH_QUERY_TTL
+from cache import INVALIDATIONS_COLLECTION, INVALIDATIONS_SIZE_BYTES
+from idempotency import IDEMPOTENCY_COLLECTION
+from pantry import PANTRY_COLLECTION, normalize_ingredients, pantry_entries
+from recipe_corpus import RECIPES_COLLECTION, TEXT_INDEX_WEIGHTS, TEXT_LANGUAGE_FIELD
+from rollups import ROLLUPS_COLLECTION, rebuild_rollups
+from sync import CHANGES_COLLECTION
+from timebuckets import local_day, normalize_timestamp_ms
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+PROGRESS_INTERVAL_SECONDS = 5
+LEASE_ID = "lease"
+LEASE_SECONDS = 60
+LEASE_POLL_SECONDS = 2
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[..., Awaitable[None]]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration. Versions must be unique and are applied in order."""
+    def register(fn):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+async def _report_index_build_progress(db, collection: str):
+    """Log server-side progress of running index builds on a collection until cancelled"""
+    namespace = f"{db.name}.{collection}"
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+        try:
+            ops = await db.client.admin.aggregate([
+                {"$currentOp": {}},
+                {"$match": {"ns": namespace, "command.createIndexes": {"$exists": True}}}
+            ]).to_list(None)
+        except Exception as e:
+            # $currentOp needs extra privileges on managed clusters
+            logger.debug(f"Can't read index build progress: {e}")
+            return
+        for op in ops:
+            progress = op.get("progress") or {}
+            if progress.get("total"):
+                percent = 100 * progress.get("done", 0) / progress["total"]
+                logger.info(f"  {namespace}: {op.get('msg', 'building index')} ({percent:.0f}%)")
+            else:
+                logger.info(f"  {namespace}: {op.get('msg', 'building index')}")
+
+
+async def ensure_indexes(db, indexes: Dict[str, List[IndexModel]]):
+    """Create indexes that don't exist yet, logging build progress per collection"""
+    total = sum(len(models) for models in indexes.values())
+    built = 0
+    for collection, models in indexes.items():
+        names = ", ".join(m.document["name"] for m in models)
+        logger.info(f"Ensuring indexes on {collection}: {names}")
+        started = time.monotonic()
+        reporter = asyncio.create_task(_report_index_build_progress(db, collection))
+        try:
+            await db[collection].create_indexes(models)
+        finally:
+            reporter.cancel()
+        built += len(models)
+        logger.info(f"Indexes on {collection} ready in {time.monotonic() - started:.1f}s ({built}/{total})")
+
+
+async def _drop_duplicates(db, collection: str, field: str, merge_array: Optional[str] = None) -> int:
+    """
+    Keep one document per value of `field`, the first inserted (the one
+    find_one and update_one have been hitting), so a unique index on it can
+    be built. With `merge_array`, the kept document gains the array items
+    only its duplicates had. Returns how many documents were removed.
+    """
+    removed = 0
+    groups = db[collection].aggregate([
+        {"$match": {field: {"$exists": True}}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": f"${field}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in groups:
+        keep, *duplicates = group["ids"]
+        if merge_array:
+            items = await db[collection].distinct(merge_array, {"_id": {"$in": duplicates}})
+            if items:
+                await db[collection].update_one({"_id": keep}, {"$addToSet": {merge_array: {"$each": items}}})
+        result = await db[collection].delete_many({"_id": {"$in": duplicates}})
+        removed += result.deleted_count
+    if removed:
+        logger.warning(f"Removed {removed} duplicate {collection} documents by {field}")
+    return removed
+
+
+@migration(1, "Core lookup indexes")
+async def _core_indexes(db):
+    # Racing find-then-insert writes could create these twice; unique indexes won't build over them
+    await _drop_duplicates(db, "users", "id")
+    await _drop_duplicates(db, "user_ingredients", "userId", merge_array="ingredients")
+    await ensure_indexes(db, {
+        "users": [
+            IndexModel([("id", ASCENDING)], unique=True),
+        ],
+        "meals": [
+            IndexModel([("id", ASCENDING)], unique=True),
+            # Meal history pages and "today" range queries
+            IndexModel([("userId", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+        ],
+        "analysis_attempts": [
+            IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        ],
+        "user_ingredients": [
+            IndexModel([("userId", ASCENDING)], unique=True),
+        ],
+    })
+
+
+@migration(2, "Daily nutrition rollups")
+async def _daily_rollups(db):
+    await ensure_indexes(db, {
+        ROLLUPS_COLLECTION: [
+            IndexModel([("userId", ASCENDING), ("day", ASCENDING)], unique=True),
+        ],
+    })
+    # Filled by migration 3, once meals have their local day keys
+
+
+@migration(3, "Epoch-ms meal timestamps with local day keys")
+async def _meal_day_keys(db, batch_size: int = 1000):
+    # Meals saved before per-user offsets were tracked are bucketed in UTC
+    operations = []
+    async for meal in db.meals.find(
+        {"day": {"$exists": False}},
+        {"_id": 1, "timestamp": 1, "tzOffset": 1}
+    ).batch_size(batch_size):
+        timestamp = normalize_timestamp_ms(meal.get("timestamp"))
+        tz_offset = meal.get("tzOffset") or 0
+        operations.append(UpdateOne(
+            {"_id": meal["_id"]},
+            {"$set": {"timestamp": timestamp, "tzOffset": tz_offset, "day": local_day(timestamp, tz_offset)}}
+        ))
+        if len(operations) == batch_size:
+            await db.meals.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.meals.bulk_write(operations, ordered=False)
+
+    await ensure_indexes(db, {
+        "meals": [
+            IndexModel([("userId", ASCENDING), ("day", ASCENDING)]),
+        ],
+    })
+    # The one full rebuild: rollups were keyed by server-local days until now
+    await rebuild_rollups(db)
+
+
+@migration(4, "History analytics cache")
+async def _analytics_cache(db):
+    await ensure_indexes(db, {
+        ANALYTICS_CACHE_COLLECTION: [
+            IndexModel([("userId", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)], unique=True),
+        ],
+    })
+
+
+@migration(5, "Meal change log for delta sync")
+async def _meal_change_log(db, batch_size: int = 1000):
+    await ensure_indexes(db, {
+        CHANGES_COLLECTION: [
+            IndexModel([("userId", ASCENDING), ("mealId", ASCENDING)], unique=True),
+            IndexModel([("userId", ASCENDING), ("updatedAt", ASCENDING), ("mealId", ASCENDING)]),
+            # Tombstones (delete rows) carry expireAt; upsert rows never expire
+            IndexModel([("expireAt", ASCENDING)], expireAfterSeconds=0),
+        ],
+    })
+
+    # Existing meals count as last written when they were logged
+    meal_updates, change_upserts = [], []
+
+    async def flush():
+        if meal_updates:
+            await db.meals.bulk_write(meal_updates, ordered=False)
+            await db[CHANGES_COLLECTION].bulk_write(change_upserts, ordered=False)
+            meal_updates.clear()
+            change_upserts.clear()
+
+    async for meal in db.meals.find(
+        {"updatedAt": {"$exists": False}},
+        {"_id": 1, "id": 1, "userId": 1, "timestamp": 1}
+    ).batch_size(batch_size):
+        updated_at = normalize_timestamp_ms(meal.get("timestamp"))
+        meal_updates.append(UpdateOne({"_id": meal["_id"]}, {"$set": {"updatedAt": updated_at}}))
+        change_upserts.append(UpdateOne(
+            {"userId": meal["userId"], "mealId": meal["id"]},
+            {"$setOnInsert": {"op": "upsert", "updatedAt": updated_at}},
+            upsert=True
+        ))
+        if len(meal_updates) == batch_size:
+            await flush()
+    await flush()
+
+
+@migration(6, "Capped collection for cross-worker cache invalidation")
+async def _cache_invalidations(db):
+    if INVALIDATIONS_COLLECTION not in await db.list_collection_names():
+        try:
+            await db.create_collection(INVALIDATIONS_COLLECTION, capped=True, size=INVALIDATIONS_SIZE_BYTES)
+        except CollectionInvalid:
+            return  # Created since the check, by whoever also seeds it
+        # Tailable cursors on an empty capped collection die immediately
+        await db[INVALIDATIONS_COLLECTION].insert_one({"namespace": None, "key": None})
+
+
+@migration(7, "Normalize and deduplicate pantry ingredients")
+async def _normalize_pantries(db, batch_size: int = 1000):
+    updates = []
+    async for doc in db[PANTRY_COLLECTION].find({}, {"_id": 1, "ingredients": 1}).batch_size(batch_size):
+        current = doc.get("ingredients") or []
+        normalized = normalize_ingredients(current)
+        if normalized != current:
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"ingredients": normalized}}))
+        if len(updates) == batch_size:
+            await db[PANTRY_COLLECTION].bulk_write(updates, ordered=False)
+            updates.clear()
+    if updates:
+        await db[PANTRY_COLLECTION].bulk_write(updates, ordered=False)
+
+
+@migration(8, "Idempotency key expiry")
+async def _idempotency_keys(db):
+    await ensure_indexes(db, {
+        IDEMPOTENCY_COLLECTION: [IndexModel([("expireAt", ASCENDING)], expireAfterSeconds=0)],
+    })
+
+
+@migration(9, "Search query log expiry")
+async def _search_queries(db):
+    await ensure_indexes(db, {
+        SEARCH_QUERIES_COLLECTION: [
+            IndexModel([("createdAt", ASCENDING)], expireAfterSeconds=int(SEARCH_QUERY_TTL.total_seconds()))
+        ],
+    })
+
+
+@migration(10, "Canonical pantry ingredient keys")
+async def _canonical_pantry_keys(db, batch_size: int = 1000):
+    updates = []
+    async for doc in db[PANTRY_COLLECTION].find({}, {"_id": 1, "ingredients": 1}).batch_size(batch_size):
+        entries = pantry_entries(doc.get("ingredients") or [])
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+            "ingredients": [name for name, _ in entries],
+            "ingredientKeys": [key for _, key in entries],
+        }}))
+        if len(updates) == batch_size:
+            await db[PANTRY_COLLECTION].bulk_write(updates, ordered=False)
+            updates.clear()
+    if updates:
+        await db[PANTRY_COLLECTION].bulk_write(updates, ordered=False)
+
+
+@migration(11, "Recipe corpus indexes")
+async def _recipe_corpus(db):
+    await ensure_indexes(db, {
+        RECIPES_COLLECTION: [
+            IndexModel(
+                [("language", ASCENDING), *((field, "text") for field in TEXT_INDEX_WEIGHTS)],
+                weights=TEXT_INDEX_WEIGHTS,
+                default_language="none",
+                language_override=TEXT_LANGUAGE_FIELD,
+                name="recipes_text"
+            ),
+            IndexModel([("queries", ASCENDING), ("language", ASCENDING)]),
+            IndexModel([("ingredientIds", ASCENDING), ("language", ASCENDING)]),
+            IndexModel([("recipeId", ASCENDING)]),
+        ],
+    })
+
+
+async def applied_versions(db) -> Dict[int, dict]:
+    docs = await db[MIGRATIONS_COLLECTION].find({"_id": {"$ne": LEASE_ID}}).to_list(None)
+    return {doc["_id"]: doc for doc in docs}
+
+
+async def _take_lease(db, owner: str) -> bool:
+    """Take or renew the migration lease; False while another live worker holds it"""
+    now = datetime.utcnow()
+    try:
+        # When someone else holds it the filter misses, and the upsert hits the unique _id
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": LEASE_ID, "$or": [{"owner": owner}, {"expiresAt": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def _keep_lease(db, owner: str):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        if not await _take_lease(db, owner):
+            logger.error("Lost the migration lease; another worker may be migrating too")
+
+
+async def apply_migrations(db) -> List[int]:
+    """Apply pending migrations in version order and return the versions applied"""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    while True:
+        applied = await applied_versions(db)
+        if all(m.version in applied for m in MIGRATIONS):
+            logger.info("Schema is up to date")
+            return []
+        if await _take_lease(db, owner):
+            break
+        logger.info("Another worker is applying migrations; waiting for it")
+        await asyncio.sleep(LEASE_POLL_SECONDS)
+
+    keeper = asyncio.create_task(_keep_lease(db, owner))
+    try:
+        return await _apply_pending(db)
+    finally:
+        keeper.cancel()
+        try:
+            await keeper
+        except asyncio.CancelledError:
+            pass
+        await db[MIGRATIONS_COLLECTION].delete_one({"_id": LEASE_ID, "owner": owner})
+
+
+async def _apply_pending(db) -> List[int]:
+    # Read again under the lease: the previous holder may have just finished
+    applied = await applied_versions(db)
+    newly_applied = []
+
+    for m in MIGRATIONS:
+        if m.version in applied:
+            continue
+        logger.info(f"Applying migration {m.version}: {m.description}")
+        started = time.monotonic()
+        await m.apply(db)
+        duration_ms = int((time.monotonic() - started) * 1000)
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": m.version},
+            {"$set": {
+                "description": m.description,
+                "appliedAt": datetime.utcnow(),
+                "durationMs": duration_ms
+            }},
+            upsert=True
+        )
+        newly_applied.append(m.version)
+        logger.info(f"Migration {m.version} applied in {duration_ms}ms")
+
+    if not newly_applied:
+        logger.info("Schema is up to date")
+    return newly_applied
+
+
+async def _main(argv):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if "--status" in argv:
+            applied = await applied_versions(db)
+            for m in MIGRATIONS:
+                state = f"applied {applied[m.version]['appliedAt']:%Y-%m-%d %H:%M}" if m.version in applied else "pending"
+                print(f"{m.version:>4}  {state:<24}  {m.description}")
+        else:
+            await apply_migrations(db)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+"""
+A user's ingredient pantry (`user_ingredients`).
+
+Ingredients are stored as normalized names (trimmed, single-spaced,
+casefolded) in the order they were first added, next to a parallel
+`ingredientKeys` array holding each one's canonical key (see canonical.py).
+Duplicates are detected by key, so "Tomato ", "tomate" and "tomatoes" are
+the same item and removing any of them removes it, while "garlic powder"
+stays apart from "garlic".
+
+Every write is a single find_one_and_update with an update pipeline that
+reads the keys already stored, so concurrent edits from several devices
+can't drop each other's items or add the same one twice, and the updated
+pantry comes back in the same round trip.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from canonical import IngredientCanonicalizer, default_canonicalizer
+
+PANTRY_COLLECTION = "user_ingredients"
+PANTRY_FIELDS = {"_id": 0, "ingredients": 1, "lastUpdated": 1}
+
+_STORED_KEYS = {"$ifNull": ["$ingredientKeys", []]}
+
+
+def normalize_ingredient(name: str) -> str:
+    return " ".join(str(name).split()).casefold()
+
+
+def normalize_ingredients(names: Iterable[str]) -> List[str]:
+    """Normalized keys without blanks or duplicates, in first-seen order"""
+    keys = (normalize_ingredient(name) for name in names)
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def pantry_entries(
+    names: Iterable[str],
+    canonicalizer: Optional[IngredientCanonicalizer] = None
+) -> List[Tuple[str, str]]:
+    """(normalized name, canonical key) pairs, first of each key kept, in order"""
+    canonicalizer = canonicalizer or default_canonicalizer()
+    entries = {}
+    for name in normalize_ingredients(names):
+        entries.setdefault(canonicalizer.key(name), name)
+    return [(name, key) for key, name in entries.items()]
+
+
+async def _update(db, user_id: str, pipeline: List[dict]) -> dict:
+    pipeline.append({"$set": {"lastUpdated": datetime.utcnow()}})
+    doc = await db[PANTRY_COLLECTION].find_one_and_update(
+        {"userId": user_id},
+        pipeline,
+        projection=PANTRY_FIELDS,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return {"ingredients": doc.get("ingredients", []), "lastUpdated": doc.get("lastUpdated")}
+
+
+async def add_ingredients(db, user_id: str, names: Iterable[str]) -> dict:
+    """Append ingredients not already in the pantry"""
+    entries = [{"name": name, "key": key} for name, key in pantry_entries(names)]
+    # $literal: user text starting with "$" must not be read as a field path
+    new = {"$filter": {
+        "input": {"$literal": entries},
+        "cond": {"$not": [{"$in": ["$$this.key", _STORED_KEYS]}]}
+    }}
+    return await _update(db, user_id, [{"$set": {
+        "ingredients": {"$concatArrays": [
+            {"$ifNull": ["$ingredients", []]},
+            {"$map": {"input": new, "in": "$$this.name"}}
+        ]},
+        "ingredientKeys": {"$concatArrays": [_STORED_KEYS, {"$map": {"input": new, "in": "$$this.key"}}]},
+    }}])
+
+
+async def replace_ingredients(db, user_id: str, names: Iterable[str]) -> dict:
+    entries = pantry_entries(names)
+    return await _update(db, user_id, [{"$set": {
+        "ingredients": {"$literal": [name for name, _ in entries]},
+        "ingredientKeys": {"$literal": [key for _, key in entries]},
+    }}])
+
+
+async def remove_ingredients(db, user_id: str, names: Iterable[str]) -> dict:
+    keys = [key for _, key in pantry_entries(names)]
+    kept = {"$filter": {
+        "input": {"$range": [0, {"$size": _STORED_KEYS}]},
+        "cond": {"$not": [{"$in": [{"$arrayElemAt": [_STORED_KEYS, "$$this"]}, {"$literal": keys}]}]}
+    }}
+    return await _update(db, user_id, [
+        {"$set": {"_kept": kept}},
+        {"$set": {
+            "ingredients": {"$map": {"input": "$_kept", "in": {"$arrayElemAt": ["$ingredients", "$$this"]}}},
+            "ingredientKeys": {"$map": {"input": "$_kept", "in": {"$arrayElemAt": ["$ingredientKeys", "$$this"]}}},
+        }},
+        {"$unset": "_kept"},
+    ])
@@ -0,0 +1,243 @@
+"""
+Content-addressed storage for meal photos.
+
+Photos live in a GridFS bucket keyed by the SHA-256 of their bytes, so the same
+image uploaded twice is stored once and meal documents only carry the hash
+(`photoId`). JPEG thumbnails at THUMBNAIL_SIZES are stored in the same bucket
+under `<photoId>@<size>`; they are rendered in a worker pool when a photo is
+first stored, or lazily on first request. Run this module directly to move
+legacy inline `photoBase64` fields out of the meals collection:
+
+    python photo_store.py
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+from gridfs.errors import FileExists, NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+import sync
+from timebuckets import now_ms
+
+logger = logging.getLogger(__name__)
+
+PHOTO_BUCKET = "photos"
+DEFAULT_CONTENT_TYPE = "image/jpeg"
+
+# Longest-edge pixel sizes of the stored thumbnails; history cards use the smallest
+THUMBNAIL_SIZES = (160, 480)
+DEFAULT_THUMBNAIL_SIZE = THUMBNAIL_SIZES[0]
+
+# Pillow releases the GIL while decoding and resampling, so threads are enough
+_thumbnail_executor = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1),
+    thread_name_prefix="thumbnails"
+)
+
+
+def decode_photo(photo_base64: str) -> Tuple[bytes, str]:
+    """Decode a (possibly data-URI prefixed) base64 photo into bytes and a content type"""
+    content_type = None
+    if photo_base64.startswith("data:"):
+        header, _, photo_base64 = photo_base64.partition(",")
+        content_type = header[5:].split(";", 1)[0] or None
+
+    data = base64.b64decode(photo_base64)
+
+    if not content_type:
+        if data.startswith(b"\x89PNG"):
+            content_type = "image/png"
+        elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            content_type = "image/webp"
+        else:
+            content_type = DEFAULT_CONTENT_TYPE
+
+    return data, content_type
+
+
+def render_thumbnail(data: bytes, size: int) -> bytes:
+    """Downscale an image so its longest edge is at most `size` pixels, as JPEG"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+
+def thumbnail_id(photo_id: str, size: int) -> str:
+    return f"{photo_id}@{size}"
+
+
+def photo_url(photo_id: str, size: Optional[int] = None) -> str:
+    """Public URL for a stored photo, or for one of its thumbnails"""
+    if size:
+        return f"/api/photos/{photo_id}?size={size}"
+    return f"/api/photos/{photo_id}"
+
+
+class PhotoStore:
+    """GridFS-backed photo store with SHA-256 content dedup"""
+
+    def __init__(self, db, bucket_name: str = PHOTO_BUCKET):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+        self._background_tasks = set()
+
+    async def exists(self, file_id: str) -> bool:
+        return await self.files.find_one({"_id": file_id}, {"_id": 1}) is not None
+
+    async def _store(self, file_id: str, data: bytes, content_type: str):
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                file_id,
+                file_id,
+                data,
+                metadata={"contentType": content_type, "size": len(data)}
+            )
+        except FileExists:
+            # Another request stored the same content concurrently
+            pass
+
+    async def put(
+        self,
+        data: bytes,
+        content_type: str = DEFAULT_CONTENT_TYPE,
+        wait_for_thumbnails: bool = False
+    ) -> str:
+        """
+        Store photo bytes and return their content hash. Re-uploads are no-ops.
+        Thumbnails for new photos are rendered in the background unless
+        wait_for_thumbnails is set.
+        """
+        photo_id = hashlib.sha256(data).hexdigest()
+        if await self.exists(photo_id):
+            return photo_id
+
+        await self._store(photo_id, data, content_type)
+
+        if wait_for_thumbnails:
+            await self.ensure_thumbnails(photo_id, data)
+        else:
+            task = asyncio.create_task(self.ensure_thumbnails(photo_id, data))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+        return photo_id
+
+    async def put_base64(self, photo_base64: str, wait_for_thumbnails: bool = False) -> Optional[str]:
+        """Decode and store a base64 photo as sent by the app. Empty input stores nothing."""
+        if not photo_base64:
+            return None
+        data, content_type = decode_photo(photo_base64)
+        return await self.put(data, content_type, wait_for_thumbnails)
+
+    async def get(self, file_id: str) -> Optional[Tuple[bytes, str]]:
+        """Return (bytes, content_type) for a stored file, or None if it doesn't exist"""
+        try:
+            grid_out = await self.bucket.open_download_stream(file_id)
+        except NoFile:
+            return None
+
+        data = await grid_out.read()
+        metadata = grid_out.metadata or {}
+        return data, metadata.get("contentType", DEFAULT_CONTENT_TYPE)
+
+    async def _render_and_store(self, photo_id: str, data: bytes, size: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        thumbnail = await loop.run_in_executor(_thumbnail_executor, render_thumbnail, data, size)
+        await self._store(thumbnail_id(photo_id, size), thumbnail, "image/jpeg")
+        return thumbnail
+
+    async def ensure_thumbnails(self, photo_id: str, data: Optional[bytes] = None, sizes=THUMBNAIL_SIZES):
+        """Render and store any missing thumbnails for a photo"""
+        try:
+            missing = [size for size in sizes if not await self.exists(thumbnail_id(photo_id, size))]
+            if not missing:
+                return
+            if data is None:
+                original = await self.get(photo_id)
+                if original is None:
+                    return
+                data = original[0]
+            for size in missing:
+                await self._render_and_store(photo_id, data, size)
+        except Exception as e:
+            logger.error(f"Failed to generate thumbnails for photo {photo_id}: {e}")
+
+    async def get_thumbnail(self, photo_id: str, size: int) -> Optional[Tuple[bytes, str]]:
+        """Return a thumbnail, rendering it on first request if needed"""
+        thumbnail = await self.get(thumbnail_id(photo_id, size))
+        if thumbnail is not None:
+            return thumbnail
+
+        original = await self.get(photo_id)
+        if original is None:
+            return None
+        return await self._render_and_store(photo_id, original[0], size), "image/jpeg"
+
+
+async def migrate_meal_photos(db, store: PhotoStore, batch_size: int = 100) -> int:
+    """
+    Move inline photoBase64 fields from meal documents into the photo store.
+    Safe to re-run: only meals that still carry photoBase64 are touched.
+    Each moved meal is logged as changed, so delta sync hands clients its
+    new photoId.
+    """
+    cursor = db.meals.find(
+        {"photoBase64": {"$exists": True}},
+        {"_id": 1, "id": 1, "userId": 1, "photoBase64": 1}
+    ).batch_size(batch_size)
+
+    migrated = 0
+    async for meal in cursor:
+        try:
+            photo_id = await store.put_base64(meal["photoBase64"], wait_for_thumbnails=True)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Skipping meal {meal['_id']}: undecodable photo ({e})")
+            continue
+
+        await db.meals.update_one(
+            {"_id": meal["_id"]},
+            {"$set": {"photoId": photo_id, "updatedAt": now_ms()}, "$unset": {"photoBase64": ""}}
+        )
+        if meal.get("id") and meal.get("userId"):
+            await sync.record_upserts(db, [meal])
+        migrated += 1
+        if migrated % 500 == 0:
+            logger.info(f"Migrated {migrated} meal photos so far")
+
+    logger.info(f"Migrated {migrated} meal photos to the photo store")
+    return migrated
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await migrate_meal_photos(db, PhotoStore(db))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main())
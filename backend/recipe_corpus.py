@@ -0,0 +1,168 @@
+"""
+Persistent corpus of generated recipes (`recipes`).
+
+Recipes from search_recipes and get_recipe_suggestions used to be dropped
+after the response. They are now stored, one document per language variant:
+
+    {_id: "<recipeId>:<language>", recipeId, language, name, description,
+     ingredients, instructions, cookingTime, servings, calories, protein,
+     carbs, fats, healthierOption, countryOfOrigin, cuisine,
+     ingredientIds, queries, source, createdAt, lastSeenAt}
+
+recipeId is stable: a hash of the folded name and canonical ingredient ids
+(see canonical.py) of the recipe in the language it was generated in, so
+generating the same dish again updates the existing document instead of
+adding another. Given a duplicate_of lookup (see recipe_similarity.py),
+store_recipes() also catches the same dish generated with different amounts
+or wording. Translations share their original's recipeId. ingredientIds
+holds the canonical ids of the ingredients that resolved to one.
+
+A text index over name, cuisine, ingredients and description (stemmed in
+each document's own language, and prefixed by language, which every search
+filters on) and a multikey index on ingredientIds back search() and
+ingredient lookups. search() serves the recipes first generated
+for the same query, then text matches that contain every word of the query.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from cache import hash_key
+from canonical import IngredientCanonicalizer, default_canonicalizer
+from textnorm import content_stems, fold
+
+logger = logging.getLogger(__name__)
+
+RECIPES_COLLECTION = "recipes"
+RECIPES_PER_SEARCH = 8
+MAX_TEXT_CANDIDATES = 50
+
+RECIPE_FIELDS = (
+    "name", "description", "ingredients", "instructions", "cookingTime", "servings",
+    "calories", "protein", "carbs", "fats", "healthierOption", "countryOfOrigin", "cuisine",
+)
+TEXT_INDEX_WEIGHTS = {"name": 10, "cuisine": 4, "ingredients": 2, "description": 1}
+# MongoDB text search stems these; anything else is indexed unstemmed
+TEXT_LANGUAGES = {"es", "en", "fr", "de", "it", "pt"}
+TEXT_LANGUAGE_FIELD = "textLanguage"
+
+
+def text_language(language: str) -> str:
+    return language if language in TEXT_LANGUAGES else "none"
+
+
+def ingredient_ids(ingredients: Iterable[str], canonicalizer: Optional[IngredientCanonicalizer] = None) -> List[str]:
+    canonicalizer = canonicalizer or default_canonicalizer()
+    return list(dict.fromkeys(match.id for match in canonicalizer.lookup_many(ingredients) if match.id))
+
+
+def recipe_id(recipe: dict, canonicalizer: Optional[IngredientCanonicalizer] = None) -> str:
+    ids = ingredient_ids(recipe.get("ingredients", []), canonicalizer)
+    return "rcp_" + hash_key(fold(recipe.get("name", "")), sorted(ids))[:20]
+
+
+def _variant_update(
+    recipe: dict,
+    rid: str,
+    language: str,
+    source: str,
+    query: Optional[str],
+    canonicalizer: IngredientCanonicalizer,
+    now: datetime
+) -> UpdateOne:
+    doc = {field: recipe.get(field) for field in RECIPE_FIELDS if recipe.get(field) is not None}
+    doc.update({
+        "recipeId": rid,
+        "language": language,
+        TEXT_LANGUAGE_FIELD: text_language(language),
+        "ingredientIds": ingredient_ids(recipe.get("ingredients", []), canonicalizer),
+        "source": source,
+        "createdAt": now,
+    })
+    update = {"$setOnInsert": doc, "$set": {"lastSeenAt": now}}
+    if query:
+        update["$addToSet"] = {"queries": fold(query)}
+    return UpdateOne({"_id": f"{rid}:{language}"}, update, upsert=True)
+
+
+async def store_recipes(
+    db,
+    recipes: List[dict],
+    language: str,
+    source: str,
+    query: Optional[str] = None,
+    translations: Optional[Dict[str, List[dict]]] = None,
+    canonicalizer: Optional[IngredientCanonicalizer] = None,
+    duplicate_of: Optional[Callable[[dict, str], Optional[str]]] = None
+) -> List[dict]:
+    """
+    Store generated recipes (and their translations, in the same order) and
+    set each one's "id" to its stable recipeId, or to that of the stored
+    recipe `duplicate_of` says it repeats. The first version of a variant is
+    kept; later ones only record the query and lastSeenAt.
+    Storing is best effort: the recipes are returned either way.
+    """
+    canonicalizer = canonicalizer or default_canonicalizer()
+    now = datetime.utcnow()
+    updates = []
+    for position, recipe in enumerate(recipes):
+        rid = (duplicate_of and duplicate_of(recipe, language)) or recipe_id(recipe, canonicalizer)
+        recipe["id"] = rid
+        updates.append(_variant_update(recipe, rid, language, source, query, canonicalizer, now))
+        for translated_language, translated in (translations or {}).items():
+            if position < len(translated):
+                translated[position]["id"] = rid
+                updates.append(_variant_update(
+                    translated[position], rid, translated_language, source, None, canonicalizer, now
+                ))
+    try:
+        if updates:
+            await db[RECIPES_COLLECTION].bulk_write(updates, ordered=False)
+    except Exception as e:
+        logger.warning(f"Couldn't store {len(recipes)} {source} recipes: {e}")
+    return recipes
+
+
+def as_recipe(doc: dict) -> dict:
+    recipe = {field: doc[field] for field in RECIPE_FIELDS if field in doc}
+    recipe["id"] = doc["recipeId"]
+    return recipe
+
+
+def _covers(doc: dict, query_stems: List[str]) -> bool:
+    text = " ".join([doc.get("name", ""), doc.get("cuisine") or "", *doc.get("ingredients", [])])
+    return set(query_stems) <= set(content_stems(text))
+
+
+async def search(db, query: str, language: str, limit: int = RECIPES_PER_SEARCH) -> List[dict]:
+    """Stored recipes for a search query in one language, best first"""
+    collection = db[RECIPES_COLLECTION]
+    projection = {field: 1 for field in (*RECIPE_FIELDS, "recipeId")}
+    found: Dict[str, dict] = {}
+
+    async for doc in collection.find({"queries": fold(query), "language": language}, projection).limit(limit):
+        found[doc["recipeId"]] = doc
+
+    query_stems = content_stems(query)
+    if len(found) < limit and query_stems:
+        cursor = collection.find(
+            {"$text": {"$search": query, "$language": text_language(language)}, "language": language},
+            {**projection, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(MAX_TEXT_CANDIDATES)
+        async for doc in cursor:
+            if doc["recipeId"] not in found and _covers(doc, query_stems):
+                found[doc["recipeId"]] = doc
+                if len(found) >= limit:
+                    break
+
+    return [as_recipe(doc) for doc in found.values()]
+
+
+async def get_recipes(db, recipe_ids: List[str], language: str) -> List[dict]:
+    """The `language` variants of these recipes, in the order given; missing ones are skipped"""
+    projection = {field: 1 for field in (*RECIPE_FIELDS, "recipeId")}
+    ids = [f"{rid}:{language}" for rid in recipe_ids]
+    docs = {doc["recipeId"]: doc async for doc in db[RECIPES_COLLECTION].find({"_id": {"$in": ids}}, projection)}
+    return [as_recipe(docs[rid]) for rid in recipe_ids if rid in docs]
@@ -0,0 +1,360 @@
+"""
+Recipe similarity over names and ingredients: hashed TF-IDF with cosine top-k.
+
+Each stored recipe variant (a recipeId in one language, see recipe_corpus.py)
+is a sparse vector of features:
+
+    n:<stem>   words of the name (see textnorm.py)
+    t:<gram>   character trigrams of the name, so misspelled names still match
+    i:<id>     canonical ids of the ingredients (see canonical.py)
+    w:<term>   terms of ingredient lines without an id
+
+Features are hashed with crc32 into FEATURES dimensions, so there is no
+vocabulary to maintain. Weights are (1 + log tf) * idf * the group's weight
+in GROUP_WEIGHTS, L2-normalized, so a dot product is the cosine similarity.
+
+Vectors are kept in segments: immutable NumPy arrays, column-major (feature
+-> recipes, weights) for scoring, which is a sparse matrix-vector product
+done as one bincount per segment, and row-major for rescoring the best
+candidates exactly (see RecipeSimilarityIndex._scores). add() puts new
+recipes in a segment of their own and merges it with the previous one while
+that is at most MERGE_FACTOR times larger, so there are O(log n) segments
+and every recipe is re-weighted against the corpus's current idf each time
+its segment is merged.
+
+The index backs fuzzy recipe search (search), "similar dishes" (similar)
+and dedup of generated recipes before they're stored (duplicate_of). It
+runs in process; nothing is sent to an embedding service.
+"""
+import asyncio
+import logging
+import math
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from canonical import IngredientCanonicalizer, default_canonicalizer
+from ingredient_match import ingredient_terms
+from recipe_corpus import RECIPES_COLLECTION
+from textnorm import content_stems, fold, tokenize, trigrams
+
+logger = logging.getLogger(__name__)
+
+FEATURES = 1 << 20
+GROUP_WEIGHTS = {"n": 1.0, "t": 0.5, "i": 1.0, "w": 0.5}
+MERGE_FACTOR = 4
+DUPLICATE_THRESHOLD = 0.9
+SEARCH_THRESHOLD = 0.15
+COMMON_FEATURE_SHARE = 0.02
+RESCORED = 200
+SIMILARITY_REFRESH = 6 * 60 * 60  # seconds
+
+
+def feature_counts(
+    name: str,
+    ingredients: Iterable[str] = (),
+    canonicalizer: Optional[IngredientCanonicalizer] = None
+) -> Counter:
+    """Group-prefixed features of a recipe and how often each occurs"""
+    canonicalizer = canonicalizer or default_canonicalizer()
+    features = Counter(f"n:{term}" for term in content_stems(name))
+    features.update(f"t:{gram}" for gram in trigrams(name))
+    for line in ingredients:
+        match = canonicalizer.lookup(line)
+        if match.id:
+            features[f"i:{match.id}"] += 1
+        else:
+            features.update(f"w:{term}" for term in ingredient_terms(line))
+    return features
+
+
+def query_counts(text: str, canonicalizer: Optional[IngredientCanonicalizer] = None) -> Counter:
+    """A search query as features: name words, and ingredients it names exactly ("pollo al curry")"""
+    canonicalizer = canonicalizer or default_canonicalizer()
+    features = feature_counts(text, (), canonicalizer)
+    for word in [text, *tokenize(text)]:
+        match = canonicalizer.lookup(word)
+        if match.method == "exact":
+            features[f"i:{match.id}"] += 1
+    return features
+
+
+def hashed(features: Counter) -> Tuple[np.ndarray, np.ndarray]:
+    """Feature columns (sorted, merged on collision) and their group-weighted log tf"""
+    columns: Dict[int, float] = {}
+    for feature, count in features.items():
+        column = zlib.crc32(feature.encode()) & (FEATURES - 1)
+        columns[column] = columns.get(column, 0.0) + GROUP_WEIGHTS[feature[0]] * (1 + math.log(count))
+    order = sorted(columns)
+    return np.array(order, dtype=np.int32), np.array([columns[c] for c in order], dtype=np.float32)
+
+
+class SimilarRecipe(NamedTuple):
+    recipe_id: str
+    language: str
+    score: float
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """starts[0], starts[0] + 1, ..., starts[0] + lengths[0] - 1, starts[1], ...; in one go"""
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class _Segment:
+    """Recipes [start, start + size) of the index, column-major"""
+
+    def __init__(self, start: int, lengths: np.ndarray, row_columns: np.ndarray, row_tf: np.ndarray, idf):
+        # The rows as added (feature columns and log tf per recipe), kept for merging
+        self.start = start
+        self.size = len(lengths)
+        self.lengths, self.row_columns, self.row_tf = lengths, row_columns, row_tf
+
+        self.row_offsets = np.append(0, np.cumsum(lengths))
+
+        recipes = np.repeat(np.arange(self.size, dtype=np.int32), lengths)
+        weights = row_tf * idf(row_columns)
+        norms = np.sqrt(np.bincount(recipes, weights=weights * weights, minlength=self.size))
+        weights /= np.maximum(norms, 1e-12)[recipes].astype(np.float32)
+        self.row_weights = weights
+
+        order = np.argsort(row_columns, kind="stable")
+        columns, self.recipes, self.weights = row_columns[order], recipes[order], weights[order]
+        self.columns, starts = np.unique(columns, return_index=True)
+        self.offsets = np.append(starts, len(columns))
+
+    @classmethod
+    def from_rows(cls, start: int, rows: List[Tuple[np.ndarray, np.ndarray]], idf) -> "_Segment":
+        lengths = np.array([len(columns) for columns, _ in rows], dtype=np.int64)
+        return cls(start, lengths, np.concatenate([c for c, _ in rows]), np.concatenate([t for _, t in rows]), idf)
+
+    def merged(self, following: "_Segment", idf) -> "_Segment":
+        return _Segment(
+            self.start,
+            np.concatenate([self.lengths, following.lengths]),
+            np.concatenate([self.row_columns, following.row_columns]),
+            np.concatenate([self.row_tf, following.row_tf]),
+            idf
+        )
+
+    def scores(self, columns: np.ndarray, weights: np.ndarray) -> Optional[np.ndarray]:
+        """Dot products of a query vector with every recipe of the segment"""
+        found = np.searchsorted(self.columns, columns)
+        hit = found < len(self.columns)
+        hit[hit] = self.columns[found[hit]] == columns[hit]
+        if not hit.any():
+            return None
+        starts = self.offsets[found[hit]]
+        lengths = self.offsets[found[hit] + 1] - starts
+        positions = _ranges(starts, lengths)
+        products = self.weights[positions] * np.repeat(weights[hit], lengths)
+        return np.bincount(self.recipes[positions], weights=products, minlength=self.size)
+
+    def exact_scores(self, recipes: np.ndarray, columns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Full dot products of a query vector (columns sorted) with some recipes of the segment"""
+        starts = self.row_offsets[recipes]
+        lengths = self.row_offsets[recipes + 1] - starts
+        positions = _ranges(starts, lengths)
+        found = np.minimum(np.searchsorted(columns, self.row_columns[positions]), len(columns) - 1)
+        hit = columns[found] == self.row_columns[positions]
+        products = np.where(hit, self.row_weights[positions] * weights[found], 0.0)
+        return np.bincount(np.repeat(np.arange(len(recipes)), lengths), weights=products, minlength=len(recipes))
+
+
+class RecipeSimilarityIndex:
+    def __init__(
+        self,
+        entries: Iterable[dict] = (),
+        canonicalizer: Optional[IngredientCanonicalizer] = None
+    ):
+        """`entries` are {recipeId, language, name, ingredients} dicts"""
+        self.canonicalizer = canonicalizer or default_canonicalizer()
+        self._keys: List[Tuple[str, str]] = []
+        self._positions: Dict[Tuple[str, str], int] = {}
+        self._segments: List[_Segment] = []
+        self._document_frequency = np.zeros(FEATURES, dtype=np.int32)
+        self._languages: Dict[str, np.ndarray] = {}
+        self.add(entries)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _idf(self, columns: np.ndarray) -> np.ndarray:
+        return (np.log((1 + len(self._keys)) / (1 + self._document_frequency[columns])) + 1).astype(np.float32)
+
+    def add(self, entries: Iterable[dict]):
+        """Index recipe variants not indexed yet"""
+        rows = []
+        for entry in entries:
+            key = (entry["recipeId"], entry["language"])
+            if key in self._positions:
+                continue
+            self._positions[key] = len(self._keys)
+            self._keys.append(key)
+            row = hashed(feature_counts(entry.get("name", ""), entry.get("ingredients", []), self.canonicalizer))
+            self._document_frequency[row[0]] += 1
+            rows.append(row)
+        if not rows:
+            return
+
+        size = len(self._keys)
+        for language, mask in self._languages.items():
+            self._languages[language] = np.append(mask, np.zeros(size - len(mask), dtype=bool))
+        for position in range(size - len(rows), size):
+            language = self._keys[position][1]
+            if language not in self._languages:
+                self._languages[language] = np.zeros(size, dtype=bool)
+            self._languages[language][position] = True
+
+        segment = _Segment.from_rows(size - len(rows), rows, self._idf)
+        while self._segments and self._segments[-1].size <= MERGE_FACTOR * segment.size:
+            segment = self._segments.pop().merged(segment, self._idf)
+        self._segments.append(segment)
+
+    def _scores(self, features: Counter) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The RESCORED recipes most similar to `features` and their exact
+        cosine similarity, in no particular order. Candidates are picked
+        on the query's features that some but at most COMMON_FEATURE_SHARE
+        of the recipes have: common ones (" de", "i:onion") have the lowest
+        idf but the longest postings, and would dominate the cost. When the
+        query has no such feature (always the case in a small corpus), all
+        of its features that occur at all are used.
+        """
+        columns, tf = hashed(features)
+        weights = tf * self._idf(columns)
+        weights /= max(float(np.linalg.norm(weights)), 1e-12)
+
+        frequency = self._document_frequency[columns]
+        rare = (frequency > 0) & (frequency <= COMMON_FEATURE_SHARE * len(self._keys))
+        if not rare.any():
+            rare = frequency > 0
+        partial = np.zeros(len(self._keys), dtype=np.float64)
+        for segment in self._segments:
+            segment_scores = segment.scores(columns[rare], weights[rare])
+            if segment_scores is not None:
+                partial[segment.start:segment.start + segment.size] = segment_scores
+
+        candidates = np.flatnonzero(partial)
+        if len(candidates) > RESCORED:
+            candidates = candidates[np.argpartition(partial[candidates], len(candidates) - RESCORED)[-RESCORED:]]
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        for segment in self._segments:
+            local = (candidates >= segment.start) & (candidates < segment.start + segment.size)
+            if local.any():
+                scores[local] = segment.exact_scores(candidates[local] - segment.start, columns, weights)
+        return candidates, scores
+
+    def _top(
+        self,
+        features: Counter,
+        k: int,
+        language: Optional[str],
+        threshold: float,
+        exclude: Optional[str] = None
+    ) -> List[SimilarRecipe]:
+        positions, scores = self._scores(features)
+        keep = scores >= max(threshold, 1e-9)
+        if language is not None:
+            if language not in self._languages:
+                return []
+            keep &= self._languages[language][positions]
+        if exclude is not None:
+            keep &= np.array([self._keys[position][0] != exclude for position in positions], dtype=bool)
+        positions, scores = positions[keep], scores[keep]
+        best = np.lexsort((positions, -scores))[:k]
+        return [SimilarRecipe(*self._keys[positions[i]], round(float(scores[i]), 4)) for i in best]
+
+    def search(self, query: str, language: str, k: int = 8, threshold: float = SEARCH_THRESHOLD) -> List[SimilarRecipe]:
+        """Recipes whose name or ingredients resemble a search query, most similar first"""
+        if not len(self) or not fold(query).strip():
+            return []
+        return self._top(query_counts(query, self.canonicalizer), k, language, threshold)
+
+    def similar(self, recipe: dict, language: str, k: int = 6, threshold: float = 0.0) -> List[SimilarRecipe]:
+        """Other recipes most like `recipe` ({id, name, ingredients}), most similar first"""
+        if not len(self):
+            return []
+        features = feature_counts(recipe.get("name", ""), recipe.get("ingredients", []), self.canonicalizer)
+        return self._top(features, k, language, threshold, exclude=recipe.get("id"))
+
+    def duplicate_of(self, recipe: dict, language: str, threshold: float = DUPLICATE_THRESHOLD) -> Optional[str]:
+        """The recipeId of an indexed recipe that is the same dish as `recipe`, if any"""
+        if not len(self):
+            return None
+        features = feature_counts(recipe.get("name", ""), recipe.get("ingredients", []), self.canonicalizer)
+        best = self._top(features, 1, language, threshold)
+        return best[0].recipe_id if best else None
+
+
+def generated_entries(recipes: List[dict], language: str) -> List[dict]:
+    """Index entries for recipes that store_recipes() has just given their ids"""
+    return [
+        {"recipeId": recipe["id"], "language": language, "name": recipe.get("name", ""),
+         "ingredients": recipe.get("ingredients", [])}
+        for recipe in recipes if recipe.get("id")
+    ]
+
+
+async def load_similarity_index(db, canonicalizer: Optional[IngredientCanonicalizer] = None) -> RecipeSimilarityIndex:
+    projection = {"_id": 0, "recipeId": 1, "language": 1, "name": 1, "ingredients": 1}
+    entries = [entry async for entry in db[RECIPES_COLLECTION].find({}, projection)]
+    return await asyncio.to_thread(RecipeSimilarityIndex, entries, canonicalizer)
+
+
+class SimilarityRefresher:
+    """Keeps `index` in step with the recipe corpus"""
+
+    def __init__(
+        self,
+        db,
+        canonicalizer: Optional[IngredientCanonicalizer] = None,
+        interval: float = SIMILARITY_REFRESH
+    ):
+        self.db = db
+        self.canonicalizer = canonicalizer
+        self.index = RecipeSimilarityIndex(canonicalizer=canonicalizer)
+        self.interval = interval
+        self._task = None
+        # Entries added while a rebuild runs, for the rebuilt index
+        self._added_during_refresh: Optional[List[dict]] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, recipes: List[dict], language: str):
+        entries = generated_entries(recipes, language)
+        self.index.add(entries)
+        if self._added_during_refresh is not None:
+            self._added_during_refresh.extend(entries)
+
+    async def refresh(self):
+        # The snapshot may or may not include recipes added meanwhile; adding them again is a no-op
+        self._added_during_refresh = []
+        try:
+            index = await load_similarity_index(self.db, self.canonicalizer)
+            index.add(self._added_during_refresh)
+            self.index = index
+        finally:
+            self._added_during_refresh = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Couldn't rebuild the recipe similarity index: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,211 @@
+"""
+Pre-aggregated daily nutrition totals.
+
+`daily_rollups` holds one document per (userId, day) with the summed macros
+and meal count of that day. save_meal and delete_meal keep it current with
+atomic $inc updates, so the summary endpoints read a single document instead
+of summing meals. Whenever raw meals do need summing, meal_totals() does it
+with an aggregation pipeline so photos and other fields never leave MongoDB.
+Run this module directly to rebuild the rollups from the meals collection
+after a bug or a manual data fix, with the app stopped (or, with --user,
+while that user isn't logging meals):
+
+    python rollups.py [--user USER_ID]
+
+A rebuild replaces rollups with sums read a moment earlier, and a meal
+saved in between is inserted and $inc'ed in two steps that can land on
+either side of both, so concurrent saves can be lost or counted twice.
+Migration 3 runs it at startup, before the server takes requests, while
+other workers wait on the migration lease (see migrations.py).
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+from timebuckets import local_day, today_key
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_COLLECTION = "daily_rollups"
+MACRO_FIELDS = ("calories", "protein", "carbs", "fats")
+
+
+def meal_day(meal: dict) -> str:
+    """Local day key of a meal: the stored one, or derived from its timestamp and offset"""
+    return meal.get("day") or local_day(meal["timestamp"], meal.get("tzOffset") or 0)
+
+
+def empty_totals() -> dict:
+    totals = {field: 0 for field in MACRO_FIELDS}
+    totals["mealCount"] = 0
+    return totals
+
+
+async def apply_meal(db, meal: dict, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) a meal's macros from its day's rollup"""
+    increments = {field: sign * (meal.get(field) or 0) for field in MACRO_FIELDS}
+    increments["mealCount"] = sign
+    await db[ROLLUPS_COLLECTION].update_one(
+        {"userId": meal["userId"], "day": meal_day(meal)},
+        {"$inc": increments, "$set": {"updatedAt": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+async def apply_meals(db, meals: List[dict], sign: int = 1):
+    """apply_meal for many meals: one $inc upsert per touched (userId, day), in one bulk write"""
+    increments = {}
+    for meal in meals:
+        key = (meal["userId"], meal_day(meal))
+        inc = increments.setdefault(key, {field: 0 for field in (*MACRO_FIELDS, "mealCount")})
+        for field in MACRO_FIELDS:
+            inc[field] += sign * (meal.get(field) or 0)
+        inc["mealCount"] += sign
+
+    if not increments:
+        return
+    now = datetime.utcnow()
+    await db[ROLLUPS_COLLECTION].bulk_write([
+        UpdateOne(
+            {"userId": user_id, "day": day},
+            {"$inc": inc, "$set": {"updatedAt": now}},
+            upsert=True
+        )
+        for (user_id, day), inc in increments.items()
+    ], ordered=False)
+
+
+def _macro_sums() -> dict:
+    sums = {field: {"$sum": {"$ifNull": [f"${field}", 0]}} for field in MACRO_FIELDS}
+    sums["mealCount"] = {"$sum": 1}
+    return sums
+
+
+# Local day of a meal computed server-side, for meals saved before day keys existed
+_MEAL_DAY_EXPR = {"$ifNull": ["$day", {"$dateToString": {
+    "format": "%Y-%m-%d",
+    "date": {"$add": [
+        {"$convert": {"input": "$timestamp", "to": "date", "onError": None, "onNull": None}},
+        {"$multiply": [{"$ifNull": ["$tzOffset", 0]}, 60 * 1000]}
+    ]}
+}}]}
+
+
+def _totals_pipeline(match: dict, group_by: Optional[dict]) -> List[dict]:
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "userId": 1, "day": 1, "timestamp": 1, "tzOffset": 1,
+                      **{field: 1 for field in MACRO_FIELDS}}},
+        {"$group": {"_id": group_by, **_macro_sums()}},
+    ]
+
+
+async def meal_totals(db, match: dict, group_by: Optional[dict] = None) -> List[dict]:
+    """
+    Sum macros of the meals matching `match` inside MongoDB, so only the macro
+    fields are read and only the totals cross the wire. With `group_by` (a
+    $group _id expression, e.g. {"day": "$day"}) one row is returned per group,
+    with the group key under "_id"; without it a single row (or none) is returned.
+    """
+    return await db.meals.aggregate(_totals_pipeline(match, group_by), allowDiskUse=True).to_list(None)
+
+
+def _clean_totals(doc: Optional[dict]) -> dict:
+    totals = empty_totals()
+    if doc:
+        # $inc on floats accumulates rounding noise; clamp it away
+        for field in MACRO_FIELDS:
+            totals[field] = max(0, round(doc.get(field, 0), 2))
+        totals["mealCount"] = max(0, doc.get("mealCount", 0))
+    return totals
+
+
+async def get_day_totals(db, user_id: str, day: Optional[str] = None) -> dict:
+    """
+    Totals for one user and local day (today in UTC by default): a single
+    point lookup. Rollups are complete once migration 3 has rebuilt them,
+    which the server does before it starts serving, so a missing rollup
+    means nothing was logged that day.
+    """
+    day = day or today_key()
+    doc = await db[ROLLUPS_COLLECTION].find_one(
+        {"userId": user_id, "day": day},
+        {"_id": 0, "mealCount": 1, **{field: 1 for field in MACRO_FIELDS}}
+    )
+    return _clean_totals(doc)
+
+
+async def rebuild_rollups(db, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """
+    Recompute rollups from the meals collection, for one user or everyone.
+    Rollups for days that no longer have meals are removed. Returns the number
+    of rollup documents written. Only run it while no meals are being saved
+    (see above); totals are streamed and written batch_size at a time.
+    """
+    started = datetime.utcnow()
+    query = {"userId": user_id} if user_id else {}
+    pipeline = _totals_pipeline(query, {"userId": "$userId", "day": _MEAL_DAY_EXPR})
+
+    rollups = db[ROLLUPS_COLLECTION]
+    written = 0
+    operations = []
+    async for row in db.meals.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+        # Meals whose timestamp couldn't be read have no day to roll into
+        if not row["_id"]["day"]:
+            continue
+        operations.append(ReplaceOne(
+            {"userId": row["_id"]["userId"], "day": row["_id"]["day"]},
+            {
+                "userId": row["_id"]["userId"],
+                "day": row["_id"]["day"],
+                **{field: row[field] for field in MACRO_FIELDS},
+                "mealCount": row["mealCount"],
+                "updatedAt": started
+            },
+            upsert=True
+        ))
+        if len(operations) == batch_size:
+            await rollups.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        await rollups.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    # Anything not written by this rebuild (or by a meal saved meanwhile)
+    # belongs to a day without meals
+    stale = {"updatedAt": {"$lt": started}}
+    if user_id:
+        stale["userId"] = user_id
+    await rollups.delete_many(stale)
+
+    logger.info(f"Rebuilt {written} daily rollups")
+    return written
+
+
+async def _main(argv):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    user_id = argv[argv.index("--user") + 1] if "--user" in argv else None
+    try:
+        await rebuild_rollups(db, user_id)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main(sys.argv[1:]))
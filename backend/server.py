@@ -1,16 +1,43 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Request, Response, Body, Header, Query
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
+from pymongo.errors import BulkWriteError
 from typing import List, Optional
 import uuid
 from datetime import datetime, date
 import base64
+import csv
+import io
+import json
 from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
+from photo_store import PhotoStore, photo_url, THUMBNAIL_SIZES, DEFAULT_THUMBNAIL_SIZE
+from migrations import apply_migrations
+from meal_cursor import decode_meal_cursor, encode_meal_cursor
+from meals import SaveMealRequest, batch_meals, build_meal
+import rollups
+import analytics
+import sync
+import pantry
+import recipe_corpus
+from loaders import RequestLoader
+from write_behind import WriteBehindBuffer
+from idempotency import IDEMPOTENCY_HEADER, run_idempotent
+from food_index import LOCAL_CONFIDENCE, load_food_index
+from ingredient_match import PantryMatcher, rank_recipes
+from canonical import default_canonicalizer
+from cookable import CookableRefresher
+from daily_needs import FORMULA_VERSION, calculate_daily_needs
+from recipe_similarity import SimilarityRefresher
+from autocomplete import SEARCH_QUERIES_COLLECTION, PopularityRefresher, load_autocomplete_index, query_log_entry
+from cache import COMPRESSED_JSON, Cache, DocumentCache, InvalidationBus, backend_from_env, hash_key
+from timebuckets import day_bounds_ms, normalize_timestamp_ms, normalize_tz_offset, today_key
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -20,6 +47,53 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Meal photos are stored outside the meal documents, deduplicated by content hash
+photo_store = PhotoStore(db)
+
+# Bookkeeping inserts are batched off the request path (see write_behind.py)
+analysis_attempts_writer = WriteBehindBuffer(db.analysis_attempts)
+
+# Bundled food nutrition data, searched before asking the LLM
+food_index = load_food_index()
+
+# Free-text ingredient names -> canonical ids, in any app language (see canonical.py)
+ingredient_canonicalizer = default_canonicalizer()
+
+# Typeahead over food and ingredient names, ranked by the search_food query log
+search_query_writer = WriteBehindBuffer(db[SEARCH_QUERIES_COLLECTION])
+autocomplete = PopularityRefresher(db, load_autocomplete_index())
+
+# Stored recipes by the ingredients they use, for "what can I cook now" (see cookable.py)
+cookable_recipes = CookableRefresher(db, canonicalizer=ingredient_canonicalizer)
+
+# Stored recipes by name and ingredients, for fuzzy search, similar dishes and dedup (see recipe_similarity.py)
+recipe_similarity = SimilarityRefresher(db, ingredient_canonicalizer)
+
+
+def index_stored_recipes(recipes: List[dict], language: str, source: str):
+    """Make recipes store_recipes() just saved visible to the in-memory indexes"""
+    cookable_recipes.add(recipes, language, source)
+    recipe_similarity.add(recipes, language)
+
+# Caches share one backend, picked by CACHE_URL (see cache.py)
+cache_backend = backend_from_env()
+cache_invalidation_bus = InvalidationBus(db)
+
+# User documents change rarely (goals, premium); writers must invalidate them
+user_profiles = DocumentCache(
+    Cache(cache_backend, "users", ttl=300, bus=cache_invalidation_bus),
+    lambda user_id: db.users.find_one({"id": user_id}, {"_id": 0})
+)
+
+# LLM results, keyed by everything that goes into the prompt
+food_search_cache = Cache(cache_backend, "food_search", ttl=7 * 86400)
+recipe_search_cache = Cache(cache_backend, "recipe_search", ttl=86400, serializer=COMPRESSED_JSON)
+recipe_suggestions_cache = Cache(cache_backend, "recipe_suggestions", ttl=86400, serializer=COMPRESSED_JSON)
+translation_cache = Cache(cache_backend, "translations", ttl=7 * 86400, serializer=COMPRESSED_JSON)
+endpoint_caches = [
+    user_profiles.cache, food_search_cache, recipe_search_cache, recipe_suggestions_cache, translation_cache
+]
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -50,20 +124,6 @@ class User(BaseModel):
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     goals: Optional[UserGoals] = None
 
-class Meal(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    userId: str
-    timestamp: Optional[int] = None  # Unix timestamp from frontend (ms)
-    photoBase64: str
-    dishName: str
-    ingredients: List[str]
-    calories: int
-    protein: float
-    carbs: float
-    fats: float
-    portionSize: str
-    warnings: List[str]
-
 class AnalyzeFoodRequest(BaseModel):
     userId: str
     imageBase64: str
@@ -84,19 +144,10 @@ class AnalyzeFoodResponse(BaseModel):
     totalCalories: Optional[int] = None  # Total calories if shareable (e.g., whole pizza)
     servingDescription: Optional[str] = None  # e.g., "1 slice", "1 can (375ml)", "1 plate"
 
-class SaveMealRequest(BaseModel):
+class SaveMealsBatchRequest(BaseModel):
     userId: str
-    photoBase64: str
-    dishName: str
-    ingredients: List[str]
-    calories: float  # Changed to float for flexibility
-    protein: float
-    carbs: float
-    fats: float
-    portionSize: Optional[str] = "medium"  # Made optional with default
-    portions: Optional[float] = 1.0  # Added portions field
-    warnings: Optional[List[str]] = []  # Made optional with default
-    timestamp: Optional[int] = None  # Unix timestamp from frontend (ms)
+    meals: List[dict]  # SaveMealsBatchItem fields (userId optional), validated one by one
+    tzOffset: Optional[int] = None  # Default for items that don't carry their own
 
 class SetUserGoalsRequest(BaseModel):
     userId: str
@@ -122,6 +173,7 @@ class SmartNotificationRequest(BaseModel):
     userId: str
     mealType: str  # "lunch" or "dinner"
     language: Optional[str] = "en"
+    tzOffset: Optional[int] = None  # Minutes east of UTC (-Date.getTimezoneOffset())
 
 class SmartNotificationResponse(BaseModel):
     message: str
@@ -161,55 +213,6 @@ class Recipe(BaseModel):
 class RecipeSuggestionsResponse(BaseModel):
     recipes: List[Recipe]
 
-# Helper function to calculate daily calorie needs
-def calculate_daily_needs(age: int, height: float, weight: float, activity_level: str, goal: str, gender: str = "male"):
-    """
-    Calculate daily calorie and protein needs using Mifflin-St Jeor equation.
-    This is one of the most accurate formulas for estimating BMR.
-    
-    Note: These are estimates. Users should consult a nutritionist for personalized advice.
-    """
-    # Basal Metabolic Rate (BMR) using Mifflin-St Jeor equation
-    if gender == "female":
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    else:  # male or default
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    
-    # Activity multipliers (TDEE - Total Daily Energy Expenditure)
-    activity_multipliers = {
-        "sedentary": 1.2,       # Little or no exercise
-        "light": 1.375,         # Light exercise 1-3 days/week
-        "moderate": 1.55,       # Moderate exercise 3-5 days/week
-        "active": 1.725,        # Hard exercise 6-7 days/week
-        "very_active": 1.9      # Very hard exercise & physical job
-    }
-    
-    tdee = bmr * activity_multipliers.get(activity_level, 1.2)
-    
-    # Adjust based on goal
-    if goal == "lose":
-        daily_calories = int(tdee - 500)  # 500 calorie deficit (~0.5kg/week loss)
-        daily_protein = int(weight * 1.2)  # Higher protein to preserve muscle
-        daily_carbs = int((daily_calories * 0.40) / 4)  # 40% from carbs
-        daily_fats = int((daily_calories * 0.30) / 9)   # 30% from fats
-    elif goal == "gain":
-        daily_calories = int(tdee + 300)  # 300 calorie surplus (lean bulk)
-        daily_protein = int(weight * 1.8)  # High protein for muscle building
-        daily_carbs = int((daily_calories * 0.45) / 4)  # 45% from carbs
-        daily_fats = int((daily_calories * 0.25) / 9)   # 25% from fats
-    else:  # maintain
-        daily_calories = int(tdee)
-        daily_protein = int(weight * 1.0)  # Moderate protein
-        daily_carbs = int((daily_calories * 0.45) / 4)  # 45% from carbs
-        daily_fats = int((daily_calories * 0.30) / 9)   # 30% from fats
-    
-    return {
-        "calories": daily_calories,
-        "protein": daily_protein,
-        "carbs": daily_carbs,
-        "fats": daily_fats
-    }
-
 # Helper function to translate recipes to target language
 async def translate_recipes(recipes_data: list, target_language: str, api_key: str):
     """Translate all recipe content to target language using OpenAI"""
@@ -227,6 +230,11 @@ async def translate_recipes(recipes_data: list, target_language: str, api_key: s
         
         target_lang_name = language_names.get(target_language, target_language)
         
+        cache_key = hash_key(target_language, recipes_data)
+        cached = await translation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # Create translation prompt
         chat = LlmChat(
             api_key=api_key,
@@ -274,6 +282,7 @@ async def translate_recipes(recipes_data: list, target_language: str, api_key: s
         
         translated_recipes = json.loads(response_text)
         logger.info(f"Successfully translated {len(translated_recipes)} recipes to {target_language}")
+        await translation_cache.set(cache_key, translated_recipes)
         
         return translated_recipes
         
@@ -281,14 +290,36 @@ async def translate_recipes(recipes_data: list, target_language: str, api_key: s
         logger.error(f"Translation failed: {e}. Returning original recipes.")
         return recipes_data  # Return original if translation fails
 
+async def resolve_tz_offset(user_id: str, tz_offset: Optional[int] = None, user: Optional[dict] = None) -> int:
+    """The offset sent with the request, else the one last seen for the user, else UTC"""
+    if tz_offset is not None:
+        return normalize_tz_offset(tz_offset)
+    if user is None:
+        user = await user_profiles.get(user_id)
+    return normalize_tz_offset((user or {}).get("tzOffsetMinutes"))
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "FoodSnap API"}
 
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit rates per cache namespace, counted by this worker"""
+    return {cache.namespace: cache.stats() for cache in endpoint_caches}
+
 @api_router.post("/analyze-food")
-async def analyze_food(request: AnalyzeFoodRequest):
-    """Analyze food image using OpenAI GPT-4 Vision"""
+async def analyze_food(
+    request: AnalyzeFoodRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Analyze food image using OpenAI GPT-4 Vision. Retries with the same Idempotency-Key replay the result."""
+    return await run_idempotent(
+        db, idempotency_key, f"analyze-food:{request.userId}", request, lambda: _analyze_food(request), response
+    )
+
+async def _analyze_food(request: AnalyzeFoodRequest):
     try:
         logger.info(f"Analyzing food for user: {request.userId} in language: {request.language}")
         
@@ -298,12 +329,12 @@ async def analyze_food(request: AnalyzeFoodRequest):
         logger.info(f"Image base64 length: {len(raw_base64) if raw_base64 else 0}")
         
         # Track this analysis attempt (counts towards daily limit)
-        await db.analysis_attempts.insert_one({
+        await analysis_attempts_writer.add({
             "user_id": request.userId,
             "timestamp": datetime.utcnow(),
             "type": "food"
         })
-        logger.info(f"Recorded analysis attempt for user: {request.userId}")
+        logger.info(f"Queued analysis attempt for user: {request.userId}")
         
         # Initialize LLM chat with OpenAI GPT-4 Vision
         api_key = os.environ.get('EMERGENT_LLM_KEY')
@@ -452,61 +483,160 @@ async def analyze_food(request: AnalyzeFoodRequest):
         raise HTTPException(status_code=500, detail=f"Failed to analyze food: {str(e)}")
 
 @api_router.post("/meals")
-async def save_meal(request: SaveMealRequest):
-    """Save a meal to the database"""
+async def save_meal(
+    request: SaveMealRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Save a meal to the database. Retries with the same Idempotency-Key don't create it again."""
+    return await run_idempotent(
+        db, idempotency_key, f"meals:{request.userId}", request, lambda: _save_meal(request), response
+    )
+
+async def _save_meal(request: SaveMealRequest):
     try:
         # Use timestamp from frontend if provided, otherwise use current UTC time
-        meal_timestamp = request.timestamp if request.timestamp else int(datetime.utcnow().timestamp() * 1000)
-        
-        meal = Meal(
-            userId=request.userId,
-            timestamp=meal_timestamp,
-            photoBase64=request.photoBase64,
-            dishName=request.dishName,
-            ingredients=request.ingredients,
-            calories=request.calories,
-            protein=request.protein,
-            carbs=request.carbs,
-            fats=request.fats,
-            portionSize=request.portionSize,
-            warnings=request.warnings
-        )
-        
-        await db.meals.insert_one(meal.dict())
+        meal_timestamp = normalize_timestamp_ms(request.timestamp)
+        tz_offset = await resolve_tz_offset(request.userId, request.tzOffset)
+        if request.tzOffset is not None:
+            # Remember the device's offset for "today" queries that don't send one
+            result = await db.users.update_one(
+                {"id": request.userId, "tzOffsetMinutes": {"$ne": tz_offset}},
+                {"$set": {"tzOffsetMinutes": tz_offset}}
+            )
+            if result.modified_count:
+                await user_profiles.invalidate(request.userId)
+        
+        photo_id = await photo_store.put_base64(request.photoBase64)
+        meal = build_meal(request, meal_timestamp, tz_offset, photo_id)
+        
+        meal_doc = meal.dict()
+        await db.meals.insert_one(meal_doc)
+        await rollups.apply_meal(db, meal_doc)
+        await sync.record_upserts(db, [meal_doc])
+        if meal.day < today_key(tz_offset):
+            # Logged late: cached analytics for that day's week/month are stale
+            await analytics.invalidate_day(db, meal.userId, meal.day)
         return {"success": True, "mealId": meal.id}
         
     except Exception as e:
         logger.error(f"Error saving meal: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save meal: {str(e)}")
 
-@api_router.get("/meals/{user_id}/today")
-async def get_today_meals_count(user_id: str):
-    """Get count of meals logged today for a user"""
+MAX_MEAL_BATCH_SIZE = 500
+PHOTO_UPLOAD_CONCURRENCY = 8
+
+@api_router.post("/meals/batch")
+async def save_meals_batch(
+    request: SaveMealsBatchRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """
+    Save many meals at once, e.g. when the app replays meals queued offline.
+    
+    Items are validated independently and written with one unordered
+    insert_many; the response has a result per item, in request order. Items
+    may carry a client-generated "id": replaying an already saved meal then
+    reports "duplicate" instead of creating it twice. A retried batch sent
+    with the same Idempotency-Key gets the first attempt's results back.
+    """
+    if len(request.meals) > MAX_MEAL_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_MEAL_BATCH_SIZE} meals per batch")
+    
+    return await run_idempotent(
+        db, idempotency_key, f"meals-batch:{request.userId}", request, lambda: _save_meals_batch(request), response
+    )
+
+async def _save_meals_batch(request: SaveMealsBatchRequest):
     try:
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        today_end = datetime.combine(date.today(), datetime.max.time())
+        tz_offset = await resolve_tz_offset(request.userId, request.tzOffset)
+        # Build every meal first so bad items never cost a photo upload
+        results, meals = batch_meals(request.userId, request.meals, tz_offset)
         
-        count = await db.meals.count_documents({
-            "userId": user_id,
-            "timestamp": {"$gte": today_start, "$lte": today_end}
-        })
+        semaphore = asyncio.Semaphore(PHOTO_UPLOAD_CONCURRENCY)
         
-        return {"count": count}
+        async def store_photo(photo_base64):
+            async with semaphore:
+                return await photo_store.put_base64(photo_base64)
+        
+        photo_ids = await asyncio.gather(
+            *(store_photo(batch_meal.photo_base64) for batch_meal in meals),
+            return_exceptions=True
+        )
+        
+        docs, doc_indexes = [], []
+        for (index, meal, _), photo_id in zip(meals, photo_ids):
+            if isinstance(photo_id, Exception):
+                results[index] = {"index": index, "status": "invalid", "error": f"Unreadable photo: {photo_id}"}
+                continue
+            meal.photoId = photo_id
+            docs.append(meal.dict())
+            doc_indexes.append(index)
+        
+        failed = {}
+        if docs:
+            try:
+                await db.meals.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed[error["index"]] = error
+        
+        inserted = []
+        for position, (doc, index) in enumerate(zip(docs, doc_indexes)):
+            error = failed.get(position)
+            if error is None:
+                inserted.append(doc)
+                results[index] = {"index": index, "status": "created", "mealId": doc["id"]}
+            elif error.get("code") == 11000:
+                results[index] = {"index": index, "status": "duplicate", "mealId": doc["id"]}
+            else:
+                results[index] = {"index": index, "status": "error", "error": error.get("errmsg")}
+        
+        await rollups.apply_meals(db, inserted)
+        await sync.record_upserts(db, inserted)
+        today = today_key(tz_offset)
+        for day in {doc["day"] for doc in inserted if doc["day"] < today}:
+            await analytics.invalidate_day(db, request.userId, day)
+        
+        duplicates = sum(1 for result in results if result["status"] == "duplicate")
+        return {
+            "created": len(inserted),
+            "duplicates": duplicates,
+            "failed": len(results) - len(inserted) - duplicates,
+            "results": results
+        }
+        
+    except Exception as e:
+        logger.error(f"Error saving meal batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to save meals: {str(e)}")
+
+@api_router.get("/meals/{user_id}/today")
+async def get_today_meals_count(user_id: str, tz_offset: Optional[int] = None):
+    """Get count of meals logged today (in the user's timezone) for a user"""
+    try:
+        tz_offset = await resolve_tz_offset(user_id, tz_offset)
+        totals = await rollups.get_day_totals(db, user_id, today_key(tz_offset))
+        return {"count": totals["mealCount"]}
         
     except Exception as e:
         logger.error(f"Error getting meal count: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get meal count: {str(e)}")
 
 @api_router.get("/analysis-count/{user_id}/today")
-async def get_today_analysis_count(user_id: str):
+async def get_today_analysis_count(user_id: str, tz_offset: Optional[int] = None):
     """Get count of analysis attempts today for a user (for daily limit)"""
     try:
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        today_end = datetime.combine(date.today(), datetime.max.time())
+        tz_offset = await resolve_tz_offset(user_id, tz_offset)
+        start_ms, end_ms = day_bounds_ms(today_key(tz_offset), tz_offset)
         
+        # Attempts are stored with naive UTC datetimes
         count = await db.analysis_attempts.count_documents({
             "user_id": user_id,
-            "timestamp": {"$gte": today_start, "$lte": today_end}
+            "timestamp": {
+                "$gte": datetime.utcfromtimestamp(start_ms / 1000),
+                "$lt": datetime.utcfromtimestamp(end_ms / 1000)
+            }
         })
         
         return {"count": count}
@@ -515,50 +645,263 @@ async def get_today_analysis_count(user_id: str):
         logger.error(f"Error getting analysis count: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get analysis count: {str(e)}")
 
+# Fields a client may request from the meal history endpoint
+MEAL_HISTORY_FIELDS = {
+    "id", "userId", "timestamp", "photoId", "dishName", "ingredients",
+    "calories", "protein", "carbs", "fats", "portionSize", "warnings"
+}
+MAX_MEAL_PAGE_SIZE = 100
+
+def present_meal(meal: dict) -> dict:
+    """Make a meal document JSON-serializable and add its photo references"""
+    # Convert ObjectId to string for JSON serialization
+    if "_id" in meal:
+        meal["_id"] = str(meal["_id"])
+    if meal.get("photoId"):
+        meal["thumbnailUrl"] = photo_url(meal["photoId"], DEFAULT_THUMBNAIL_SIZE)
+        meal["photoUrl"] = photo_url(meal["photoId"])
+    return meal
+
 @api_router.get("/meals/{user_id}")
-async def get_user_meals(user_id: str, limit: int = 50):
-    """Get meal history for a user"""
+async def get_user_meals(
+    user_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    full_photos: bool = False
+):
+    """
+    Get a page of meal history for a user, newest first.
+    
+    Pages are keyset-paginated on (timestamp, id): pass the returned nextCursor
+    to get the following page. `fields` is a comma-separated projection; photos
+    are referenced through thumbnailUrl/photoUrl, and legacy inline photos are
+    only included when full_photos is set.
+    """
     try:
-        meals = await db.meals.find(
-            {"userId": user_id}
-        ).sort("timestamp", -1).limit(limit).to_list(limit)
+        limit = max(1, min(limit, MAX_MEAL_PAGE_SIZE))
+        
+        query = {"userId": user_id}
+        if cursor:
+            cursor_timestamp, cursor_id = decode_meal_cursor(cursor)
+            # The outer bound keeps the scan a single index range; $or breaks timestamp ties
+            query["timestamp"] = {"$lte": cursor_timestamp}
+            query["$or"] = [
+                {"timestamp": {"$lt": cursor_timestamp}},
+                {"timestamp": cursor_timestamp, "id": {"$lt": cursor_id}}
+            ]
         
-        # Convert ObjectId to string for JSON serialization
-        for meal in meals:
-            if "_id" in meal:
-                meal["_id"] = str(meal["_id"])
+        if fields:
+            requested = {f.strip() for f in fields.split(",") if f.strip()}
+            unknown = requested - MEAL_HISTORY_FIELDS
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+            # id and timestamp are always needed to build the next cursor
+            projection = {f: 1 for f in requested | {"id", "timestamp"}}
+            if full_photos:
+                projection["photoBase64"] = 1
+        else:
+            projection = None if full_photos else {"photoBase64": 0}
         
-        return {"meals": meals}
+        # Fetch one extra meal to know whether another page exists
+        meals = await db.meals.find(query, projection).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
         
+        has_more = len(meals) > limit
+        meals = meals[:limit]
+        next_cursor = encode_meal_cursor(meals[-1]["timestamp"], meals[-1]["id"]) if has_more else None
+        
+        return {"meals": [present_meal(meal) for meal in meals], "nextCursor": next_cursor, "hasMore": has_more}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting meals: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get meals: {str(e)}")
 
-@api_router.get("/meals/{user_id}/daily-totals")
-async def get_daily_totals(user_id: str):
-    """Get today's total calories and macros"""
+MAX_SYNC_PAGE_SIZE = 500
+
+@api_router.get("/meals/{user_id}/sync")
+async def sync_meals(user_id: str, cursor: Optional[str] = None, limit: int = 200):
+    """
+    Meals created, updated or deleted since `cursor` (omit it for a full sync).
+    
+    Returns changed meals, ids of deleted meals, and the cursor to send next
+    time. When nothing changed this is a single indexed read, and the cursor
+    returned points at the present. fullResync means the cursor is older than the tombstone
+    retention: drop local meals and sync again without a cursor.
+    """
     try:
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        today_end = datetime.combine(date.today(), datetime.max.time())
-        
-        meals = await db.meals.find({
-            "userId": user_id,
-            "timestamp": {"$gte": today_start, "$lte": today_end}
-        }).to_list(100)
-        
-        total_calories = sum(meal.get("calories", 0) for meal in meals)
-        total_protein = sum(meal.get("protein", 0) for meal in meals)
-        total_carbs = sum(meal.get("carbs", 0) for meal in meals)
-        total_fats = sum(meal.get("fats", 0) for meal in meals)
+        limit = max(1, min(limit, MAX_SYNC_PAGE_SIZE))
+        position = decode_meal_cursor(cursor) if cursor else None
+        
+        changes, has_more, full_resync, position = await sync.changes_since(db, user_id, position, limit)
+        if full_resync:
+            return {"meals": [], "deleted": [], "nextCursor": None, "hasMore": False, "fullResync": True}
+        next_cursor = encode_meal_cursor(*position)
+        if not changes:
+            return {"meals": [], "deleted": [], "nextCursor": next_cursor, "hasMore": False, "fullResync": False}
+        
+        upserted_ids = [c["mealId"] for c in changes if c["op"] == "upsert"]
+        meals = []
+        if upserted_ids:
+            meals = await db.meals.find(
+                {"id": {"$in": upserted_ids}, "userId": user_id},
+                {"photoBase64": 0}
+            ).to_list(len(upserted_ids))
         
         return {
-            "calories": total_calories,
-            "protein": total_protein,
-            "carbs": total_carbs,
-            "fats": total_fats,
-            "mealCount": len(meals)
+            "meals": [present_meal(meal) for meal in meals],
+            "deleted": [c["mealId"] for c in changes if c["op"] == "delete"],
+            "nextCursor": next_cursor,
+            "hasMore": has_more,
+            "fullResync": False
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing meals: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to sync meals: {str(e)}")
+
+# CSV columns come first in this order; any other stored field follows alphabetically
+EXPORT_FIELDS = [
+    "id", "timestamp", "day", "tzOffset", "dishName", "ingredients", "calories",
+    "protein", "carbs", "fats", "portionSize", "warnings", "photoUrl"
+]
+# Internal ids and inline photos never leave the server
+EXPORT_EXCLUDED_FIELDS = {"_id": 0, "photoBase64": 0}
+MAX_EXPORT_BATCH_SIZE = 5000
+
+async def _export_fields(user_id: str, include_photos: bool) -> List[str]:
+    """Every field stored on any of a user's meals, as CSV columns"""
+    rows = await db.meals.aggregate([
+        {"$match": {"userId": user_id}},
+        {"$project": {"fields": {"$map": {"input": {"$objectToArray": "$$ROOT"}, "in": "$$this.k"}}}},
+        {"$unwind": "$fields"},
+        {"$group": {"_id": "$fields"}},
+    ], allowDiskUse=True).to_list(None)
+    stored = {row["_id"] for row in rows} - set(EXPORT_EXCLUDED_FIELDS) - {"photoId"}
+    if include_photos:
+        stored.add("photoUrl")
+    return [f for f in EXPORT_FIELDS if f in stored] + sorted(stored - set(EXPORT_FIELDS))
+
+async def _export_rows(user_id: str, batch_size: int, include_photos: bool):
+    """Stream a user's meals oldest first, one batch in memory at a time"""
+    cursor = db.meals.find({"userId": user_id}, EXPORT_EXCLUDED_FIELDS).sort(
+        [("timestamp", 1), ("id", 1)]
+    ).batch_size(batch_size)
+    async for meal in cursor:
+        photo_id = meal.pop("photoId", None)
+        if include_photos and photo_id:
+            meal["photoUrl"] = photo_url(photo_id)
+        yield meal
+
+async def _ndjson_chunks(rows, batch_size: int):
+    lines = []
+    async for meal in rows:
+        lines.append(json.dumps(meal, ensure_ascii=False, default=str))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+async def _csv_chunks(rows, fields: List[str], batch_size: int):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    pending = 0
+    async for meal in rows:
+        for field, value in meal.items():
+            if isinstance(value, list):
+                meal[field] = "; ".join(str(item) for item in value)
+            elif isinstance(value, dict):
+                meal[field] = json.dumps(value, ensure_ascii=False, default=str)
+        writer.writerow(meal)
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@api_router.get("/meals/{user_id}/export")
+async def export_meals(
+    user_id: str,
+    fmt: str = Query("ndjson", alias="format"),
+    batch_size: int = 500,
+    photos: str = "reference"
+):
+    """
+    Export a user's full meal history as NDJSON or CSV.
+    The response is streamed from a database cursor, so memory stays constant
+    however many meals there are. Every stored field is exported; CSV has one
+    column per field found on any meal. photos=reference adds a photoUrl per
+    meal, photos=exclude leaves photos out entirely.
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    if photos not in ("reference", "exclude"):
+        raise HTTPException(status_code=400, detail="photos must be 'reference' or 'exclude'")
+    batch_size = max(1, min(batch_size, MAX_EXPORT_BATCH_SIZE))
+    
+    rows = _export_rows(user_id, batch_size, photos == "reference")
+    if fmt == "csv":
+        fields = await _export_fields(user_id, photos == "reference")
+        chunks, media_type = _csv_chunks(rows, fields, batch_size), "text/csv; charset=utf-8"
+    else:
+        chunks, media_type = _ndjson_chunks(rows, batch_size), "application/x-ndjson"
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="meals-{user_id}.{fmt}"'}
+    )
+
+@api_router.get("/photos/{photo_id}")
+async def get_photo(photo_id: str, request: Request, size: Optional[int] = None):
+    """
+    Serve a stored meal photo, or one of its thumbnails when size is given.
+    Photos are content-addressed, so they never change.
+    """
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+    
+    etag = f'"{photo_id}@{size}"' if size else f'"{photo_id}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    
+    try:
+        if size:
+            photo = await photo_store.get_thumbnail(photo_id, size)
+        else:
+            photo = await photo_store.get(photo_id)
+    except Exception as e:
+        logger.error(f"Error getting photo: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get photo: {str(e)}")
+    
+    if photo is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    
+    data, content_type = photo
+    return Response(content=data, media_type=content_type, headers=cache_headers)
+
+@api_router.get("/meals/{user_id}/daily-totals")
+async def get_daily_totals(user_id: str, tz_offset: Optional[int] = None):
+    """Get today's total calories and macros in the user's timezone"""
+    try:
+        tz_offset = await resolve_tz_offset(user_id, tz_offset)
+        return await rollups.get_day_totals(db, user_id, today_key(tz_offset))
+        
     except Exception as e:
         logger.error(f"Error getting daily totals: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get daily totals: {str(e)}")
@@ -567,9 +910,19 @@ async def get_daily_totals(user_id: str):
 async def delete_meal(meal_id: str):
     """Delete a specific meal"""
     try:
-        result = await db.meals.delete_one({"id": meal_id})
-        if result.deleted_count == 0:
+        meal = await db.meals.find_one_and_delete(
+            {"id": meal_id},
+            {"_id": 0, "userId": 1, "timestamp": 1, "tzOffset": 1, "day": 1,
+             "calories": 1, "protein": 1, "carbs": 1, "fats": 1}
+        )
+        if meal is None:
             raise HTTPException(status_code=404, detail="Meal not found")
+        await sync.record_delete(db, meal["userId"], meal_id)
+        if meal.get("day") or isinstance(meal.get("timestamp"), int):
+            await rollups.apply_meal(db, meal, sign=-1)
+            day = rollups.meal_day(meal)
+            if day < today_key(meal.get("tzOffset") or 0):
+                await analytics.invalidate_day(db, meal["userId"], day)
         return {"success": True, "message": "Meal deleted successfully"}
         
     except HTTPException:
@@ -594,14 +947,10 @@ async def create_user():
 async def get_user(user_id: str):
     """Get user details"""
     try:
-        user = await db.users.find_one({"id": user_id})
+        user = await user_profiles.get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Convert ObjectId to string for JSON serialization
-        if "_id" in user:
-            user["_id"] = str(user["_id"])
-        
         return user
         
     except HTTPException:
@@ -639,11 +988,13 @@ async def set_user_goals(user_id: str, request: SetUserGoalsRequest):
         goals_dict["dailyCarbs"] = daily_needs["carbs"]
         goals_dict["dailyFats"] = daily_needs["fats"]
         goals_dict["gender"] = request.gender or "male"
+        goals_dict["formulaVersion"] = FORMULA_VERSION
         
         await db.users.update_one(
             {"id": user_id},
             {"$set": {"goals": goals_dict}}
         )
+        await user_profiles.invalidate(user_id)
         
         return {"success": True, "goals": goals_dict}
         
@@ -659,6 +1010,7 @@ async def update_premium_status(user_id: str, is_premium: bool):
             {"id": user_id},
             {"$set": {"isPremium": is_premium}}
         )
+        await user_profiles.invalidate(user_id)
         return {"success": True, "isPremium": is_premium}
         
     except Exception as e:
@@ -736,9 +1088,72 @@ async def analyze_ingredients(request: AnalyzeIngredientsRequest):
         logger.error(f"Error analyzing ingredients: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze ingredients: {str(e)}")
 
+RECIPE_SUGGESTIONS = 8
+
+def recipe_from_dict(recipe_dict: dict) -> Recipe:
+    return Recipe(
+        id=recipe_dict.get("id") or str(uuid.uuid4()),
+        name=recipe_dict.get("name", "Unknown Recipe"),
+        description=recipe_dict.get("description", ""),
+        ingredients=recipe_dict.get("ingredients", []),
+        instructions=recipe_dict.get("instructions", []),
+        cookingTime=recipe_dict.get("cookingTime", 30),
+        servings=recipe_dict.get("servings", 2),
+        calories=recipe_dict.get("calories", 500),
+        protein=recipe_dict.get("protein", 20.0),
+        carbs=recipe_dict.get("carbs", 50.0),
+        fats=recipe_dict.get("fats", 15.0),
+        healthierOption=recipe_dict.get("healthierOption"),
+        countryOfOrigin=recipe_dict.get("countryOfOrigin"),
+        cuisine=recipe_dict.get("cuisine"),
+        requiresExtraIngredients=recipe_dict.get("requiresExtraIngredients", False),
+        extraIngredientsNeeded=recipe_dict.get("extraIngredientsNeeded", [])
+    )
+
+async def cookable_suggestions(request: AnalyzeIngredientsRequest) -> List[dict]:
+    """
+    Stored recipes the pantry fully covers, in the request's language. The
+    index can't tell whether a recipe suits a health condition, so requests
+    with any get none.
+    """
+    if any(condition != "none" for condition in request.healthConditions or []):
+        return []
+    language = request.language or "en"
+    allergies = request.foodAllergies or []
+    matches = cookable_recipes.index.top(
+        ingredient_canonicalizer.keys(request.ingredients),
+        k=RECIPE_SUGGESTIONS,
+        min_coverage=1.0,
+        language=language,
+        avoid=ingredient_canonicalizer.keys(allergies)
+    )
+    if not matches:
+        return []
+    recipes = await recipe_corpus.get_recipes(db, [match.recipe.recipe_id for match in matches], language)
+    # Anything that may contain an allergy counts; unknown ones are matched by their words
+    allergens = PantryMatcher(allergies, ingredient_canonicalizer, exact=False)
+    return [
+        recipe for recipe in recipes
+        if not any(allergens.has(ingredient) for ingredient in recipe.get("ingredients", []))
+    ]
+
 @api_router.post("/recipe-suggestions")
-async def get_recipe_suggestions(request: AnalyzeIngredientsRequest):
-    """Get recipe suggestions based on available ingredients"""
+async def get_recipe_suggestions(
+    request: AnalyzeIngredientsRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Get recipe suggestions based on available ingredients. Retries with the same Idempotency-Key replay the result."""
+    return await run_idempotent(
+        db,
+        idempotency_key,
+        f"recipe-suggestions:{request.userId}",
+        request,
+        lambda: _recipe_suggestions(request),
+        response
+    )
+
+async def _recipe_suggestions(request: AnalyzeIngredientsRequest):
     try:
         logger.info(f"Getting recipe suggestions for user: {request.userId} in language: {request.language}")
         logger.info(f"Request data - Language received: '{request.language}', Ingredients: {request.ingredients}")
@@ -746,6 +1161,24 @@ async def get_recipe_suggestions(request: AnalyzeIngredientsRequest):
         if not request.ingredients or len(request.ingredients) == 0:
             return RecipeSuggestionsResponse(recipes=[])
         
+        # Suggestions depend only on what's in the prompt, not on who asked
+        cache_key = hash_key(
+            sorted(ingredient_canonicalizer.keys(request.ingredients)),
+            sorted(request.healthConditions or []),
+            sorted(request.foodAllergies or []),
+            request.language
+        )
+        cached = await recipe_suggestions_cache.get(cache_key)
+        if cached is not None:
+            return RecipeSuggestionsResponse(recipes=cached)
+        
+        # Recipes already in the corpus come first; the model only fills the rest
+        corpus_recipes = await cookable_suggestions(request)
+        if len(corpus_recipes) >= RECIPE_SUGGESTIONS:
+            recipes = [recipe_from_dict(recipe_dict) for recipe_dict in corpus_recipes]
+            await recipe_suggestions_cache.set(cache_key, [recipe.dict() for recipe in recipes])
+            return RecipeSuggestionsResponse(recipes=recipes)
+        
         api_key = os.environ.get('EMERGENT_LLM_KEY')
         if not api_key:
             raise HTTPException(status_code=500, detail="API key not configured")
@@ -893,32 +1326,33 @@ Return as JSON array with requiresExtraIngredients and extraIngredientsNeeded fi
                     recipe_dict['ingredients'] = normalize_ingredients(recipe_dict['ingredients'])
             
             # STEP 2: If not English, translate all recipe content
+            english_recipes = recipes_data
+            translations = {}
             if request.language and request.language != "en":
                 logger.info(f"Translating recipes to {request.language}")
                 recipes_data = await translate_recipes(recipes_data, request.language, api_key)
+                # A failed translation comes back as the English originals
+                if recipes_data is not english_recipes:
+                    translations[request.language] = recipes_data
+            
+            # Keep them in the recipe corpus; this also gives each a stable id
+            await recipe_corpus.store_recipes(
+                db, english_recipes, "en", "suggestions", translations=translations,
+                canonicalizer=ingredient_canonicalizer, duplicate_of=recipe_similarity.index.duplicate_of
+            )
+            index_stored_recipes(english_recipes, "en", "suggestions")
+            for language, translated in translations.items():
+                index_stored_recipes(translated, language, "suggestions")
+            
+            # Stored recipes go first; generated ones fill the remaining places
+            corpus_ids = {recipe["id"] for recipe in corpus_recipes}
+            fill = [recipe for recipe in recipes_data if recipe.get("id") not in corpus_ids]
+            recipes_data = corpus_recipes + fill[:RECIPE_SUGGESTIONS - len(corpus_recipes)]
             
             # Validate and convert to Recipe objects
-            recipes = []
-            for recipe_dict in recipes_data:
-                recipe = Recipe(
-                    name=recipe_dict.get("name", "Unknown Recipe"),
-                    description=recipe_dict.get("description", ""),
-                    ingredients=recipe_dict.get("ingredients", []),
-                    instructions=recipe_dict.get("instructions", []),
-                    cookingTime=recipe_dict.get("cookingTime", 30),
-                    servings=recipe_dict.get("servings", 2),
-                    calories=recipe_dict.get("calories", 500),
-                    protein=recipe_dict.get("protein", 20.0),
-                    carbs=recipe_dict.get("carbs", 50.0),
-                    fats=recipe_dict.get("fats", 15.0),
-                    healthierOption=recipe_dict.get("healthierOption"),
-                    countryOfOrigin=recipe_dict.get("countryOfOrigin"),
-                    cuisine=recipe_dict.get("cuisine"),
-                    requiresExtraIngredients=recipe_dict.get("requiresExtraIngredients", False),
-                    extraIngredientsNeeded=recipe_dict.get("extraIngredientsNeeded", [])
-                )
-                recipes.append(recipe)
+            recipes = [recipe_from_dict(recipe_dict) for recipe_dict in recipes_data]
             
+            await recipe_suggestions_cache.set(cache_key, [recipe.dict() for recipe in recipes])
             return RecipeSuggestionsResponse(recipes=recipes)
             
         except Exception as e:
@@ -933,35 +1367,40 @@ Return as JSON array with requiresExtraIngredients and extraIngredientsNeeded fi
 # SMART INGREDIENTS & NOTIFICATIONS ENDPOINTS
 # =============================================
 
+MAX_CANONICALIZE_BATCH_SIZE = 1000
+
+class CanonicalizeIngredientsRequest(BaseModel):
+    ingredients: List[str]
+    language: Optional[str] = "en"
+
+@api_router.post("/ingredients/canonicalize")
+async def canonicalize_ingredients(request: CanonicalizeIngredientsRequest):
+    """Map free-text ingredient names (any app language) to canonical ingredient ids"""
+    if len(request.ingredients) > MAX_CANONICALIZE_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CANONICALIZE_BATCH_SIZE} ingredients per batch")
+    language = request.language or "en"
+    return {"ingredients": [
+        {
+            "text": match.text,
+            "id": match.id,
+            "name": ingredient_canonicalizer.name(match.id, language) if match.id else None,
+            "confidence": match.confidence,
+            "method": match.method,
+        }
+        for match in ingredient_canonicalizer.lookup_many(request.ingredients)
+    ]}
+
 @api_router.post("/users/{user_id}/ingredients")
 async def save_user_ingredients(user_id: str, request: SaveIngredientsRequest):
     """Save or update user's available ingredients"""
     try:
-        existing = await db.user_ingredients.find_one({"userId": user_id})
-        
-        if request.append and existing:
-            # Append new ingredients (avoid duplicates)
-            current_ingredients = set(existing.get("ingredients", []))
-            new_ingredients = set(request.ingredients)
-            merged = list(current_ingredients.union(new_ingredients))
-            
-            await db.user_ingredients.update_one(
-                {"userId": user_id},
-                {"$set": {"ingredients": merged, "lastUpdated": datetime.utcnow()}}
-            )
-            return {"success": True, "ingredients": merged, "count": len(merged)}
+        if request.append:
+            # Add new ingredients, keeping existing order and skipping ones already there under any name
+            result = await pantry.add_ingredients(db, user_id, request.ingredients)
         else:
             # Replace all ingredients
-            await db.user_ingredients.update_one(
-                {"userId": user_id},
-                {"$set": {
-                    "userId": user_id,
-                    "ingredients": request.ingredients,
-                    "lastUpdated": datetime.utcnow()
-                }},
-                upsert=True
-            )
-            return {"success": True, "ingredients": request.ingredients, "count": len(request.ingredients)}
+            result = await pantry.replace_ingredients(db, user_id, request.ingredients)
+        return {"success": True, "ingredients": result["ingredients"], "count": len(result["ingredients"])}
         
     except Exception as e:
         logger.error(f"Error saving ingredients: {str(e)}")
@@ -985,27 +1424,27 @@ async def get_user_ingredients(user_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get ingredients: {str(e)}")
 
 @api_router.delete("/users/{user_id}/ingredients")
-async def clear_user_ingredients(user_id: str, ingredients_to_remove: Optional[List[str]] = None):
+async def clear_user_ingredients(
+    user_id: str,
+    ingredients_to_remove: Optional[List[str]] = Body(None, embed=True)
+):
     """Clear all or specific ingredients"""
     try:
         if ingredients_to_remove:
             # Remove specific ingredients
-            await db.user_ingredients.update_one(
-                {"userId": user_id},
-                {"$pull": {"ingredients": {"$in": ingredients_to_remove}}}
-            )
+            result = await pantry.remove_ingredients(db, user_id, ingredients_to_remove)
         else:
             # Clear all
-            await db.user_ingredients.update_one(
-                {"userId": user_id},
-                {"$set": {"ingredients": [], "lastUpdated": datetime.utcnow()}}
-            )
-        return {"success": True}
+            result = await pantry.replace_ingredients(db, user_id, [])
+        return {"success": True, "ingredients": result["ingredients"], "count": len(result["ingredients"])}
         
     except Exception as e:
         logger.error(f"Error clearing ingredients: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to clear ingredients: {str(e)}")
 
+NOTIFICATION_RECIPES = 3
+MIN_NOTIFICATION_RECIPES = 2
+
 @api_router.post("/users/{user_id}/smart-notification")
 async def get_smart_notification(user_id: str, request: SmartNotificationRequest):
     """
@@ -1014,9 +1453,15 @@ async def get_smart_notification(user_id: str, request: SmartNotificationRequest
     - What they've eaten today
     - Their available ingredients
     """
+    loader = RequestLoader(db, user_id, user_profiles)
     try:
+        # Independent reads go out together; today's totals too when the offset is known
+        loader.prefetch("user", "ingredients")
+        if request.tzOffset is not None:
+            loader.day_totals(today_key(normalize_tz_offset(request.tzOffset)))
+        
         # Get user goals
-        user = await db.users.find_one({"id": user_id})
+        user = await loader.user()
         if not user or not user.get("goals"):
             return SmartNotificationResponse(
                 message="Complete your profile to get personalized recommendations!",
@@ -1034,36 +1479,37 @@ async def get_smart_notification(user_id: str, request: SmartNotificationRequest
         goal_type = goals.get("goal", "maintain")
         
         # Get today's consumption
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        today_end = datetime.combine(date.today(), datetime.max.time())
-        
-        meals_today = await db.meals.find({
-            "userId": user_id,
-            "timestamp": {"$gte": today_start, "$lte": today_end}
-        }).to_list(100)
-        
-        calories_consumed = sum(meal.get("calories", 0) for meal in meals_today)
-        protein_consumed = sum(meal.get("protein", 0) for meal in meals_today)
-        carbs_consumed = sum(meal.get("carbs", 0) for meal in meals_today)
-        fats_consumed = sum(meal.get("fats", 0) for meal in meals_today)
+        tz_offset = await loader.tz_offset(request.tzOffset)
+        today = await loader.day_totals(today_key(tz_offset))
+        calories_consumed = today["calories"]
+        protein_consumed = today["protein"]
         
         calories_remaining = max(0, daily_calories - calories_consumed)
         protein_remaining = max(0, daily_protein - protein_consumed)
         
         # Get user's ingredients
-        ingredients_doc = await db.user_ingredients.find_one({"userId": user_id})
-        user_ingredients = ingredients_doc.get("ingredients", []) if ingredients_doc else []
+        user_ingredients = await loader.ingredients()
         has_ingredients = len(user_ingredients) > 0
         
-        # Generate smart recipe suggestions using AI
+        # Stored recipes the pantry covers come first; the model only fills in
         suggested_recipes = []
+        lang = request.language or "en"
         
         if has_ingredients and calories_remaining > 100:
+            matches = cookable_recipes.index.top(
+                ingredient_canonicalizer.keys(user_ingredients),
+                k=NOTIFICATION_RECIPES,
+                min_coverage=1.0,
+                language=lang,
+                max_calories=calories_remaining
+            )
+            suggested_recipes = [match.recipe.names[lang] for match in matches]
+        
+        if has_ingredients and calories_remaining > 100 and len(suggested_recipes) < MIN_NOTIFICATION_RECIPES:
             api_key = os.environ.get('EMERGENT_LLM_KEY')
             if api_key:
                 try:
                     # Language setup
-                    lang = request.language or "en"
                     lang_instruction = "Respond in Spanish." if lang == "es" else "Respond in English."
                     
                     goal_context = {
@@ -1102,13 +1548,13 @@ async def get_smart_notification(user_id: str, request: SmartNotificationRequest
                     elif "```" in response_text:
                         response_text = response_text.split("```")[1].split("```")[0].strip()
                     
-                    suggested_recipes = json.loads(response_text)
-                    if not isinstance(suggested_recipes, list):
-                        suggested_recipes = []
+                    generated = json.loads(response_text)
+                    if isinstance(generated, list):
+                        fill = [name for name in generated if isinstance(name, str) and name not in suggested_recipes]
+                        suggested_recipes += fill[:NOTIFICATION_RECIPES - len(suggested_recipes)]
                     
                 except Exception as e:
                     logger.error(f"Error generating recipe suggestions: {e}")
-                    suggested_recipes = []
         
         # Build message based on language
         if request.language == "es":
@@ -1157,29 +1603,31 @@ async def get_smart_notification(user_id: str, request: SmartNotificationRequest
     except Exception as e:
         logger.error(f"Error generating smart notification: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate notification: {str(e)}")
+    finally:
+        loader.close()
 
 @api_router.get("/users/{user_id}/nutrition-summary")
-async def get_nutrition_summary(user_id: str):
-    """Get comprehensive nutrition summary for today vs goals"""
+async def get_nutrition_summary(user_id: str, tz_offset: Optional[int] = None):
+    """Get comprehensive nutrition summary for today (in the user's timezone) vs goals"""
+    loader = RequestLoader(db, user_id, user_profiles)
     try:
+        # With an explicit offset the user and today's totals load concurrently
+        loader.prefetch("user")
+        if tz_offset is not None:
+            loader.day_totals(today_key(normalize_tz_offset(tz_offset)))
+        
         # Get user goals
-        user = await db.users.find_one({"id": user_id})
+        user = await loader.user()
         goals = user.get("goals", {}) if user else {}
         
         # Get today's consumption
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        today_end = datetime.combine(date.today(), datetime.max.time())
-        
-        meals_today = await db.meals.find({
-            "userId": user_id,
-            "timestamp": {"$gte": today_start, "$lte": today_end}
-        }).to_list(100)
-        
+        tz_offset = await loader.tz_offset(tz_offset)
+        today = await loader.day_totals(today_key(tz_offset))
         consumed = {
-            "calories": sum(meal.get("calories", 0) for meal in meals_today),
-            "protein": sum(meal.get("protein", 0) for meal in meals_today),
-            "carbs": sum(meal.get("carbs", 0) for meal in meals_today),
-            "fats": sum(meal.get("fats", 0) for meal in meals_today),
+            "calories": today["calories"],
+            "protein": today["protein"],
+            "carbs": today["carbs"],
+            "fats": today["fats"],
         }
         
         daily_goals = {
@@ -1209,18 +1657,97 @@ async def get_nutrition_summary(user_id: str):
             "goals": daily_goals,
             "remaining": remaining,
             "percentages": percentages,
-            "mealCount": len(meals_today),
+            "mealCount": today["mealCount"],
             "userGoal": goals.get("goal", "maintain")
         }
         
     except Exception as e:
         logger.error(f"Error getting nutrition summary: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get nutrition summary: {str(e)}")
+    finally:
+        loader.close()
+
+@api_router.get("/users/{user_id}/analytics/{period}")
+async def get_history_analytics(user_id: str, period: str, offset: int = 0, tz_offset: Optional[int] = None):
+    """
+    Calorie and macro history for a week (Monday-based) or calendar month.
+    offset selects the period relative to the current one (0 = current, -1 = previous).
+    Returns per-day and per-week series, totals, per-tracked-day averages and
+    goal adherence.
+    """
+    if period not in analytics.PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {list(analytics.PERIODS)}")
+    if offset > 0:
+        raise HTTPException(status_code=400, detail="offset can't point to a future period")
+    if not analytics.valid_offset(period, offset):
+        raise HTTPException(status_code=400, detail=f"offset can't reach back more than {analytics.MAX_PERIODS_BACK[period]} periods")
+    
+    try:
+        user = await user_profiles.get(user_id)
+        tz_offset = await resolve_tz_offset(user_id, tz_offset, user or {})
+        today = date.fromisoformat(today_key(tz_offset))
+        
+        return await analytics.history_analytics(
+            db, user_id, period, offset, today, (user or {}).get("goals")
+        )
+        
+    except Exception as e:
+        logger.error(f"Error getting history analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get history analytics: {str(e)}")
 
 # =============================================
 # RECIPE SEARCH ENDPOINT
 # =============================================
 
+async def generate_recipe_search(query: str, lang_instruction: str, api_key: str) -> list:
+    """Ask the LLM for 8 recipes matching a search query"""
+    chat = LlmChat(
+        api_key=api_key,
+        session_id=f"recipe_search_{query[:20]}",
+        system_message=f"""{lang_instruction}
+    
+        You are a culinary expert helping users find recipes.
+        When given a search query, generate 8 relevant recipes.
+    
+        Each recipe must include:
+        - id: unique string ID (use snake_case like "chicken_rice_123")
+        - name: Recipe name
+        - description: Brief appetizing description (1-2 sentences)
+        - ingredients: List of ingredients with quantities (simple strings)
+        - instructions: Step-by-step cooking instructions (array of clear steps)
+        - cookingTime: Total time in minutes
+        - servings: Number of servings
+        - calories: Estimated calories per serving
+        - protein: Protein in grams per serving
+        - carbs: Carbohydrates in grams per serving
+        - fats: Fats in grams per serving
+        - countryOfOrigin: Country where this dish originates
+        - cuisine: Type of cuisine
+    
+        Return ONLY a JSON array of 8 recipes. No explanations.
+        """
+    ).with_model("openai", "gpt-4o")
+    
+    user_message = UserMessage(
+        text=f"Find 8 recipes matching this search: '{query}'. Return as JSON array."
+    )
+    
+    response = await chat.send_message(user_message)
+    
+    try:
+        response_text = response.strip()
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0].strip()
+        
+        return json.loads(response_text)
+        
+    except Exception as e:
+        logger.error(f"Failed to parse recipe search: {e}")
+        raise HTTPException(status_code=500, detail="Failed to parse recipe search results")
+
+
 class RecipeSearchRequest(BaseModel):
     query: str
     userIngredients: Optional[List[str]] = []
@@ -1235,87 +1762,50 @@ async def search_recipes(request: RecipeSearchRequest):
     try:
         logger.info(f"Searching recipes for: {request.query}")
         
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="API key not configured")
-        
         # Language setup
         lang = request.language or "es"
         lang_instruction = "Respond ONLY in Spanish." if lang == "es" else "Respond ONLY in English."
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"recipe_search_{request.query[:20]}",
-            system_message=f"""{lang_instruction}
-            
-            You are a culinary expert helping users find recipes.
-            When given a search query, generate 8 relevant recipes.
-            
-            Each recipe must include:
-            - id: unique string ID (use snake_case like "chicken_rice_123")
-            - name: Recipe name
-            - description: Brief appetizing description (1-2 sentences)
-            - ingredients: List of ingredients with quantities (simple strings)
-            - instructions: Step-by-step cooking instructions (array of clear steps)
-            - cookingTime: Total time in minutes
-            - servings: Number of servings
-            - calories: Estimated calories per serving
-            - protein: Protein in grams per serving
-            - carbs: Carbohydrates in grams per serving
-            - fats: Fats in grams per serving
-            - countryOfOrigin: Country where this dish originates
-            - cuisine: Type of cuisine
+        # Stored recipes first; the model only fills what the corpus lacks
+        recipes_data = await recipe_corpus.search(db, request.query, lang)
+        source = "corpus"
+        if len(recipes_data) < recipe_corpus.RECIPES_PER_SEARCH:
+            # Then recipes with similar names or ingredients, which tolerates typos
+            found_ids = {recipe["id"] for recipe in recipes_data}
+            similar_ids = [
+                match.recipe_id for match in recipe_similarity.index.search(request.query, lang)
+                if match.recipe_id not in found_ids
+            ]
+            recipes_data += await recipe_corpus.get_recipes(
+                db, similar_ids[:recipe_corpus.RECIPES_PER_SEARCH - len(recipes_data)], lang
+            )
+        if len(recipes_data) < recipe_corpus.RECIPES_PER_SEARCH:
+            api_key = os.environ.get('EMERGENT_LLM_KEY')
+            if not api_key:
+                raise HTTPException(status_code=500, detail="API key not configured")
+            
+            # Generated recipes are shared; ingredient matching below is per request
+            cache_key = hash_key(lang, " ".join(request.query.lower().split()))
+            generated = await recipe_search_cache.get(cache_key)
+            if generated is None:
+                generated = await generate_recipe_search(request.query, lang_instruction, api_key)
+                await recipe_corpus.store_recipes(
+                    db, generated, lang, "search", query=request.query,
+                    canonicalizer=ingredient_canonicalizer, duplicate_of=recipe_similarity.index.duplicate_of
+                )
+                index_stored_recipes(generated, lang, "search")
+                await recipe_search_cache.set(cache_key, generated)
             
-            Return ONLY a JSON array of 8 recipes. No explanations.
-            """
-        ).with_model("openai", "gpt-4o")
-        
-        user_message = UserMessage(
-            text=f"Find 8 recipes matching this search: '{request.query}'. Return as JSON array."
-        )
-        
-        response = await chat.send_message(user_message)
+            stored_ids = {recipe["id"] for recipe in recipes_data}
+            fill = [recipe for recipe in generated if recipe.get("id") not in stored_ids]
+            recipes_data += fill[:recipe_corpus.RECIPES_PER_SEARCH - len(recipes_data)]
+            source = "ai"
         
-        import json
         try:
-            response_text = response.strip()
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            recipes_data = json.loads(response_text)
-            
-            # Calculate ingredient match for each recipe
-            user_ingredients_lower = [ing.lower().strip() for ing in request.userIngredients]
-            
-            for recipe in recipes_data:
-                recipe_ingredients = recipe.get("ingredients", [])
-                matching_count = 0
-                missing_ingredients = []
-                
-                for ing in recipe_ingredients:
-                    ing_lower = ing.lower()
-                    found = False
-                    for user_ing in user_ingredients_lower:
-                        if user_ing in ing_lower or ing_lower in user_ing:
-                            found = True
-                            matching_count += 1
-                            break
-                    if not found:
-                        # Extract just the main ingredient name for missing list
-                        missing_ingredients.append(ing)
-                
-                total_ingredients = len(recipe_ingredients)
-                recipe["matchCount"] = matching_count
-                recipe["totalIngredients"] = total_ingredients
-                recipe["matchPercentage"] = round((matching_count / total_ingredients * 100) if total_ingredients > 0 else 0)
-                recipe["missingIngredients"] = missing_ingredients[:5]  # Limit to 5 for UI
+            # Rank by how much of each recipe the user's pantry covers (see ingredient_match.py)
+            rank_recipes(recipes_data, request.userIngredients or [], ingredient_canonicalizer)
             
-            # Sort by match percentage (highest first)
-            recipes_data.sort(key=lambda r: r.get("matchPercentage", 0), reverse=True)
-            
-            return {"recipes": recipes_data, "query": request.query}
+            return {"recipes": recipes_data, "query": request.query, "source": source}
             
         except Exception as e:
             logger.error(f"Failed to parse recipe search: {e}")
@@ -1325,10 +1815,39 @@ async def search_recipes(request: RecipeSearchRequest):
         logger.error(f"Error searching recipes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to search recipes: {str(e)}")
 
+@api_router.get("/recipes/{recipe_id}/similar")
+async def similar_recipes(recipe_id: str, language: str = "es", limit: int = 6):
+    """Stored recipes most like this one by name and ingredients, most similar first"""
+    try:
+        stored = await recipe_corpus.get_recipes(db, [recipe_id], language)
+        if not stored:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        
+        matches = recipe_similarity.index.similar(stored[0], language, k=max(1, min(limit, 20)))
+        recipes = await recipe_corpus.get_recipes(db, [match.recipe_id for match in matches], language)
+        scores = {match.recipe_id: match.score for match in matches}
+        for recipe in recipes:
+            recipe["similarity"] = scores[recipe["id"]]
+        return {"recipeId": recipe_id, "recipes": recipes}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finding similar recipes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to find similar recipes: {str(e)}")
+
 # =============================================
 # FOOD/DRINK SEARCH ENDPOINT (AI-powered)
 # =============================================
 
+@api_router.get("/autocomplete")
+async def autocomplete_food(q: str = "", language: str = "es", limit: int = 8):
+    """
+    Typeahead suggestions for food and ingredient names in any app language,
+    answered from memory so the search box can call it on every keystroke
+    """
+    return {"query": q, "suggestions": autocomplete.index.suggest(q, language, limit)}
+
 class FoodSearchRequest(BaseModel):
     query: str
     language: Optional[str] = "es"
@@ -1337,11 +1856,18 @@ class FoodSearchRequest(BaseModel):
 async def search_food(request: FoodSearchRequest):
     """
     Search for any food or drink and get nutritional information
-    Uses AI to find accurate nutrition data for anything
+    Answers from the local food index when it has a confident match,
+    otherwise uses AI to find accurate nutrition data for anything
     """
     try:
         logger.info(f"Searching food/drink: {request.query}")
         
+        local_foods, confidence = food_index.search(request.query, request.language or "es")
+        source = "local" if confidence >= LOCAL_CONFIDENCE else "ai"
+        await search_query_writer.add(query_log_entry(request.query, request.language or "es", source))
+        if source == "local":
+            return {"foods": local_foods, "query": request.query, "source": "local"}
+        
         api_key = os.environ.get('EMERGENT_LLM_KEY')
         if not api_key:
             raise HTTPException(status_code=500, detail="API key not configured")
@@ -1349,6 +1875,11 @@ async def search_food(request: FoodSearchRequest):
         lang = request.language or "es"
         lang_instruction = "Respond ONLY in Spanish." if lang == "es" else "Respond ONLY in English."
         
+        cache_key = hash_key(lang, " ".join(request.query.lower().split()))
+        cached = await food_search_cache.get(cache_key)
+        if cached is not None:
+            return {"foods": cached, "query": request.query, "source": "ai"}
+        
         chat = LlmChat(
             api_key=api_key,
             session_id=f"food_search_{request.query[:20]}",
@@ -1398,8 +1929,9 @@ async def search_food(request: FoodSearchRequest):
                 response_text = response_text.split("```")[1].split("```")[0].strip()
             
             foods_data = json.loads(response_text)
+            await food_search_cache.set(cache_key, foods_data)
             
-            return {"foods": foods_data, "query": request.query}
+            return {"foods": foods_data, "query": request.query, "source": "ai"}
             
         except Exception as e:
             logger.error(f"Failed to parse food search: {e}")
@@ -1534,6 +2066,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def run_migrations():
+    # Ensures indexes and applies any pending schema migrations (see migrations.py)
+    await apply_migrations(db)
+    analysis_attempts_writer.start()
+    search_query_writer.start()
+    cache_invalidation_bus.start()
+    autocomplete.start()
+    cookable_recipes.start()
+    recipe_similarity.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await analysis_attempts_writer.close()
+    await search_query_writer.close()
+    await autocomplete.stop()
+    await cookable_recipes.stop()
+    await recipe_similarity.stop()
+    await cache_invalidation_bus.stop()
+    await cache_backend.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Change log backing delta sync of a user's meals.
+
+`meal_changes` holds one row per meal with the last operation applied to it
+("upsert" or "delete") and when it was logged (`updatedAt`, epoch ms).
+Clients keep an opaque cursor over (updatedAt, mealId); asking "what changed
+since my cursor" is one indexed range read, which is empty in the common
+case. Delete rows are the tombstones and expire after
+TOMBSTONE_RETENTION_DAYS; clients whose cursor is older than that are told
+to resync from scratch. An empty answer still moves the cursor up to the
+present, so clients that sync regularly never fall that far behind.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from timebuckets import now_ms
+
+CHANGES_COLLECTION = "meal_changes"
+TOMBSTONE_RETENTION_DAYS = 90
+
+# Changes newer than this are held back one round so writes whose timestamps
+# were taken before a concurrent sync read can't be skipped by its cursor
+SYNC_SETTLE_MS = 2000
+
+
+def _change_update(user_id: str, meal_id: str, op: str, updated_at: int) -> Tuple[dict, dict]:
+    fields = {"userId": user_id, "mealId": meal_id, "op": op, "updatedAt": updated_at}
+    if op == "delete":
+        update = {"$set": {**fields, "expireAt": datetime.utcnow() + timedelta(days=TOMBSTONE_RETENTION_DAYS)}}
+    else:
+        update = {"$set": fields, "$unset": {"expireAt": ""}}
+    return {"userId": user_id, "mealId": meal_id}, update
+
+
+async def record_upserts(db, meals: Iterable[dict]):
+    """
+    Log meals that were created or changed, as of now. Not the meals' own
+    updatedAt: a batch takes photo uploads, an insert and the rollups
+    between building its meals and getting here, easily more than
+    SYNC_SETTLE_MS, and a sync in between would already have been handed a
+    cursor past them.
+    """
+    updated_at = now_ms()
+    operations = [
+        UpdateOne(*_change_update(m["userId"], m["id"], "upsert", updated_at), upsert=True)
+        for m in meals
+    ]
+    if operations:
+        await db[CHANGES_COLLECTION].bulk_write(operations, ordered=False)
+
+
+async def record_delete(db, user_id: str, meal_id: str):
+    await db[CHANGES_COLLECTION].update_one(*_change_update(user_id, meal_id, "delete", now_ms()), upsert=True)
+
+
+async def changes_since(db, user_id: str, cursor: Optional[Tuple[int, str]], limit: int):
+    """
+    Changes after `cursor` in (updatedAt, mealId) order, up to `limit`.
+    Returns (changes, has_more, full_resync, position), where position is
+    the (updatedAt, mealId) to continue from: the last change returned, or
+    the settled present when there were none.
+    """
+    horizon = now_ms() - SYNC_SETTLE_MS
+    retention_start = now_ms() - TOMBSTONE_RETENTION_DAYS * 86400 * 1000
+    if cursor and cursor[0] < retention_start:
+        return [], False, True, None
+
+    query = {"userId": user_id, "updatedAt": {"$lte": horizon}}
+    if cursor:
+        updated_at, meal_id = cursor
+        query["updatedAt"]["$gte"] = updated_at
+        query["$or"] = [
+            {"updatedAt": {"$gt": updated_at}},
+            {"updatedAt": updated_at, "mealId": {"$gt": meal_id}}
+        ]
+
+    changes = await db[CHANGES_COLLECTION].find(
+        query, {"_id": 0, "mealId": 1, "op": 1, "updatedAt": 1}
+    ).sort([("updatedAt", 1), ("mealId", 1)]).limit(limit + 1).to_list(limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    if changes:
+        position = (changes[-1]["updatedAt"], changes[-1]["mealId"])
+    else:
+        # Everything up to the horizon has been seen; "" sorts before every meal id
+        position = max(tuple(cursor), (horizon, "")) if cursor else (horizon, "")
+    return changes, has_more, False, position
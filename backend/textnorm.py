@@ -0,0 +1,58 @@
+"""
+Text normalization shared by the search and matching indexes.
+
+Everything is compared in folded form: accents stripped, casefolded,
+punctuation turned into spaces. stem() is a deliberately crude plural
+reducer ("tomates" and "tomate" become "tomat", "tomatoes" and "tomato"
+become "tomato", "berries" and "berry" become "berri"); it only has to map
+related forms of a word to the same string, not produce real words.
+"""
+import re
+import unicodedata
+from typing import List, Set
+
+MIN_STEM_LENGTH = 3
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+# Connectives that carry no meaning in food names ("pechuga de pollo", "mac and cheese",
+# "jus d'orange"), in the six app languages
+STOPWORDS = frozenset({
+    "a", "al", "and", "au", "aux", "com", "con", "d", "da", "das", "de", "dei", "del", "della",
+    "der", "des", "di", "die", "do", "dos", "du", "e", "el", "em", "en", "et", "il", "l", "la",
+    "las", "le", "les", "lo", "los", "mit", "o", "of", "or", "ou", "the", "to", "un", "una",
+    "und", "with", "y"
+})
+
+
+def fold(text: str) -> str:
+    text = str(text)
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", text.casefold()).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    return fold(text).split()
+
+
+def stem(token: str) -> str:
+    if len(token) > MIN_STEM_LENGTH and token.endswith("s"):
+        token = token[:-1]
+    if len(token) > MIN_STEM_LENGTH and token.endswith("e"):
+        token = token[:-1]
+    if len(token) > MIN_STEM_LENGTH and token.endswith("y"):
+        token = token[:-1] + "i"
+    return token
+
+
+def content_stems(text: str) -> List[str]:
+    """Stems of the meaningful words, in order, without duplicates"""
+    stems = (stem(token) for token in tokenize(text) if token not in STOPWORDS)
+    return list(dict.fromkeys(stems))
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of the folded text, padded so short words still have some"""
+    padded = f"  {fold(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
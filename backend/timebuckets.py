@@ -0,0 +1,60 @@
+"""
+Per-user day bucketing for meal timestamps.
+
+Meal timestamps are stored as UTC epoch milliseconds. Each meal also carries
+the user's UTC offset at the time it was logged (`tzOffset`, minutes east of
+UTC, i.e. the negation of JavaScript's Date.getTimezoneOffset()) and the
+resulting local day key (`day`, YYYY-MM-DD). "Today" queries then become an
+equality lookup on the day key, or an epoch-ms range from day_bounds_ms().
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple, Union
+
+# Offsets in the wild range from UTC-12:00 to UTC+14:00
+MIN_TZ_OFFSET = -12 * 60
+MAX_TZ_OFFSET = 14 * 60
+
+# Anything below this is a timestamp in seconds (1e12 ms is Sep 2001)
+_MS_THRESHOLD = 10 ** 12
+
+
+def normalize_tz_offset(tz_offset: Optional[int]) -> int:
+    """Clamp a client-supplied offset to a real-world range; unknown means UTC"""
+    if tz_offset is None:
+        return 0
+    return max(MIN_TZ_OFFSET, min(MAX_TZ_OFFSET, int(tz_offset)))
+
+
+def now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def normalize_timestamp_ms(timestamp: Union[int, float, datetime, None]) -> int:
+    """Coerce seconds, milliseconds or datetimes (naive means UTC) to epoch ms"""
+    if timestamp is None:
+        return now_ms()
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return int(timestamp.timestamp() * 1000)
+    if timestamp < _MS_THRESHOLD:
+        timestamp *= 1000
+    return int(timestamp)
+
+
+def local_day(timestamp_ms: int, tz_offset: int = 0) -> str:
+    """Local day key a timestamp falls into for a user at the given offset"""
+    local = datetime.fromtimestamp(timestamp_ms / 1000, timezone.utc) + timedelta(minutes=tz_offset)
+    return local.date().isoformat()
+
+
+def today_key(tz_offset: int = 0) -> str:
+    return local_day(now_ms(), tz_offset)
+
+
+def day_bounds_ms(day: str, tz_offset: int = 0) -> Tuple[int, int]:
+    """[start, end) epoch-ms range covering a local day"""
+    local_midnight = datetime.combine(date.fromisoformat(day), datetime.min.time(), timezone.utc)
+    start = local_midnight - timedelta(minutes=tz_offset)
+    start_ms = int(start.timestamp() * 1000)
+    return start_ms, start_ms + 86400 * 1000
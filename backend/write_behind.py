@@ -0,0 +1,114 @@
+"""
+Write-behind batching for bookkeeping inserts.
+
+Events that nothing reads back within the same request (analysis attempts,
+query logs, usage events) are queued in memory and written with insert_many
+once MAX_BATCH_SIZE events are waiting or FLUSH_INTERVAL seconds have passed,
+keeping those writes off the request's critical path. At most max_pending
+events are held: when MongoDB falls behind, add() waits for room instead of
+growing memory. close() flushes what's left on shutdown.
+
+Readers see buffered events up to flush_interval late.
+"""
+import asyncio
+import logging
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 10000
+MAX_RETRY_DELAY = 30.0
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING
+    ):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._room = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._retry_delay = 0.0
+        self._task = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, doc: dict):
+        """Queue a document for insertion; waits only while the buffer is full"""
+        if self._closed:
+            raise RuntimeError(f"Write-behind buffer for {self.collection.name} is closed")
+        self.start()
+
+        async with self._room:
+            await self._room.wait_for(lambda: len(self._pending) < self.max_pending)
+            self._pending.append(doc)
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval + self._retry_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write everything pending. Returns False if MongoDB failed and events were kept."""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch_size]
+                try:
+                    # insert_many sets _id on the documents, so a retried batch
+                    # reports already-written events as duplicates
+                    await self.collection.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                    if errors:
+                        logger.error(f"Dropped {len(errors)} {self.collection.name} events: {errors[0].get('errmsg')}")
+                except Exception as e:
+                    self._retry_delay = min(MAX_RETRY_DELAY, max(self.flush_interval, self._retry_delay * 2))
+                    logger.warning(
+                        f"Couldn't flush {len(self._pending)} {self.collection.name} events, "
+                        f"retrying in {self._retry_delay:.0f}s: {e}"
+                    )
+                    return False
+
+                del self._pending[:len(batch)]
+                self._retry_delay = 0.0
+                async with self._room:
+                    self._room.notify_all()
+            return True
+
+    async def close(self):
+        """Stop the background flusher and write out remaining events"""
+        self._closed = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        for _ in range(SHUTDOWN_FLUSH_ATTEMPTS):
+            if await self.flush():
+                return
+            await asyncio.sleep(1)
+        logger.error(f"Lost {len(self._pending)} {self.collection.name} events on shutdown")
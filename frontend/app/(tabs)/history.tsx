@@ -38,6 +38,8 @@ interface Meal {
   carbs: number;
   fats: number;
   photoBase64?: string;
+  photoUrl?: string; // Served by /api/photos/{photoId}
+  thumbnailUrl?: string;
   timestamp: string | number; // Can be ISO string or Unix timestamp
   portions?: number;
   isCooked?: boolean;
@@ -139,7 +141,7 @@ export default function HistoryScreen() {
       // Load from API
       const [mealsResponse, totalsResponse] = await Promise.all([
         fetch(`${API_URL}/api/meals/${userId}`),
-        fetch(`${API_URL}/api/meals/${userId}/daily-totals`),
+        fetch(`${API_URL}/api/meals/${userId}/daily-totals?tz_offset=${-new Date().getTimezoneOffset()}`),
       ]);
 
       const mealsData = await mealsResponse.json();
@@ -423,12 +425,12 @@ export default function HistoryScreen() {
       onPress={() => openMealDetail(meal)}
       activeOpacity={0.7}
     >
-      {meal.icon && !meal.photoBase64 && (
+      {meal.icon && !meal.photoBase64 && !meal.thumbnailUrl && (
         <Text style={styles.mealIcon}>{meal.icon}</Text>
       )}
-      {meal.photoBase64 && (
+      {(meal.thumbnailUrl || meal.photoBase64) && (
         <Image
-          source={{ uri: `data:image/jpeg;base64,${meal.photoBase64}` }}
+          source={{ uri: meal.thumbnailUrl ? `${API_URL}${meal.thumbnailUrl}` : `data:image/jpeg;base64,${meal.photoBase64}` }}
           style={styles.mealImage}
         />
       )}
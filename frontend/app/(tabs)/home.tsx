@@ -28,7 +28,7 @@ export default function HomeScreen() {
   const checkTodayCount = useCallback(async () => {
     if (!userId) return;
     try {
-      const response = await fetch(`${API_URL}/api/analysis-count/${userId}/today`);
+      const response = await fetch(`${API_URL}/api/analysis-count/${userId}/today?tz_offset=${-new Date().getTimezoneOffset()}`);
       const data = await response.json();
       console.log('[Home] Today analysis count:', data.count);
       setTodayCount(data.count);
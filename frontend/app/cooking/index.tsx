@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   View,
   Text,
@@ -26,6 +26,7 @@ import { getIngredientsByCategory, searchIngredients, getTotalIngredientsCount }
 import { saveIngredients, getRememberedIngredients } from '../../src/services/ingredients';
 import { refreshSmartNotifications } from '../../src/services/notifications';
 import { getUserName } from '../../src/services/nutritionCoach';
+import { IDEMPOTENCY_HEADER, RequestIntent, requestIntent } from '../../src/services/idempotency';
 
 const API_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 const { width, height } = Dimensions.get('window');
@@ -43,6 +44,8 @@ export default function CookingScreen() {
   const [searchQuery, setSearchQuery] = useState('');
   const [recipes, setRecipes] = useState<any[]>([]);
   const [isLoadingRecipes, setIsLoadingRecipes] = useState(false);
+  // Unfinished recipe suggestions request; asking again reuses its Idempotency-Key
+  const suggestionsIntent = useRef<RequestIntent | null>(null);
   const [todayCookingCount, setTodayCookingCount] = useState(0);
   const [expandedCategories, setExpandedCategories] = useState<string[]>([]);
   const [showConfirmModal, setShowConfirmModal] = useState(false);
@@ -286,19 +289,26 @@ export default function CookingScreen() {
       const healthConditions = healthConditionsStr ? JSON.parse(healthConditionsStr) : ['none'];
       const foodAllergies = foodAllergiesStr ? JSON.parse(foodAllergiesStr) : [];
 
+      const payload = {
+        userId,
+        ingredients: selectedIngredients,
+        language: currentLanguage,
+        healthConditions: healthConditions,
+        foodAllergies: foodAllergies,
+      };
+      const intent = requestIntent(suggestionsIntent.current, payload);
+      suggestionsIntent.current = intent;
       const response = await fetch(`${API_URL}/api/recipe-suggestions`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          userId,
-          ingredients: selectedIngredients,
-          language: currentLanguage,
-          healthConditions: healthConditions,
-          foodAllergies: foodAllergies,
-        }),
+        headers: { 'Content-Type': 'application/json', [IDEMPOTENCY_HEADER]: intent.key },
+        body: JSON.stringify(payload),
       });
+      if (!response.ok) {
+        throw new Error(`Server error: ${response.status}`);
+      }
 
       const data = await response.json();
+      suggestionsIntent.current = null;
       setRecipes(data.recipes || []);
       setShowLoadingScreen(false);
       setMode('results');
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import {
   View,
   Text,
@@ -20,6 +20,7 @@ import { useRouter } from 'expo-router';
 import { useTranslation } from 'react-i18next';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { updateDailyCalories } from '../../src/services/nutritionCoach';
+import { IDEMPOTENCY_HEADER, RequestIntent, requestIntent } from '../../src/services/idempotency';
 
 // API Food Item type (from external search)
 interface ApiFoodItem {
@@ -39,6 +40,15 @@ interface ApiFoodItem {
   icon: string;
 }
 
+// Typeahead suggestion (from /api/autocomplete)
+interface FoodSuggestion {
+  id: string;
+  kind: 'food' | 'ingredient';
+  name: string;
+  matched?: string;
+  icon: string | null;
+}
+
 // Fat types with calories per tablespoon
 const FAT_TYPES = [
   { id: 'none', es: 'Sin grasa', en: 'No fat', caloriesPerTbsp: 0, icon: '🚫' },
@@ -65,6 +75,9 @@ export default function TrackFoodScreen() {
   const [portions, setPortions] = useState(1);
   const [customPortions, setCustomPortions] = useState('');
   const [showCustomPortions, setShowCustomPortions] = useState(false);
+  // Unfinished analysis and save requests; retries reuse their Idempotency-Key
+  const analysisIntent = useRef<RequestIntent | null>(null);
+  const saveIntent = useRef<RequestIntent | null>(null);
   
   // Search state
   const [searchQuery, setSearchQuery] = useState('');
@@ -72,6 +85,8 @@ export default function TrackFoodScreen() {
   const [selectedFood, setSelectedFood] = useState<ApiFoodItem | null>(null);
   const [foodPortions, setFoodPortions] = useState(1);
   const [isSearching, setIsSearching] = useState(false);
+  const [suggestions, setSuggestions] = useState<FoodSuggestion[]>([]);
+  const latestSuggestQuery = useRef('');
   
   // Fat selector state for search
   const [selectedFatType, setSelectedFatType] = useState('none');
@@ -108,6 +123,8 @@ export default function TrackFoodScreen() {
   // Search functions - using external API
   const handleSearch = async (query: string) => {
     setSearchQuery(query);
+    setSuggestions([]);
+    latestSuggestQuery.current = '';
     
     if (query.length < 2) {
       setSearchResults([]);
@@ -139,26 +156,32 @@ export default function TrackFoodScreen() {
     }
   };
 
-  // Debounce search to avoid too many API calls
-  const [searchTimeout, setSearchTimeout] = useState<ReturnType<typeof setTimeout> | null>(null);
-  
-  const debouncedSearch = (query: string) => {
+  // Typeahead: cheap in-memory suggestions on every keystroke; the full
+  // search runs when the user picks a suggestion or submits
+  const handleQueryChange = async (query: string) => {
     setSearchQuery(query);
+    setSearchResults([]);
+    latestSuggestQuery.current = query;
     
-    if (searchTimeout) {
-      clearTimeout(searchTimeout);
-    }
-    
-    if (query.length < 2) {
-      setSearchResults([]);
+    if (query.trim().length === 0) {
+      setSuggestions([]);
       return;
     }
     
-    const timeout = setTimeout(() => {
-      handleSearch(query);
-    }, 400); // Wait 400ms after user stops typing
-    
-    setSearchTimeout(timeout);
+    try {
+      const params = new URLSearchParams({ q: query, language: i18n.language });
+      const response = await fetch(`${API_URL}/api/autocomplete?${params}`);
+      if (!response.ok) {
+        throw new Error('Autocomplete failed');
+      }
+      const data = await response.json();
+      // Ignore answers to keystrokes the user has already typed past
+      if (latestSuggestQuery.current === query) {
+        setSuggestions(data.suggestions || []);
+      }
+    } catch (error) {
+      console.error('Autocomplete error:', error);
+    }
   };
 
   // Search for edit ingredient replacement
@@ -430,16 +453,16 @@ export default function TrackFoodScreen() {
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 60000); // 60 second timeout
     
+    const payload = { userId, imageBase64: base64Image, language: i18n.language };
+    const intent = requestIntent(analysisIntent.current, payload);
+    analysisIntent.current = intent;
+    
     try {
       console.log('Starting food analysis...');
       const response = await fetch(`${API_URL}/api/analyze-food`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          userId,
-          imageBase64: base64Image,
-          language: i18n.language,
-        }),
+        headers: { 'Content-Type': 'application/json', [IDEMPOTENCY_HEADER]: intent.key },
+        body: JSON.stringify(payload),
         signal: controller.signal,
       });
 
@@ -461,6 +484,7 @@ export default function TrackFoodScreen() {
       }
       
       console.log('Analysis successful:', data.dishName);
+      analysisIntent.current = null;
       setAnalysisResult(data);
     } catch (error: any) {
       console.error('Failed to analyze food:', error);
@@ -492,25 +516,23 @@ export default function TrackFoodScreen() {
       const reader = new FileReader();
       
       reader.onloadend = async () => {
-        const base64 = reader.result as string;
-        const base64Data = base64.split(',')[1];
-
-        const fatType = FAT_TYPES.find(f => f.id === photoFatType);
-        const fatCalories = getPhotoFatCalories();
-        
-        // Calculate added ingredients calories
-        const addedCalories = addedIngredients.reduce((sum, ing) => sum + ing.calories, 0);
-        const addedProtein = addedIngredients.reduce((sum, ing) => sum + ing.protein, 0);
-        const addedCarbs = addedIngredients.reduce((sum, ing) => sum + ing.carbs, 0);
-        const addedFats = addedIngredients.reduce((sum, ing) => sum + ing.fats, 0);
-        
-        const totalCalories = getAdjustedValue(analysisResult.calories) + fatCalories + addedCalories;
-
-        // Save with adjusted values based on portions, fat and added ingredients
-        await fetch(`${API_URL}/api/meals`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
+        try {
+          const base64 = reader.result as string;
+          const base64Data = base64.split(',')[1];
+
+          const fatType = FAT_TYPES.find(f => f.id === photoFatType);
+          const fatCalories = getPhotoFatCalories();
+          
+          // Calculate added ingredients calories
+          const addedCalories = addedIngredients.reduce((sum, ing) => sum + ing.calories, 0);
+          const addedProtein = addedIngredients.reduce((sum, ing) => sum + ing.protein, 0);
+          const addedCarbs = addedIngredients.reduce((sum, ing) => sum + ing.carbs, 0);
+          const addedFats = addedIngredients.reduce((sum, ing) => sum + ing.fats, 0);
+          
+          const totalCalories = getAdjustedValue(analysisResult.calories) + fatCalories + addedCalories;
+
+          // Save with adjusted values based on portions, fat and added ingredients
+          const payload = {
             userId,
             photoBase64: base64Data,
             dishName: analysisResult.dishName,
@@ -521,7 +543,6 @@ export default function TrackFoodScreen() {
             ingredients: [...analysisResult.ingredients, ...addedIngredients.map(i => i.name)],
             warnings: analysisResult.warnings,
             portions: portions,
-            timestamp: Date.now(), // Send local timestamp from device
             // Fat tracking
             fatType: photoFatType,
             fatTypeName: fatType ? (i18n.language === 'es' ? fatType.es : fatType.en) : null,
@@ -529,14 +550,33 @@ export default function TrackFoodScreen() {
             fatCalories: fatCalories,
             // Added ingredients
             addedIngredients: addedIngredients,
-          }),
-        });
-
-        // Update daily calories (with fat and added ingredients included)
-        await updateDailyCalories(totalCalories);
-
-        Alert.alert(t('common.success'), t('trackFood.mealSaved'));
-        router.back();
+          };
+          // A double tap or a retry of the same meal is the same request, with the same key and timestamp
+          const intent = requestIntent(saveIntent.current, payload);
+          saveIntent.current = intent;
+          const saved = await fetch(`${API_URL}/api/meals`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', [IDEMPOTENCY_HEADER]: intent.key },
+            body: JSON.stringify({
+              ...payload,
+              timestamp: intent.createdAt, // Send local timestamp from device
+              tzOffset: -new Date(intent.createdAt).getTimezoneOffset(), // Minutes east of UTC, for "today" bucketing
+            }),
+          });
+          if (!saved.ok) {
+            throw new Error(`Server error: ${saved.status}`);
+          }
+          saveIntent.current = null;
+
+          // Update daily calories (with fat and added ingredients included)
+          await updateDailyCalories(totalCalories);
+
+          Alert.alert(t('common.success'), t('trackFood.mealSaved'));
+          router.back();
+        } catch (error) {
+          console.error('Failed to save meal:', error);
+          Alert.alert(t('trackFood.saveFailed'), t('trackFood.saveFailedMessage'));
+        }
       };
       
       reader.readAsDataURL(blob);
@@ -802,11 +842,13 @@ export default function TrackFoodScreen() {
             placeholder={i18n.language === 'es' ? 'Buscar: daiquiri, pizza, sushi...' : 'Search: daiquiri, pizza, sushi...'}
             placeholderTextColor={theme.textMuted}
             value={searchQuery}
-            onChangeText={debouncedSearch}
+            onChangeText={handleQueryChange}
+            onSubmitEditing={() => handleSearch(searchQuery)}
+            returnKeyType="search"
             autoFocus
           />
           {searchQuery.length > 0 && (
-            <TouchableOpacity onPress={() => { setSearchQuery(''); setSearchResults([]); }}>
+            <TouchableOpacity onPress={() => { handleQueryChange(''); }}>
               <Ionicons name="close-circle" size={20} color={theme.textMuted} />
             </TouchableOpacity>
           )}
@@ -819,6 +861,28 @@ export default function TrackFoodScreen() {
               {i18n.language === 'es' ? 'Buscando...' : 'Searching...'}
             </Text>
           </View>
+        ) : suggestions.length > 0 ? (
+          <FlatList
+            data={suggestions}
+            keyExtractor={(item) => `${item.kind}:${item.id}`}
+            keyboardShouldPersistTaps="handled"
+            renderItem={({ item }) => (
+              <TouchableOpacity
+                style={[styles.suggestionItem, { borderBottomColor: theme.border }]}
+                onPress={() => handleSearch(item.name)}
+              >
+                <Text style={styles.suggestionIcon}>{item.icon || '🍽️'}</Text>
+                <Text style={[styles.suggestionName, { color: theme.text }]}>
+                  {item.name}
+                  {item.matched ? (
+                    <Text style={{ color: theme.textMuted }}>  ({item.matched})</Text>
+                  ) : null}
+                </Text>
+                <Ionicons name="arrow-forward" size={16} color={theme.textMuted} />
+              </TouchableOpacity>
+            )}
+            contentContainerStyle={styles.searchResultsList}
+          />
         ) : searchResults.length > 0 ? (
           <FlatList
             data={searchResults}
@@ -2000,6 +2064,20 @@ const styles = StyleSheet.create({
     paddingHorizontal: 16,
     paddingBottom: 20,
   },
+  suggestionItem: {
+    flexDirection: 'row',
+    alignItems: 'center',
+    paddingVertical: 12,
+    borderBottomWidth: StyleSheet.hairlineWidth,
+    gap: 12,
+  },
+  suggestionIcon: {
+    fontSize: 22,
+  },
+  suggestionName: {
+    flex: 1,
+    fontSize: 16,
+  },
   foodItem: {
     flexDirection: 'row',
     alignItems: 'center',
@@ -0,0 +1,34 @@
+/**
+ * Idempotency Keys
+ * The server replays the first response for repeated requests carrying the
+ * same Idempotency-Key, so a POST retried over a flaky connection doesn't
+ * save a meal twice or pay for a second analysis
+ */
+
+export const IDEMPOTENCY_HEADER = 'Idempotency-Key';
+
+export function newIdempotencyKey(): string {
+  const random = () => Math.random().toString(36).slice(2, 10);
+  return `${Date.now().toString(36)}-${random()}${random()}`;
+}
+
+/**
+ * One logical request (analyze this photo, save this meal) that may take
+ * several attempts. Keep it in a ref while attempts fail and drop it once one
+ * succeeds; createdAt is the moment the user first asked, so retries send the
+ * same timestamp and the server sees the same request.
+ */
+export interface RequestIntent {
+  key: string;
+  content: string;
+  createdAt: number;
+}
+
+// The unfinished intent if the content is unchanged (a double tap or retry), else a new one
+export function requestIntent(current: RequestIntent | null, content: unknown): RequestIntent {
+  const serialized = JSON.stringify(content);
+  if (current && current.content === serialized) {
+    return current;
+  }
+  return { key: newIdempotencyKey(), content: serialized, createdAt: Date.now() };
+}
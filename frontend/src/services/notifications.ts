@@ -179,7 +179,7 @@ async function getSmartNotificationContent(
       const response = await fetch(`${API_URL}/api/users/${userId}/smart-notification`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ userId, mealType, language }),
+        body: JSON.stringify({ userId, mealType, language, tzOffset: -new Date().getTimezoneOffset() }),
         signal: controller.signal,
       });
 
@@ -0,0 +1,25 @@
+from bundled_data import exported_constant, ingredient_id, stale_files
+
+
+def test_bundled_data_matches_frontend_sources():
+    assert stale_files() == []
+
+
+def test_exported_constant_reads_ts_literals():
+    source = """
+    // comment
+    export const ITEMS: Item[] = [
+      { id: 'za', name: { en: 'Za\\'atar', es: "Za'atar" }, calories: 5, fats: 0.5, drink: false },
+      /* trailing comma */ { id: 'b', name: { en: 'B', es: 'B' }, calories: -1, },
+    ];
+    export const OTHER = 1;
+    """
+    assert exported_constant(source, "ITEMS") == [
+        {"id": "za", "name": {"en": "Za'atar", "es": "Za'atar"}, "calories": 5, "fats": 0.5, "drink": False},
+        {"id": "b", "name": {"en": "B", "es": "B"}, "calories": -1},
+    ]
+
+
+def test_ingredient_id():
+    assert ingredient_id("Cilantro / Coriander") == "cilantro_coriander"
+    assert ingredient_id("Jalapeño") == "jalapeno"
@@ -0,0 +1,72 @@
+import asyncio
+
+from canonical import default_canonicalizer
+from cookable import CookableRefresher, coverage_ids
+from recipe_corpus import RECIPES_COLLECTION
+
+
+def refresher_with(recipes, source):
+    refresher = CookableRefresher(db=None, canonicalizer=default_canonicalizer())
+    refresher.add(recipes, "en", source)
+    return refresher
+
+
+def test_coverage_counts_exact_names_only():
+    ids = coverage_ids(["1 cup almond milk", "2 tomatoes", "1 tsp garlic powder", "2 eggs"])
+    assert ids == ["tomato", "eggs"]
+
+
+def test_staple_lines_count_as_staples():
+    assert coverage_ids(["salt and pepper to taste", "Sal y pimienta al gusto"]) == ["salt"]
+    assert coverage_ids(["3 tbsp sesame oil"]) == ["sesame_oil"]
+
+
+def test_pantry_with_milk_does_not_cover_almond_milk():
+    recipes = [
+        {"id": "rcp_shake", "name": "Shake", "ingredients": ["1 cup almond milk", "1 banana"]},
+        {"id": "rcp_latte", "name": "Latte", "ingredients": ["1 cup milk", "1 banana", "salt to taste"]},
+    ]
+    index = refresher_with(recipes, "suggestions").index
+    matches = index.top(["milk", "banana"], min_coverage=1.0)
+    assert [match.recipe.recipe_id for match in matches] == ["rcp_latte"]
+
+
+def test_search_results_stay_out_of_the_index():
+    recipes = [{"id": "rcp_toast", "name": "Toast", "ingredients": ["2 slices bread"]}]
+    assert len(refresher_with(recipes, "search").index) == 0
+    assert len(refresher_with(recipes, "suggestions").index) == 1
+
+
+class SlowRecipes:
+    """A recipes collection whose find() waits for `release` before yielding its docs"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.release = asyncio.Event()
+
+    def find(self, query, projection):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self.release.wait()
+        for doc in self.docs:
+            yield doc
+
+
+def test_recipes_added_during_a_refresh_survive_it():
+    stored = {"recipeId": "rcp_toast", "language": "en", "name": "Toast", "ingredients": ["2 slices bread"]}
+    added = {"id": "rcp_salad", "name": "Salad", "ingredients": ["2 tomatoes"]}
+
+    async def interleave():
+        recipes = SlowRecipes([stored])
+        refresher = CookableRefresher({RECIPES_COLLECTION: recipes}, canonicalizer=default_canonicalizer())
+        refreshing = asyncio.create_task(refresher.refresh())
+        await asyncio.sleep(0)
+        refresher.add([added], "en", "suggestions")
+        recipes.release.set()
+        await refreshing
+        return refresher.index
+
+    index = asyncio.run(interleave())
+    assert len(index) == 2
+    assert [match.recipe.recipe_id for match in index.top(["tomato"])] == ["rcp_salad"]
@@ -0,0 +1,40 @@
+from pymongo import UpdateMany, UpdateOne
+
+from daily_needs import FORMULA_VERSION, calculate_daily_needs, target_updates
+
+GOALS = {"age": 30, "height": 175, "weight": 70, "activityLevel": "moderate", "goal": "maintain", "gender": "male"}
+OUTDATED = {"goals.formulaVersion": {"$ne": FORMULA_VERSION}}
+
+
+def current_targets(goals):
+    needs = calculate_daily_needs(
+        goals["age"], goals["height"], goals["weight"], goals["activityLevel"], goals["goal"], goals["gender"]
+    )
+    return {
+        "dailyCalories": needs["calories"], "dailyProtein": needs["protein"],
+        "dailyCarbs": needs["carbs"], "dailyFats": needs["fats"],
+    }
+
+
+def test_only_changed_targets_are_rewritten():
+    users = [
+        {"_id": 1, "goals": {**GOALS, "dailyCalories": 1}},
+        {"_id": 2, "goals": {**GOALS, **current_targets(GOALS)}},
+        {"_id": 3, "goals": dict(GOALS, goal="lose")},
+    ]
+    one, other, rest = target_updates(users)
+    assert isinstance(one, UpdateOne) and isinstance(other, UpdateOne)
+    assert one._filter == {"_id": 1, **OUTDATED}
+    assert one._doc["$set"] == {
+        **{f"goals.{field}": value for field, value in current_targets(GOALS).items()},
+        "goals.formulaVersion": FORMULA_VERSION,
+    }
+    assert other._filter == {"_id": 3, **OUTDATED}
+    assert isinstance(rest, UpdateMany)
+    assert rest._filter == {"_id": {"$in": [2]}, **OUTDATED}
+    assert rest._doc == {"$set": {"goals.formulaVersion": FORMULA_VERSION}}
+
+
+def test_unchanged_chunk_is_one_update():
+    users = [{"_id": n, "goals": {**GOALS, **current_targets(GOALS)}} for n in range(3)]
+    assert len(target_updates(users)) == 1
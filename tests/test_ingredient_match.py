@@ -0,0 +1,32 @@
+from canonical import default_canonicalizer
+from ingredient_match import PantryMatcher
+
+
+def covered(pantry, ingredients, **options):
+    matcher = PantryMatcher(pantry, default_canonicalizer(), **options)
+    return [ingredient for ingredient in ingredients if matcher.has(ingredient)]
+
+
+def test_products_do_not_cover_what_they_contain():
+    pantry = ["almond milk", "garlic powder", "chicken stock"]
+    ingredients = ["milk", "garlic", "1 chicken breast", "pechuga de pollo", "leche entera"]
+    assert covered(pantry, ingredients) == []
+
+
+def test_ingredients_do_not_cover_products_made_from_them():
+    assert covered(["garlic", "milk"], ["1 tsp garlic powder", "1 cup almond milk"]) == []
+
+
+def test_products_cover_themselves():
+    pantry = ["almond milk", "garlic powder"]
+    assert covered(pantry, ["1 tsp garlic powder", "200 ml almond milk"]) == ["1 tsp garlic powder", "200 ml almond milk"]
+
+
+def test_exact_names_match_across_languages():
+    assert covered(["pollo", "tomates"], ["chicken", "3 tomatoes, diced"]) == ["chicken", "3 tomatoes, diced"]
+
+
+def test_allergies_catch_anything_that_may_contain_them():
+    assert covered(["peanut"], ["2 tbsp peanut butter", "cacahuetes"], exact=False) == [
+        "2 tbsp peanut butter", "cacahuetes"
+    ]
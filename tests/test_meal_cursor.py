@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from meal_cursor import decode_meal_cursor, encode_meal_cursor
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    cursor = encode_meal_cursor(1718000000000, "meal-1")
+    assert "=" not in cursor
+    assert decode_meal_cursor(cursor) == (1718000000000, "meal-1")
+
+
+@pytest.mark.parametrize("value", [
+    [{"$ne": None}, "meal-1"],
+    ["1718000000000", "meal-1"],
+    [True, "meal-1"],
+    [1.5, "meal-1"],
+    [1718000000000, {"$gt": ""}],
+    [1718000000000],
+    {"timestamp": 1, "id": "meal-1"},
+])
+def test_rejects_wrong_types(value):
+    with pytest.raises(HTTPException) as raised:
+        decode_meal_cursor(raw_cursor(value))
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm90IGpzb24"])
+def test_rejects_garbage(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_meal_cursor(cursor)
+    assert raised.value.status_code == 400
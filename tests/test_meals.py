@@ -0,0 +1,23 @@
+from meals import batch_meals
+
+ITEM = {
+    "photoBase64": "aGVsbG8=", "dishName": "Paella", "ingredients": ["rice", "shrimp"],
+    "calories": 450.5, "protein": 20.5, "carbs": 55, "fats": 12.25, "timestamp": 1_700_000_000_000,
+}
+
+
+def test_fractional_calories_become_a_meal():
+    results, meals = batch_meals("user-1", [ITEM, dict(ITEM, calories=449.4, id="client-1")], 60)
+    assert results == [None, None]
+    assert [meal.meal.calories for meal in meals] == [450, 449]
+    assert meals[1].meal.id == "client-1"
+    assert meals[0].meal.userId == "user-1" and meals[0].meal.tzOffset == 60
+    assert meals[0].meal.photoId is None and meals[0].photo_base64 == ITEM["photoBase64"]
+
+
+def test_bad_items_are_reported_alone():
+    items = [dict(ITEM, calories="lots"), ITEM, dict(ITEM, id=""), dict(ITEM, timestamp=10 ** 18)]
+    results, meals = batch_meals("user-1", items, 0)
+    assert [meal.index for meal in meals] == [1]
+    assert [result and result["status"] for result in results] == ["invalid", None, "invalid", "invalid"]
+    assert all(result["index"] == index for index, result in enumerate(results) if result)
@@ -0,0 +1,42 @@
+from canonical import default_canonicalizer
+from pantry import normalize_ingredients, pantry_entries
+
+
+def names(entries):
+    return [name for name, _ in entries]
+
+
+def test_normalize_ingredients():
+    assert normalize_ingredients(["  Tomato ", "tomato", "", "Red   Onion"]) == ["tomato", "red onion"]
+
+
+def test_spellings_of_one_ingredient_are_one_item():
+    entries = pantry_entries(["Tomato ", "tomate", "tomatoes", "3 tomates picados"])
+    assert entries == [("tomato", "tomato")]
+
+
+def test_products_containing_an_ingredient_stay_apart():
+    pairs = [
+        ("garlic powder", "garlic"),
+        ("chicken stock", "chicken"),
+        ("corn starch", "corn"),
+        ("almond milk", "milk"),
+        ("chili flakes", "chili"),
+    ]
+    for product, ingredient in pairs:
+        entries = pantry_entries([product, ingredient])
+        assert names(entries) == [product, ingredient]
+        assert entries[1][1] == ingredient
+        assert entries[0][1] != entries[1][1]
+
+
+def test_unknown_ingredients_key_on_their_text():
+    assert pantry_entries(["Dragon Fruit Jam", "dragon fruit jam"]) == [("dragon fruit jam", "dragon fruit jam")]
+
+
+def test_canonical_key_is_exact_only():
+    canonicalizer = default_canonicalizer()
+    assert canonicalizer.key("Leche") == "milk"
+    assert canonicalizer.lookup("almond milk").id == "milk"
+    assert canonicalizer.key("almond milk") == "almond milk"
+    assert canonicalizer.keys(["milk", "almond milk", "leche"]) == ["milk", "almond milk"]
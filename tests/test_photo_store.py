@@ -0,0 +1,61 @@
+import asyncio
+
+import sync
+from photo_store import migrate_meal_photos
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class Meals:
+    def __init__(self, docs):
+        self.docs = docs
+        self.updates = []
+
+    def find(self, query, projection):
+        return Cursor(self.docs)
+
+    async def update_one(self, query, update):
+        self.updates.append(update)
+
+
+class Changes:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+class Store:
+    async def put_base64(self, data, wait_for_thumbnails=False):
+        return f"photo-{data}"
+
+
+class Database(dict):
+    @property
+    def meals(self):
+        return self["meals"]
+
+
+def test_migrated_meals_are_logged_for_sync():
+    meals = Meals([{"_id": 1, "id": "meal-1", "userId": "user-1", "photoBase64": "abc"}])
+    changes = Changes()
+    db = Database(meals=meals, **{sync.CHANGES_COLLECTION: changes})
+
+    assert asyncio.run(migrate_meal_photos(db, Store())) == 1
+    update = meals.updates[0]
+    assert update["$set"]["photoId"] == "photo-abc" and "updatedAt" in update["$set"]
+    assert [operation._filter for operation in changes.operations] == [{"userId": "user-1", "mealId": "meal-1"}]
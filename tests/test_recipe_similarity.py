@@ -0,0 +1,69 @@
+import asyncio
+
+from recipe_corpus import RECIPES_COLLECTION
+from recipe_similarity import RecipeSimilarityIndex, SimilarityRefresher
+
+CURRY = {
+    "recipeId": "rcp_curry", "language": "es", "name": "Pollo al curry",
+    "ingredients": ["500 g pechuga de pollo", "1 cebolla", "2 cucharadas de curry", "200 ml leche de coco"],
+}
+CORPUS = [
+    CURRY,
+    {"recipeId": "rcp_tortilla", "language": "es", "name": "Tortilla de patatas",
+     "ingredients": ["4 huevos", "3 patatas", "1 cebolla", "aceite de oliva"]},
+    {"recipeId": "rcp_ensalada", "language": "es", "name": "Ensalada de tomate",
+     "ingredients": ["3 tomates", "aceite de oliva", "sal"]},
+    {"recipeId": "rcp_curry", "language": "en", "name": "Chicken curry",
+     "ingredients": ["500 g chicken breast", "1 onion", "2 tbsp curry powder", "200 ml coconut milk"]},
+]
+
+
+def test_search_finds_misspelled_and_shortened_names_in_a_small_corpus():
+    index = RecipeSimilarityIndex(CORPUS)
+    for query in ("pollo al curri", "pollo curry"):
+        results = index.search(query, "es")
+        assert [(result.recipe_id, result.language) for result in results] == [("rcp_curry", "es")]
+
+
+def test_duplicate_of_matches_a_reworded_copy_only():
+    index = RecipeSimilarityIndex(CORPUS)
+    reworded = {
+        "name": "Pollo al Curry",
+        "ingredients": ["1 cebolla picada", "500 g de pechuga de pollo", "200 ml de leche de coco", "2 cucharadas de curry"],
+    }
+    assert index.duplicate_of(reworded, "es") == "rcp_curry"
+    assert index.duplicate_of({"name": "Pollo al ajillo", "ingredients": ["pollo", "ajo"]}, "es") is None
+
+
+class SlowRecipes:
+    """A recipes collection whose find() waits for `release` before yielding its docs"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.release = asyncio.Event()
+
+    def find(self, query, projection):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self.release.wait()
+        for doc in self.docs:
+            yield doc
+
+
+def test_recipes_added_during_a_refresh_survive_it():
+    added = {"id": "rcp_tortilla", "name": "Tortilla de patatas", "ingredients": ["4 huevos", "3 patatas"]}
+
+    async def interleave():
+        recipes = SlowRecipes([CURRY])
+        refresher = SimilarityRefresher({RECIPES_COLLECTION: recipes})
+        refreshing = asyncio.create_task(refresher.refresh())
+        await asyncio.sleep(0)
+        refresher.add([added], "es")
+        recipes.release.set()
+        await refreshing
+        return refresher.index
+
+    index = asyncio.run(interleave())
+    assert len(index) == 2
+    assert [result.recipe_id for result in index.search("tortilla", "es")] == ["rcp_tortilla"]
@@ -0,0 +1,24 @@
+import asyncio
+
+import sync
+from timebuckets import now_ms
+
+
+class Collection:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+def test_upserts_are_logged_as_of_now():
+    changes = Collection()
+    built = now_ms() - 60_000  # e.g. a batch whose photo uploads were slow
+    meals = [{"userId": "user-1", "id": f"meal-{n}", "updatedAt": built} for n in range(2)]
+    before = now_ms()
+    asyncio.run(sync.record_upserts({sync.CHANGES_COLLECTION: changes}, meals))
+
+    stamps = {operation._doc["$set"]["updatedAt"] for operation in changes.operations}
+    assert len(changes.operations) == 2 and len(stamps) == 1
+    assert stamps.pop() >= before